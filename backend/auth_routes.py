@@ -0,0 +1,156 @@
+# Signing up and in, with a password or with Google, and out again. The Google
+# OAuth client secrets are read on first use; each app keeps its own credential
+# manager and ID token cert cache in app.extensions (see create_app() in main.py).
+from flask import Blueprint, current_app, render_template, redirect, url_for, session, request, flash
+import os
+import json
+
+import google_certs
+import metrics
+import passwords
+import server_session
+from models import db, User
+
+bp = Blueprint('auth', __name__)
+
+GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
+
+GOOGLE_CLIENT_SECRETS_FILE = os.getenv('GOOGLE_CLIENT_SECRETS_FILE', 'credentials.json')
+
+GOOGLE_SCOPES = [
+    "https://www.googleapis.com/auth/userinfo.profile", "https://www.googleapis.com/auth/userinfo.email", "openid",
+    'https://www.googleapis.com/auth/calendar',
+]
+
+GOOGLE_REDIRECT_URI = "http://localhost:3000/callback"
+
+def google_credentials():
+    return current_app.extensions['google_credentials']
+
+def password_hasher():
+    return current_app.extensions['password_hasher']
+
+def oauth_flow(state=None):
+    # A Flow per login: it holds the fetched token, so it cannot be shared between requests.
+    # The client secrets are read on first use, not at import, so the app starts without them.
+    from google_auth_oauthlib.flow import Flow
+    return Flow.from_client_config(google_client_config(), scopes=GOOGLE_SCOPES, redirect_uri=GOOGLE_REDIRECT_URI, state=state)
+
+_google_client_config = None
+
+def google_client_config():
+    global _google_client_config
+    if _google_client_config is None:
+        with open(GOOGLE_CLIENT_SECRETS_FILE) as f:
+            _google_client_config = json.load(f)
+    return _google_client_config
+
+@bp.route('/signup', methods=['GET', 'POST'])
+def signup():
+    if request.method == 'POST':
+        email = request.form['email']
+        username = request.form['username']
+        password = request.form['password']
+        existing_user = User.query.filter_by(email=email).first()
+        if existing_user:
+            flash('Account with this email already exists', 'danger')
+            return redirect(url_for('auth.signup'))
+        try:
+            password_hash = password_hasher().hash(password)
+        except passwords.HasherBusy:
+            return "Too many sign-ups at once, please try again in a moment", 503
+        new_user = User(username=username, email=email, password=password_hash)
+        db.session.add(new_user)
+        db.session.commit()
+        flash('Account created successfully', 'success')
+        return redirect(url_for('auth.login'))
+    return render_template('signup.html')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if 'username' in session:
+        return redirect(url_for('groups.base'))
+    
+    if request.method == 'POST':
+        email = request.form['email']
+        password = request.form['password']
+        user = User.query.filter_by(email=email).first()
+        try:
+            matches, new_hash = password_hasher().verify(user and user.password, password)
+        except passwords.HasherBusy:
+            return "Too many sign-ins at once, please try again in a moment", 503
+        if matches:
+            if new_hash:
+                # made with older cost settings, or not hashed at all yet
+                user.password = new_hash
+                db.session.commit()
+            server_session.regenerate(session)
+            session['user_id'] = user.user_id
+            session['username'] = user.username
+            return redirect(url_for('groups.base'))
+        else:
+            flash('Incorrect password', 'danger')
+            return redirect(url_for('auth.login'))
+
+    return render_template('login.html')
+
+@bp.route('/google_login', methods=['GET'])
+def google_login():
+    try:
+        flow = oauth_flow()
+    except FileNotFoundError:
+        current_app.logger.error(f"Google login needs the OAuth client secrets in {GOOGLE_CLIENT_SECRETS_FILE}")
+        flash('Google login is not set up on this server', 'danger')
+        return redirect(url_for('auth.login'))
+    authorization_url, state = flow.authorization_url()
+    current_app.logger.info(f"URL: {authorization_url}")
+    current_app.logger.info(f"Saved state: {state}")
+    session['state'] = state
+    return redirect(authorization_url)
+
+@bp.route("/callback")
+def callback():
+    state = session.get('state')
+    current_app.logger.info(f"Saved state: {state}")
+    if not state:
+        return "State mismatch error.", 400
+    flow = oauth_flow(state)
+    with metrics.google_call('oauth.token'):
+        flow.fetch_token(authorization_response=request.url)
+    credentials = flow.credentials
+    # checked locally against Google's signing certs, which are cached across logins
+    id_info = google_certs.verify_id_token(credentials.id_token, GOOGLE_CLIENT_ID, current_app.extensions['google_id_token_certs'])
+    session["google_id"] = id_info.get("sub")
+    session["email"] = id_info["email"]
+    session["name"] = id_info.get("name") or id_info["email"].split('@')[0]
+    
+    user = User.query.filter_by(email=session["email"]).first()
+    if not user:
+        user = User(username=session["name"], email=session["email"], password=passwords.UNUSABLE)
+        db.session.add(user)
+        db.session.commit()
+    server_session.regenerate(session)
+    session['user_id'] = user.user_id
+    session['username'] = user.username
+    # the tokens go to the credential store only; the session just remembers this was a Google login
+    session['google_calendar'] = True
+    google_credentials().save(user.user_id, credentials)
+    return redirect(url_for("groups.base"))
+
+@bp.route('/logout')
+def logout():
+    # Only this session ends. The stored Google grant stays: calendar jobs queued before
+    # now and the user's other sessions still need it (see CredentialManager.forget()).
+    session.pop('user_id', None)
+    session.pop('username', None)
+    session.pop('google_calendar', None)
+    return redirect(url_for('groups.base'))
+
+@bp.route('/check_session')
+def check_session():
+    if 'user_id' in session:
+        user_id = session['user_id']
+        username = session.get('username', 'Guest')
+        return f"Session is active. User ID: {user_id}, Username: {username}"
+    else:
+        return 'User is not logged in'
@@ -0,0 +1,258 @@
+# Persistent outbox for Google Calendar work.
+# Routes add CalendarJob rows in the same transaction as the data they describe,
+# and a small pool of worker threads drains the table in the background so the
+# request can return as soon as the commit is done.
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import aliased
+
+logger = logging.getLogger(__name__)
+
+EVENTS = 'events'
+CLEANUP = 'cleanup'
+
+PENDING = 'pending'
+RUNNING = 'running'
+FAILED = 'failed'
+
+
+class CalendarJobQueue:
+    def __init__(self, db, job_model, handler, max_attempts=5, backoff_seconds=2.0, poll_interval=5.0, lease_seconds=600):
+        self.db = db
+        self.job_model = job_model
+        # handler(job, payload) performs the Google Calendar calls and raises on failure
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        # a job that has been running longer than this is assumed to belong to a dead worker
+        self.lease_seconds = lease_seconds
+        # when run_once() next looks for such jobs (time.monotonic())
+        self._next_release = 0.0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def enqueue(self, user_id, person_id, kind, prev, new):
+        # prev and new map event kinds to (title, date) tuples, or None when there is no event.
+        # Jobs hold no credentials, the handler looks them up by user_id when the job runs.
+        # Nothing is committed here; the caller commits together with its own changes.
+        Job = self.job_model
+        pending = (
+            Job.query.filter_by(person_id=person_id, kind=kind, status=PENDING)
+            .order_by(Job.job_id.desc())
+            .first()
+        )
+        if pending:
+            # Collapse into the job that is already waiting: keep its original "previous"
+            # event so that one is still cleaned up, and aim for the newest state. Only while
+            # it is still pending: a worker may have claimed it since the SELECT, and then it
+            # runs the old payload and this change needs a job of its own.
+            still_pending = Job.query.filter_by(job_id=pending.job_id, status=PENDING)
+            original_prev = _load_events(json.loads(pending.payload)['prev'])
+            if original_prev == new:
+                if still_pending.delete():
+                    return None
+            elif still_pending.update(self._job_values(original_prev, new)):
+                return pending
+
+        if prev == new:
+            return None
+        job = Job(user_id=user_id, person_id=person_id, kind=kind, **self._job_values(prev, new))
+        self.db.session.add(job)
+        return job
+
+    def enqueue_many(self, user_id, kind, changes):
+        # enqueue() for many people at once, {person_id: (prev, new)}, for the bulk import: one
+        # SELECT of their waiting jobs, then one INSERT, UPDATE and DELETE for all of them.
+        # The waiting jobs are selected FOR UPDATE, so no worker claims one before it is
+        # collapsed into (SQLite has no row locks, but the caller has written to the database
+        # in this transaction, which already keeps the workers from claiming). Returns how
+        # many people got a job. Nothing is committed here.
+        Job = self.job_model
+        waiting = {}
+        for job in (
+            self.db.session.query(Job.job_id, Job.person_id, Job.payload)
+            .filter(Job.person_id.in_(changes), Job.kind == kind, Job.status == PENDING)
+            .order_by(Job.job_id)
+            .with_for_update()
+        ):
+            waiting[job.person_id] = job  # the newest one, like enqueue()
+        new_jobs, collapsed, dropped = [], [], []
+        for person_id, (prev, new) in changes.items():
+            pending = waiting.get(person_id)
+            if pending:
+                original_prev = _load_events(json.loads(pending.payload)['prev'])
+                if original_prev == new:
+                    dropped.append(pending.job_id)
+                else:
+                    collapsed.append(dict(self._job_values(original_prev, new), job_id=pending.job_id))
+            elif prev != new:
+                new_jobs.append(dict(self._job_values(prev, new), user_id=user_id, person_id=person_id, kind=kind))
+        if new_jobs:
+            self.db.session.execute(insert(Job), new_jobs)
+        if collapsed:
+            self.db.session.execute(update(Job), collapsed)
+        if dropped:
+            self.db.session.execute(delete(Job).where(Job.job_id.in_(dropped)))
+        return len(new_jobs) + len(collapsed)
+
+    def _job_values(self, prev, new):
+        return {
+            'action': _action_for(prev, new),
+            'payload': json.dumps({'prev': _dump_events(prev), 'new': _dump_events(new)}),
+            'status': PENDING,
+            'attempts': 0,
+            'last_error': None,
+            'run_after': _now(),
+        }
+
+    def enqueue_cleanup(self, user_id, event_ids):
+        # One job deleting the Google events of people that were deleted together. It is
+        # not about one person, so it runs alongside their jobs. Committed by the caller.
+        job = self.job_model(
+            user_id=user_id, person_id=None, kind=CLEANUP, action='delete', status=PENDING,
+            payload=json.dumps({'event_ids': event_ids}), attempts=0, run_after=_now(),
+        )
+        self.db.session.add(job)
+        return job
+
+    def notify(self):
+        self._wakeup.set()
+
+    def start(self, app, workers=4):
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, args=(app,), name=f'calendar-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %d calendar workers", workers)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self, app):
+        while not self._stopping.is_set():
+            with app.app_context():
+                try:
+                    ran = self.run_once()
+                except Exception:
+                    logger.exception("Calendar worker crashed while claiming a job")
+                    self.db.session.rollback()
+                    ran = False
+                finally:
+                    self.db.session.remove()
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self):
+        # Claims and runs at most one due job, returns whether a job was run. Every half
+        # lease, jobs left running by a dead worker are released first: until then they
+        # hold up every later job for their person.
+        if time.monotonic() >= self._next_release:
+            self._next_release = time.monotonic() + self.lease_seconds / 2
+            self._release_stale_jobs()
+        job = self._claim()
+        if job is None:
+            return False
+        payload = json.loads(job.payload)
+        if job.kind == EVENTS:
+            payload['prev'] = _load_events(payload['prev'])
+            payload['new'] = _load_events(payload['new'])
+        try:
+            self.handler(job, payload)
+        except Exception as e:
+            self.db.session.rollback()
+            self._record_failure(job.job_id, e)
+            return True
+        self.db.session.delete(job)
+        self.db.session.commit()
+        return True
+
+    def _claim(self):
+        Job = self.job_model
+        earlier = aliased(Job)
+        # Jobs for one person run one at a time and in order, later jobs build on earlier
+        # ones (including earlier jobs that are waiting out a retry backoff)
+        busy = self.db.session.query(earlier.job_id).filter(
+            earlier.person_id == Job.person_id,
+            earlier.job_id < Job.job_id,
+            earlier.status.in_([PENDING, RUNNING]),
+        ).exists()
+        candidates = (
+            Job.query.with_entities(Job.job_id)
+            .filter(Job.status == PENDING, Job.run_after <= _now(), ~busy)
+            .order_by(Job.job_id)
+            .limit(10)
+            .all()
+        )
+        for (job_id,) in candidates:
+            # Conditional UPDATE so only one worker (in any process) wins the job
+            claimed = Job.query.filter_by(job_id=job_id, status=PENDING).update(
+                {'status': RUNNING, 'attempts': Job.attempts + 1, 'locked_at': _now()}, synchronize_session=False
+            )
+            self.db.session.commit()
+            if claimed:
+                return self.db.session.get(Job, job_id)
+        return None
+
+    def _release_stale_jobs(self):
+        Job = self.job_model
+        cutoff = _now() - datetime.timedelta(seconds=self.lease_seconds)
+        released = Job.query.filter(Job.status == RUNNING, Job.locked_at < cutoff).update(
+            {'status': PENDING}, synchronize_session=False
+        )
+        self.db.session.commit()
+        if released:
+            logger.info("Released %d stale calendar jobs", released)
+
+    def _record_failure(self, job_id, error):
+        job = self.db.session.get(self.job_model, job_id)
+        if job is None:
+            return
+        job.last_error = str(error)
+        if job.attempts >= self.max_attempts:
+            job.status = FAILED
+            logger.error("Calendar job %s failed permanently: %s", job_id, error)
+        else:
+            delay = self.backoff_seconds * 2 ** (job.attempts - 1)
+            job.run_after = _now() + datetime.timedelta(seconds=delay * random.uniform(1, 1.5))
+            job.status = PENDING
+            logger.warning("Calendar job %s failed (attempt %d), retrying in %.0fs: %s", job_id, job.attempts, delay, error)
+        self.db.session.commit()
+
+
+def _action_for(prev, new):
+    if not any(prev.values()):
+        return 'create'
+    if not any(new.values()):
+        return 'delete'
+    return 'update'
+
+
+def _dump_events(events):
+    return {
+        kind: event and {'title': event[0], 'date': event[1].isoformat()}
+        for kind, event in events.items()
+    }
+
+
+def _load_events(data):
+    return {
+        kind: event and (event['title'], datetime.date.fromisoformat(event['date']))
+        for kind, event in data.items()
+    }
+
+
+def _now():
+    return datetime.datetime.utcnow()
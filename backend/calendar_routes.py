@@ -0,0 +1,255 @@
+# Upcoming birthdays and anniversaries, and keeping Google Calendar in step: the
+# job handler the calendar workers run after a person changes, and the backfill
+# that pushes everyone a user already has.
+from flask import Blueprint, current_app, render_template, redirect, url_for, session, request, Response, stream_with_context
+import os
+import json
+import logging
+import time
+import collections
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import click
+from sqlalchemy.orm import load_only
+
+from calendar_jobs import CLEANUP, CalendarJobQueue
+import page_cache
+import upcoming
+from auth_routes import google_credentials
+from query_budget import max_queries
+from models import db, CalendarBackfill, CalendarJob, Person, PersonCalendarEvent
+
+bp = Blueprint('calendar', __name__, cli_group=None)
+
+def get_google_calendar_service(credentials):
+    import calendar_service
+    return calendar_service.get_service(credentials)
+
+def make_job_queue():
+    # One per app, see create_app() in main.py; the workers are started by wsgi.py
+    return CalendarJobQueue(
+        db, CalendarJob, run_calendar_job,
+        max_attempts=int(os.getenv('CALENDAR_JOB_MAX_ATTEMPTS', 5)),
+        backoff_seconds=float(os.getenv('CALENDAR_JOB_BACKOFF_SECONDS', 2)),
+    )
+
+def job_queue():
+    return current_app.extensions['calendar_queue']
+
+def calendar_event(title, date):
+    # An event only exists in Google Calendar when it has a date
+    return (title, date) if date else None
+
+def person_calendar_events(person):
+    return {
+        'birthday': calendar_event(f"{person.name}'s Birthday", person.birthday),
+        'anniversary': calendar_event(person.anniversary_title, person.anniversary_date),
+    }
+
+def syncs_calendar(user_id):
+    # Changes are synced for users whose Google grant is in the credential store, whichever
+    # session made them: a password login of a user who once signed in with Google too
+    return google_credentials().has(user_id)
+
+def job_credentials(job, payload):
+    # From the credential store; jobs queued before payloads stopped carrying credentials
+    # still bring their own
+    credentials = google_credentials().get(job.user_id, payload.get('credentials'))
+    if credentials is None:
+        raise RuntimeError(f"No Google credentials stored for user {job.user_id}")
+    return credentials
+
+def run_calendar_job(job, payload):
+    if job.kind == CLEANUP:
+        return run_cleanup_job(job, payload)
+    person = db.session.get(Person, job.person_id)
+    if person is None:
+        logging.info(f"Skipping calendar job {job.job_id}, person {job.person_id} no longer exists")
+        return
+    from calendar_sync import reconcile_person_events
+    service = get_google_calendar_service(job_credentials(job, payload))
+    rows = {row.kind: row for row in person.calendar_events}
+    stored = {kind: {'id': row.google_event_id, 'etag': row.etag} for kind, row in rows.items()}
+    # patches and deletes by stored ID, all in one batch request
+    result = reconcile_person_events(service, person.person_id, payload['new'], stored, previous=payload['prev'])
+
+    # Record what exists now even if part of the batch failed, so a retry doesn't create duplicates
+    for kind, row in rows.items():
+        if kind not in result.events:
+            db.session.delete(row)
+    for kind, event in result.events.items():
+        row = rows.get(kind) or PersonCalendarEvent(person_id=person.person_id, kind=kind)
+        row.google_event_id = event['id']
+        row.etag = event['etag']
+        db.session.add(row)
+    db.session.commit()
+
+    if result.error:
+        raise result.error
+    logging.info(f"Synced calendar for person {job.person_id}: {dict(result.counts)}")
+
+def run_cleanup_job(job, payload):
+    from calendar_sync import delete_events
+    failed, error = delete_events(get_google_calendar_service(job_credentials(job, payload)), payload['event_ids'])
+    if error:
+        # only the events that are left are tried again
+        job.payload = json.dumps(dict(payload, event_ids=failed))
+        db.session.commit()
+        raise error
+    logging.info(f"Deleted {len(payload['event_ids'])} calendar events of deleted people for user {job.user_id}")
+
+@bp.route('/calendar')
+@max_queries(1)
+def calendar():
+    # Upcoming birthdays and anniversaries, from the database rather than Google Calendar
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    days = max(0, min(request.args.get('days', 30, type=int), upcoming.MAX_DAYS))
+    today = datetime.date.today()
+    user_id = session['user_id']
+    events = upcoming.cached_upcoming_events(db.session, Person, user_id, today, days, page_cache.version(user_id))
+    return render_template('calendar.html', events=events, days=days, today=today)
+
+def _backfill_chunk(credential_manager, user_id, items):
+    # Runs on a backfill pool thread: one batch request for the chunk, no database access
+    from calendar_sync import insert_events
+    credentials = credential_manager.get(user_id)
+    if credentials is None:
+        return [(item, None, RuntimeError(f"No Google credentials stored for user {user_id}")) for item in items]
+    service = get_google_calendar_service(credentials)
+    try:
+        return insert_events(service, items)
+    except Exception as e:
+        # the whole batch request failed
+        return [(item, None, e) for item in items]
+
+def backfill_calendar(user_id, workers=8, chunk_size=25, restart=False):
+    # Pushes every person with a birthday or anniversary to Google Calendar. People are read
+    # in person_id order, a chunk at a time, and each chunk becomes one batch request; up to
+    # `workers` batches are in flight. Results are saved in order and the checkpoint only moves
+    # past fully synced chunks, so an interrupted run picks up where it stopped, and people
+    # whose events are already recorded are skipped. Yields a progress dict after every chunk.
+    checkpoint = db.session.get(CalendarBackfill, user_id)
+    if checkpoint is None:
+        checkpoint = CalendarBackfill(user_id=user_id, last_person_id=0, people_synced=0, events_created=0)
+        db.session.add(checkpoint)
+    elif restart or checkpoint.status == 'done':
+        checkpoint.last_person_id = checkpoint.people_synced = checkpoint.events_created = 0
+    checkpoint.status = 'running'
+    checkpoint.last_error = None
+    db.session.commit()
+
+    people = Person.query.filter(
+        Person.user_id == user_id,
+        db.or_(Person.birthday.isnot(None), Person.anniversary_date.isnot(None)),
+    )
+    remaining = people.filter(Person.person_id > checkpoint.last_person_id).count()
+    started = time.perf_counter()
+    processed = created = 0
+    in_flight = collections.deque()
+    # the pool threads have no app context
+    manager = google_credentials()
+
+    def report():
+        elapsed = time.perf_counter() - started
+        return {
+            'processed': processed,
+            'remaining': remaining - processed,
+            'events_created': created,
+            'last_person_id': checkpoint.last_person_id,
+            'elapsed': round(elapsed, 3),
+            'people_per_second': round(processed / elapsed, 1) if elapsed else None,
+            'status': checkpoint.status,
+            'error': checkpoint.last_error,
+        }
+
+    def save_oldest():
+        nonlocal processed, created
+        last_person_id, people_count, future = in_flight.popleft()
+        failures = []
+        for (person_id, kind, _), response, exception in future.result():
+            if exception is not None:
+                failures.append(exception)
+                continue
+            # recorded even after a failure, so the next run skips these
+            db.session.add(PersonCalendarEvent(person_id=person_id, kind=kind, google_event_id=response['id'], etag=response.get('etag')))
+            created += 1
+            checkpoint.events_created += 1
+        if failures and checkpoint.status == 'running':
+            checkpoint.status = 'failed'
+            checkpoint.last_error = str(failures[0])
+        if checkpoint.status == 'running':
+            processed += people_count
+            checkpoint.people_synced += people_count
+            checkpoint.last_person_id = last_person_id
+        db.session.commit()
+        return report()
+
+    after = checkpoint.last_person_id
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='calendar-backfill') as pool:
+        while checkpoint.status == 'running':
+            chunk = (
+                people.options(load_only(Person.person_id, Person.name, Person.birthday, Person.anniversary_title, Person.anniversary_date))
+                .filter(Person.person_id > after)
+                .order_by(Person.person_id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not chunk:
+                break
+            after = chunk[-1].person_id
+            recorded = set(
+                db.session.query(PersonCalendarEvent.person_id, PersonCalendarEvent.kind)
+                .filter(PersonCalendarEvent.person_id.in_([person.person_id for person in chunk]))
+                .all()
+            )
+            items = [
+                (person.person_id, kind, event)
+                for person in chunk
+                for kind, event in person_calendar_events(person).items()
+                if event and (person.person_id, kind) not in recorded
+            ]
+            in_flight.append((after, len(chunk), pool.submit(_backfill_chunk, manager, user_id, items)))
+            # bounded: never more than `workers` chunks waiting on Google
+            if len(in_flight) >= workers:
+                yield save_oldest()
+        while in_flight:
+            yield save_oldest()
+
+    if checkpoint.status == 'running':
+        checkpoint.status = 'done'
+        db.session.commit()
+        yield report()
+
+@bp.route('/calendar/backfill', methods=['POST'])
+def calendar_backfill():
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    if not syncs_calendar(session['user_id']):
+        return "Login with Google to sync with Google Calendar.", 400
+
+    progress = backfill_calendar(
+        session['user_id'],
+        workers=int(os.getenv('CALENDAR_BACKFILL_WORKERS', 8)),
+        restart=request.args.get('restart') == '1',
+    )
+    # one JSON line per finished chunk, so clients can show progress
+    return Response(stream_with_context(json.dumps(line) + '\n' for line in progress), mimetype='application/x-ndjson')
+
+@bp.cli.command('calendar-backfill')
+@click.option('--user-id', type=int, required=True)
+@click.option('--credentials-file', required=True, help='authorized user JSON, like the token.json written by google_cal.py')
+@click.option('--workers', type=int, default=8, show_default=True)
+@click.option('--chunk-size', type=int, default=25, show_default=True, help='people per batch request (2 events each)')
+@click.option('--restart', is_flag=True, help='ignore the stored checkpoint and start over')
+def calendar_backfill_command(user_id, credentials_file, workers, chunk_size, restart):
+    """Push every birthday and anniversary of a user to Google Calendar."""
+    from google.oauth2.credentials import Credentials
+    google_credentials().save(user_id, Credentials.from_authorized_user_file(credentials_file))
+    for progress in backfill_calendar(user_id, workers, chunk_size, restart):
+        click.echo(
+            f"{progress['processed']} people synced, {progress['remaining']} left, "
+            f"{progress['events_created']} events created, {progress.get('people_per_second')} people/s"
+        )
+        if progress['error']:
+            click.echo(f"Stopped: {progress['error']} (run again to resume)", err=True)
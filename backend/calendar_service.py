@@ -0,0 +1,96 @@
+# Reusable Google Calendar clients.
+# build() parses the ~300KB calendar discovery document every time it is called,
+# so the document is parsed once per process and each thread keeps a small LRU of
+# ready-to-use service objects, one per set of credentials, each with its own
+# keep-alive HTTP connection and a prebuilt events() resource.
+import collections
+import hashlib
+import json
+import os
+import threading
+import urllib.parse
+
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import BatchHttpRequest
+from googleapiclient.discovery_cache import get_static_doc
+
+CACHE_SIZE = int(os.getenv('CALENDAR_SERVICE_CACHE_SIZE', 32))
+HTTP_TIMEOUT = float(os.getenv('CALENDAR_HTTP_TIMEOUT', 30))
+
+_discovery_document = None
+_discovery_lock = threading.Lock()
+# httplib2 connections are not thread-safe, so the service cache is per thread
+_local = threading.local()
+
+
+def load_discovery_document():
+    # Reads the discovery document shipped with google-api-python-client; never fetched
+    global _discovery_document
+    if _discovery_document is None:
+        with _discovery_lock:
+            if _discovery_document is None:
+                _discovery_document = json.loads(get_static_doc('calendar', 'v3'))
+    return _discovery_document
+
+
+def get_service(credentials):
+    services = getattr(_local, 'services', None)
+    if services is None:
+        services = _local.services = collections.OrderedDict()
+
+    key = credentials_key(credentials)
+    cached = services.get(key)
+    if cached is not None:
+        token, service = cached
+        if token == credentials.token:
+            services.move_to_end(key)
+            return service
+        # The token was refreshed since this client was built, drop the stale one
+        del services[key]
+        service.close()
+
+    service = _build_service(credentials)
+    services[key] = (credentials.token, service)
+    if len(services) > CACHE_SIZE:
+        _, (_, evicted) = services.popitem(last=False)
+        evicted.close()
+    return service
+
+
+def new_batch_request(service, callback=None):
+    api_endpoint = os.getenv('GOOGLE_CALENDAR_API_ENDPOINT')
+    if api_endpoint:
+        # The batch URI comes from the discovery document and ignores api_endpoint
+        parts = urllib.parse.urlsplit(api_endpoint)
+        return BatchHttpRequest(callback=callback, batch_uri=f'{parts.scheme}://{parts.netloc}/batch/calendar/v3')
+    return service.new_batch_http_request(callback=callback)
+
+
+def clear_cache():
+    services = getattr(_local, 'services', None)
+    while services:
+        _, (_, service) = services.popitem()
+        service.close()
+
+
+def credentials_key(credentials):
+    # The refresh token outlives access tokens, so it identifies the user's grant
+    identity = credentials.refresh_token or credentials.token or ''
+    return hashlib.sha256(f'{credentials.client_id}:{identity}'.encode()).hexdigest()
+
+
+def _build_service(credentials):
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    client_options = None
+    # GOOGLE_CALENDAR_API_ENDPOINT points the client at fake_calendar.py for offline testing
+    api_endpoint = os.getenv('GOOGLE_CALENDAR_API_ENDPOINT')
+    if api_endpoint:
+        client_options = {'api_endpoint': api_endpoint}
+    service = build_from_document(load_discovery_document(), http=http, client_options=client_options)
+    # service.events() builds a new Resource (parsing every method's schema) on each call,
+    # ~10ms a time, so build it once and hand the same one back
+    events = service.events()
+    service.events = lambda: events
+    return service
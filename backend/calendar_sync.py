@@ -0,0 +1,189 @@
+# Keeps a person's birthday and anniversary events in Google Calendar in line with the database.
+# The Google event IDs are stored in PersonCalendarEvents, so changes are a patch or
+# delete by ID and all of them go out in a single batch request. Events we create are
+# also tagged with private extended properties, which lets events created before IDs
+# were stored be found again with one list call.
+import collections
+import datetime
+import logging
+
+from googleapiclient.errors import HttpError
+
+import calendar_service
+import metrics
+
+PERSON_ID_PROPERTY = 'characterSheetsPersonId'
+KIND_PROPERTY = 'characterSheetsKind'
+# Google rejects batches with more than 50 calls
+MAX_BATCH_SIZE = 50
+
+logger = logging.getLogger(__name__)
+
+# events maps kind to {'id': ..., 'etag': ...} for the events that now exist, error is the
+# first failure (if any) after every request that did succeed has been accounted for
+SyncResult = collections.namedtuple('SyncResult', ['events', 'counts', 'error'])
+
+
+def event_body(person_id, kind, title, date):
+    return {
+        "summary": title,
+        "description": "Anniversary reminder from Character Sheets!",
+        "start": {
+            "date": date.isoformat(),
+            "timeZone": "America/Los_Angeles",
+        },
+        "end": {
+            "date": date.isoformat(),
+            "timeZone": "America/Los_Angeles",
+        },
+        "recurrence": ["RRULE:FREQ=YEARLY"],
+        # reminders 1 week before and on the day of the event
+        "reminders": {
+            "useDefault": False,
+            "overrides": [
+            {"method": "email", "minutes": 7 * 24 * 60},
+            {"method": "email", "minutes": 0},
+            ],
+        },
+        "extendedProperties": {
+            "private": {PERSON_ID_PROPERTY: str(person_id), KIND_PROPERTY: kind},
+        },
+    }
+
+
+def reconcile_person_events(service, person_id, desired, stored, previous=None):
+    # desired maps kind ('birthday'/'anniversary') to a (title, date) tuple, or None
+    # when the person should have no event of that kind. stored maps kind to the
+    # {'id': ..., 'etag': ...} we recorded for its Google event. previous is the state before the edit: unchanged
+    # kinds are skipped, and it is used to find events whose ID was never recorded.
+    previous = previous or {}
+    events = service.events()
+    result = dict(stored)
+
+    unrecorded = [kind for kind in desired if kind not in stored and previous.get(kind)]
+    untracked = find_person_events(service, person_id, unrecorded, previous) if unrecorded else {}
+
+    requests = []
+    for kind, target in desired.items():
+        event_id = stored[kind]['id'] if kind in stored else None
+        if target is not None and event_id and previous.get(kind) == target:
+            continue
+        extra = untracked.get(kind, [])
+        if target is not None:
+            body = event_body(person_id, kind, *target)
+            if event_id or extra:
+                event_id = event_id or extra.pop(0)['id']
+                requests.append((kind, 'patched', body, events.patch(calendarId='primary', eventId=event_id, body=body)))
+            else:
+                requests.append((kind, 'inserted', body, events.insert(calendarId='primary', body=body)))
+        elif event_id:
+            requests.append((kind, 'deleted', None, events.delete(calendarId='primary', eventId=event_id)))
+        for event in extra:
+            logger.info(f"Deleting event: {event.get('summary')} (ID: {event.get('id')})")
+            requests.append((None, 'deleted', None, events.delete(calendarId='primary', eventId=event['id'])))
+
+    counts = collections.Counter()
+    error = None
+    retry = []
+    for (kind, outcome, body, _), (response, exception) in zip(requests, execute_batched(service, [r[-1] for r in requests])):
+        if exception is not None and _already_deleted(exception):
+            if outcome == 'patched':
+                # Deleted by hand in Google Calendar, put it back
+                retry.append((kind, 'inserted', body, events.insert(calendarId='primary', body=body)))
+                continue
+            if outcome == 'deleted':
+                exception = None
+        if exception is not None:
+            error = error or exception
+            continue
+        counts[outcome] += 1
+        if kind is not None:
+            result[kind] = None if outcome == 'deleted' else {'id': response['id'], 'etag': response.get('etag')}
+
+    for (kind, outcome, _, _), (response, exception) in zip(retry, execute_batched(service, [r[-1] for r in retry])):
+        if exception is not None:
+            error = error or exception
+            continue
+        counts[outcome] += 1
+        result[kind] = {'id': response['id'], 'etag': response.get('etag')}
+
+    return SyncResult({kind: event for kind, event in result.items() if event}, counts, error)
+
+
+def insert_events(service, items):
+    # items are (person_id, kind, (title, date)) tuples, returns (item, response, exception) for each
+    events = service.events()
+    requests = [events.insert(calendarId='primary', body=event_body(person_id, kind, *event)) for person_id, kind, event in items]
+    return [(item, response, exception) for item, (response, exception) in zip(items, execute_batched(service, requests))]
+
+
+def delete_events(service, event_ids):
+    # Deletes events by ID, 50 to a batch request; returns the IDs that could not be
+    # deleted and the first error. Events that are already gone count as deleted.
+    events = service.events()
+    requests = [events.delete(calendarId='primary', eventId=event_id) for event_id in event_ids]
+    failed, error = [], None
+    for event_id, (_, exception) in zip(event_ids, execute_batched(service, requests)):
+        if exception is not None and not _already_deleted(exception):
+            failed.append(event_id)
+            error = error or exception
+    return failed, error
+
+
+def find_person_events(service, person_id, kinds, previous):
+    # For events whose ID was never recorded: one list call for tagged events, then the
+    # old title search for kinds that were created before events were tagged
+    with metrics.google_call('calendar.events.list'):
+        existing = service.events().list(
+            calendarId='primary',
+            privateExtendedProperty=f'{PERSON_ID_PROPERTY}={person_id}',
+            maxResults=250,
+        ).execute().get('items', [])
+    found = collections.defaultdict(list)
+    for event in existing:
+        kind = event['extendedProperties']['private'].get(KIND_PROPERTY)
+        if kind in kinds:
+            found[kind].append(event)
+    for kind in kinds:
+        if not found[kind]:
+            found[kind] = find_untagged_events(service, *previous[kind])
+    return found
+
+
+def find_untagged_events(service, title, date):
+    # The old title search, for events created before events were tagged with the person
+    start_time = datetime.datetime.combine(date, datetime.time.min).isoformat() + 'Z'
+    end_time = datetime.datetime.combine(date, datetime.time.max).isoformat() + 'Z'
+    with metrics.google_call('calendar.events.list'):
+        items = service.events().list(
+            calendarId='primary',
+            timeMin=start_time,
+            timeMax=end_time,
+            q=title,
+            singleEvents=True,
+            orderBy='startTime'
+        ).execute().get('items', [])
+    # singleEvents expands recurring events into instances, the recurring event itself is what we change
+    return [dict(event, id=event.get('recurringEventId') or event['id']) for event in items if event.get('summary') == title]
+
+
+def execute_batched(service, requests):
+    # Returns a (response, exception) pair for every request, in order
+    results = [(None, None)] * len(requests)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+        if exception is not None:
+            metrics.google_error('calendar.batch', exception)
+
+    for start in range(0, len(requests), MAX_BATCH_SIZE):
+        batch = calendar_service.new_batch_request(service, callback)
+        for i in range(start, min(start + MAX_BATCH_SIZE, len(requests))):
+            batch.add(requests[i], request_id=str(i))
+        with metrics.google_call('calendar.batch'):
+            batch.execute()
+    return results
+
+
+def _already_deleted(error):
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
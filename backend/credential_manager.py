@@ -0,0 +1,288 @@
+# Google OAuth credentials per user, refreshed ahead of expiry.
+# Each process keeps one Credentials object per user and all processes on the host
+# share a small SQLite file with the latest tokens. A background thread refreshes
+# the tokens of recently active users a few minutes before they expire, so calendar
+# calls never wait on the token endpoint. Refreshes are single-flight: one lock
+# per user within a process, and a lease row in the store between processes.
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+import server_config
+
+logger = logging.getLogger(__name__)
+
+# the fields of a google.oauth2 Credentials that are stored, plus expiry
+FIELDS = ('token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes')
+
+
+class CredentialManager:
+    def __init__(self, path, refresh_margin=300, active_seconds=3600, poll_interval=30, lease_seconds=30):
+        self.path = path
+        # refresh this many seconds before a token expires
+        self.refresh_margin = refresh_margin
+        # only users seen this recently are kept fresh (and kept in memory)
+        self.active_seconds = active_seconds
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._credentials = {}
+        self._last_used = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._connections = server_config.SQLiteConnections(path)
+        self._http = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        # the refresh tokens and client secret are stored as they are
+        server_config.private_file(path)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS credentials (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, '
+                'expiry REAL, refreshing_until REAL)'
+            )
+
+    def save(self, user_id, credentials):
+        # After a Google login, or to seed the store from a credentials dict
+        if isinstance(credentials, dict):
+            credentials = _from_info(credentials)
+        with self._lock_for(user_id):
+            self._store(user_id, credentials)
+            self._credentials[user_id] = credentials
+        return credentials
+
+    def get(self, user_id, fallback=None):
+        # Credentials for user_id, or built from the fallback dict (the payload of a job
+        # queued before payloads stopped carrying credentials) when the store has none;
+        # None when there are neither
+        self._last_used[user_id] = time.time()
+        credentials = self._credentials.get(user_id)
+        if credentials is None:
+            credentials = self._load(user_id)
+            if credentials is None:
+                if fallback is None:
+                    return None
+                credentials = _from_info(fallback)
+                self._store(user_id, credentials)
+            self._credentials[user_id] = credentials
+
+        remaining = _seconds_left(credentials)
+        if remaining is None or not credentials.refresh_token:
+            # nothing to go on (or nothing to refresh with); the HTTP layer refreshes on a 401
+            return credentials
+        if remaining <= 0:
+            return self._refresh(user_id, credentials)
+        if remaining <= self.refresh_margin:
+            self._wakeup.set()
+        return credentials
+
+    def has(self, user_id):
+        # Whether the user granted calendar access, without loading or refreshing anything
+        if user_id in self._credentials:
+            return True
+        return self._connect().execute('SELECT 1 FROM credentials WHERE user_id = ?', (user_id,)).fetchone() is not None
+
+    def forget(self, user_id):
+        # Drops the user's grant; for when it is no longer valid, not on logout, since
+        # queued calendar jobs and the user's other sessions still use it
+        with self._lock_for(user_id):
+            self._delete(user_id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='credential-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def refresh_due(self):
+        # Refreshes every active user's token that is inside the margin, returns how many
+        now = time.time()
+        refreshed = 0
+        for user_id, last_used in list(self._last_used.items()):
+            if now - last_used > self.active_seconds:
+                self._credentials.pop(user_id, None)
+                self._last_used.pop(user_id, None)
+                continue
+            credentials = self._credentials.get(user_id)
+            remaining = credentials and _seconds_left(credentials)
+            if remaining is None or remaining > self.refresh_margin or not credentials.refresh_token:
+                continue
+            try:
+                refreshed += self._refresh(user_id, credentials) is not None
+            except Exception:
+                logger.exception("Could not refresh Google credentials of user %s", user_id)
+        return refreshed
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self.refresh_due()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _refresh(self, user_id, stale):
+        # Single flight: whoever gets here first refreshes, everyone else waits for the
+        # result, in this process (the lock) or another one (the lease). None when the
+        # grant was forgotten in the meantime, which a refresh must not bring back.
+        with self._lock_for(user_id):
+            current = self._credentials.get(user_id)
+            if current is not None and current is not stale and _fresh(current, self.refresh_margin):
+                return current
+            deadline = time.time() + self.lease_seconds
+            # the refreshing_until of the lease this call holds, if it got one
+            lease = None
+            try:
+                while True:
+                    # read again once the lease is ours: the last holder may have just stored new tokens
+                    loaded = self._load(user_id)
+                    if loaded is None:
+                        self._credentials.pop(user_id, None)
+                        return None
+                    if _fresh(loaded, self.refresh_margin):
+                        # another process already did it
+                        self._credentials[user_id] = loaded
+                        return loaded
+                    if lease is not None or time.time() > deadline:
+                        # past the deadline the holder is stuck; refresh without the lease,
+                        # and leave it alone
+                        break
+                    lease = self._claim(user_id)
+                    if lease is None:
+                        time.sleep(0.1)
+
+                import google.auth.exceptions
+                import google.auth.transport.requests
+                credentials = _from_info(_to_info(loaded))
+                if self._http is None:
+                    import requests
+                    self._http = requests.Session()
+                try:
+                    with metrics.google_call('oauth.refresh'):
+                        credentials.refresh(google.auth.transport.requests.Request(session=self._http))
+                except google.auth.exceptions.RefreshError as e:
+                    if _revoked(e):
+                        # the user took the access back; there is nothing left to refresh with
+                        logger.warning("Google access of user %s was revoked, forgetting it", user_id)
+                        self._delete(user_id)
+                    raise
+                # stored before the lease goes, or another process would refresh the old tokens again
+                if not self._update(user_id, credentials):
+                    # forgotten while the refresh was under way
+                    self._credentials.pop(user_id, None)
+                    return None
+            finally:
+                if lease is not None:
+                    self._release(user_id, lease)
+            # a new object rather than refreshing the shared one in place, so threads
+            # using the old token are not handed a half-updated one
+            self._credentials[user_id] = credentials
+            logger.info("Refreshed Google credentials of user %s", user_id)
+            return credentials
+
+    def _lock_for(self, user_id):
+        with self._locks_lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def _connect(self):
+        return self._connections.get()
+
+    def _delete(self, user_id):
+        self._credentials.pop(user_id, None)
+        self._last_used.pop(user_id, None)
+        with self._connect() as connection:
+            connection.execute('DELETE FROM credentials WHERE user_id = ?', (user_id,))
+
+    def _load(self, user_id):
+        row = self._connect().execute('SELECT data FROM credentials WHERE user_id = ?', (user_id,)).fetchone()
+        return row and _from_info(json.loads(row[0]))
+
+    def _store(self, user_id, credentials):
+        expiry = credentials.expiry and credentials.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO credentials (user_id, data, expiry) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry',
+                (user_id, json.dumps(_to_info(credentials)), expiry),
+            )
+
+    def _update(self, user_id, credentials):
+        # _store() for a refresh: only while the grant is still there, returns whether it was
+        expiry = credentials.expiry and credentials.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'UPDATE credentials SET data = ?, expiry = ? WHERE user_id = ?',
+                (json.dumps(_to_info(credentials)), expiry, user_id),
+            )
+            return cursor.rowcount == 1
+
+    def _claim(self, user_id):
+        # The lease's refreshing_until, or None when another refresh holds it
+        now = time.time()
+        until = now + self.lease_seconds
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'UPDATE credentials SET refreshing_until = ? WHERE user_id = ? '
+                'AND (refreshing_until IS NULL OR refreshing_until < ?)',
+                (until, user_id, now),
+            )
+            return until if cursor.rowcount == 1 else None
+
+    def _release(self, user_id, until):
+        # only the lease claimed with until: once it expired, someone else may hold a new one
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE credentials SET refreshing_until = NULL WHERE user_id = ? AND refreshing_until = ?', (user_id, until),
+            )
+
+
+def _seconds_left(credentials):
+    # google-auth keeps expiry as a naive UTC datetime
+    if credentials.expiry is None:
+        return None
+    return (credentials.expiry - datetime.datetime.utcnow()).total_seconds()
+
+
+def _fresh(credentials, margin):
+    remaining = _seconds_left(credentials)
+    return remaining is None or remaining > margin
+
+
+def _revoked(error):
+    # the token endpoint answers invalid_grant once the refresh token is revoked or expired
+    return bool(error.args) and str(error.args[0]).startswith('invalid_grant')
+
+
+def _to_info(credentials):
+    info = {field: getattr(credentials, field) for field in FIELDS}
+    info['scopes'] = list(info['scopes'] or [])
+    info['expiry'] = credentials.expiry and credentials.expiry.isoformat()
+    return info
+
+
+def _from_info(info):
+    # google.oauth2 is imported on first use, see main.py
+    from google.oauth2.credentials import Credentials
+    info = dict(info)
+    expiry = info.pop('expiry', None)
+    return Credentials(
+        **{field: info.get(field) for field in FIELDS},
+        expiry=expiry and datetime.datetime.fromisoformat(expiry),
+    )
+
+
+def from_env(app):
+    path = server_config.setting(app, 'CREDENTIALS_STORE_PATH') or os.path.join(app.instance_path, 'credentials.sqlite3')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return CredentialManager(
+        path,
+        refresh_margin=int(server_config.setting(app, 'CREDENTIALS_REFRESH_MARGIN', 300)),
+        active_seconds=int(server_config.setting(app, 'CREDENTIALS_ACTIVE_SECONDS', 3600)),
+    )
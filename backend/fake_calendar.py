@@ -0,0 +1,238 @@
+# Minimal in-memory stand-in for the Google Calendar v3 events API.
+# Lets the calendar job queue be exercised and load-tested without network access:
+#
+#   python fake_calendar.py --port 8085 --latency 0.2 --error-rate 0.1
+#   GOOGLE_CALENDAR_API_ENDPOINT=http://127.0.0.1:8085/calendar/v3/ python main.py
+#
+# Only the parts of the API that Character Sheets uses are implemented, plus the
+# /batch endpoint (multipart/mixed, up to 50 calls per request) and an OAuth /token
+# endpoint that hands out an access token for any refresh token.
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EVENTS_PATH = re.compile(r'^/calendar/v3/calendars/(?P<calendar_id>[^/]+)/events(?:/(?P<event_id>[^/]+))?$')
+BATCH_PATH = '/batch/calendar/v3'
+TOKEN_PATH = '/token'
+MAX_BATCH_SIZE = 50
+
+
+class FakeCalendar:
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.events = {}
+        self.requests = 0
+        self.token_refreshes = 0
+        # fail_when(method, path, body) may return an HTTP status to answer one call with,
+        # in a batch too, so tests can fail a single call
+        self.fail_when = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def insert(self, calendar_id, body):
+        with self._lock:
+            event_id = f'fake{next(self._ids)}'
+            event = dict(body, id=event_id, etag=f'"{time.time_ns()}"', status='confirmed')
+            self.events[(calendar_id, event_id)] = event
+            return event
+
+    def get(self, calendar_id, event_id):
+        with self._lock:
+            return self.events.get((calendar_id, event_id))
+
+    def update(self, calendar_id, event_id, body, replace=False):
+        with self._lock:
+            event = self.events.get((calendar_id, event_id))
+            if event is None:
+                return None
+            event = dict(body) if replace else dict(event, **body)
+            event.update(id=event_id, etag=f'"{time.time_ns()}"', status='confirmed')
+            self.events[(calendar_id, event_id)] = event
+            return event
+
+    def delete(self, calendar_id, event_id):
+        with self._lock:
+            return self.events.pop((calendar_id, event_id), None) is not None
+
+    def refresh_token(self):
+        with self._lock:
+            self.token_refreshes += 1
+            return {'access_token': f'fake-token-{self.token_refreshes}', 'expires_in': 3600, 'token_type': 'Bearer'}
+
+    def list(self, calendar_id, params):
+        query = params.get('q', '').lower()
+        private_property = params.get('privateExtendedProperty')
+        if private_property:
+            private_property = tuple(private_property.split('=', 1))
+        time_min = params.get('timeMin', '')[:10]
+        time_max = params.get('timeMax', '')[:10]
+        with self._lock:
+            events = [event for (cal, _), event in self.events.items() if cal == calendar_id]
+        items = []
+        for event in events:
+            start = event.get('start', {}).get('date') or event.get('start', {}).get('dateTime', '')[:10]
+            if query and query not in (event.get('summary') or '').lower():
+                continue
+            if private_property and event.get('extendedProperties', {}).get('private', {}).get(private_property[0]) != private_property[1]:
+                continue
+            if time_min and start < time_min:
+                continue
+            if time_max and start > time_max:
+                continue
+            items.append(event)
+        max_results = int(params.get('maxResults', 250))
+        return {'kind': 'calendar#events', 'items': items[:max_results]}
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real API, so connection reuse shows up in measurements
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    calendar = None
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        calendar = self.calendar
+        calendar.requests += 1
+        if calendar.latency:
+            time.sleep(calendar.latency)
+        if calendar.error_rate and random.random() < calendar.error_rate:
+            return self._send(*_error(503, 'Injected failure'))
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if method == 'POST' and urllib.parse.urlsplit(self.path).path == BATCH_PATH:
+            return self._batch(body)
+        if method == 'POST' and urllib.parse.urlsplit(self.path).path == TOKEN_PATH:
+            return self._send(200, calendar.refresh_token())
+        self._send(*self._route(method, self.path, body))
+
+    def _route(self, method, path, body):
+        calendar = self.calendar
+        status = calendar.fail_when and calendar.fail_when(method, path, body)
+        if status:
+            return _error(status, 'Injected failure')
+        url = urllib.parse.urlsplit(path)
+        match = EVENTS_PATH.match(url.path)
+        if not match:
+            return _error(404, 'Not Found')
+        calendar_id = urllib.parse.unquote(match['calendar_id'])
+        event_id = match['event_id'] and urllib.parse.unquote(match['event_id'])
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        if event_id is None and method == 'GET':
+            return 200, calendar.list(calendar_id, params)
+        if event_id is None and method == 'POST':
+            return 200, calendar.insert(calendar_id, json.loads(body or b'{}'))
+        if event_id is not None and method == 'GET':
+            return _event_response(calendar.get(calendar_id, event_id))
+        if event_id is not None and method in ('PUT', 'PATCH'):
+            return _event_response(calendar.update(calendar_id, event_id, json.loads(body or b'{}'), replace=method == 'PUT'))
+        if event_id is not None and method == 'DELETE':
+            if calendar.delete(calendar_id, event_id):
+                return 204, None
+            return _error(410, 'Resource has been deleted')
+        return _error(405, 'Method Not Allowed')
+
+    def _batch(self, body):
+        # multipart/mixed in, multipart/mixed out, one application/http part per call
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+        parts = list(message.iter_parts())
+        if len(parts) > MAX_BATCH_SIZE:
+            return self._send(*_error(400, f'Too many requests in batch, the limit is {MAX_BATCH_SIZE}'))
+
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for part in parts:
+            payload = part.get_payload(decode=True).decode()
+            request_line, rest = payload.split('\n', 1)
+            method, path, _ = request_line.strip().split(' ', 2)
+            _, _, inner_body = rest.replace('\r\n', '\n').partition('\n\n')
+            status, response = self._route(method, path, inner_body.encode())
+            content_id = part['Content-ID'].strip('<>')
+            data = '' if response is None else json.dumps(response)
+            chunks.append(
+                f'--{boundary}\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {"OK" if status < 300 else "Error"}\r\n'
+                'Content-Type: application/json; charset=UTF-8\r\n'
+                f'Content-Length: {len(data)}\r\n\r\n'
+                f'{data}\r\n'
+            )
+        chunks.append(f'--{boundary}--\r\n')
+        self._send_raw(200, ''.join(chunks).encode(), f'multipart/mixed; boundary={boundary}')
+
+    def _send(self, status, body):
+        data = b'' if body is None else json.dumps(body).encode()
+        self._send_raw(status, data, 'application/json; charset=UTF-8')
+
+    def _send_raw(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def _error(status, message):
+    return status, {'error': {'code': status, 'message': message}}
+
+
+def _event_response(event):
+    if event is None:
+        return _error(404, 'Not Found')
+    return 200, event
+
+
+def make_server(host='127.0.0.1', port=8085, latency=0.0, error_rate=0.0):
+    handler = type('Handler', (FakeCalendarHandler,), {'calendar': FakeCalendar(latency, error_rate)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a fake Google Calendar API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering each request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = make_server(args.host, args.port, args.latency, args.error_rate)
+    logging.info("Fake Google Calendar listening on http://%s:%d/calendar/v3/", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info("Served %d requests, %d events stored", server.RequestHandlerClass.calendar.requests, len(server.RequestHandlerClass.calendar.events))
@@ -0,0 +1,150 @@
+# Verifies Google ID tokens against a process-wide cache of Google's signing certs.
+# The certs are fetched at most once per Cache-Control max-age (Google serves them
+# with several hours), shared by every request and thread, and optionally kept on
+# disk so a restart does not have to fetch them either. A login then costs one
+# local RS256 signature check.
+import base64
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import metrics
+import server_config
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+# used when the response has no max-age
+DEFAULT_MAX_AGE = 300
+# fetch again at most this often when a token names a key we do not have (key rotation)
+MIN_REFETCH_INTERVAL = 30
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class CertCache:
+    def __init__(self, url=GOOGLE_CERTS_URL, path=None, timeout=10, min_refetch_interval=MIN_REFETCH_INTERVAL):
+        self.url = url
+        # optional JSON file that keeps the certs across restarts
+        self.path = path
+        self.timeout = timeout
+        self.min_refetch_interval = min_refetch_interval
+        self.fetches = 0
+        self._certs = None
+        self._expires_at = 0
+        self._fetched_at = 0
+        self._lock = threading.Lock()
+        self._http = None
+        if path:
+            self._load()
+
+    def get(self, key_id=None):
+        # The {key id: certificate} mapping, fetched when it has expired or lacks key_id
+        certs = self._certs
+        if certs is not None and time.time() < self._expires_at and (key_id is None or key_id in certs):
+            return certs
+        with self._lock:
+            if self._certs is not None and time.time() < self._expires_at:
+                if key_id is None or key_id in self._certs:
+                    return self._certs
+                if time.time() - self._fetched_at < self.min_refetch_interval:
+                    # unknown key and we just fetched: the token is bad, not our certs
+                    return self._certs
+            try:
+                self._fetch()
+            except Exception:
+                if self._certs is None:
+                    raise
+                logger.exception("Could not refresh Google certs from %s, using the cached ones", self.url)
+            return self._certs
+
+    def clear(self):
+        with self._lock:
+            self._certs = None
+            self._expires_at = 0
+
+    def _fetch(self):
+        from google.auth import exceptions
+        if self._http is None:
+            import requests
+            self._http = requests.Session()
+        with metrics.google_call('oauth.certs'):
+            response = self._http.get(self.url, timeout=self.timeout)
+            if response.status_code != 200:
+                raise exceptions.TransportError(f"Could not fetch certificates at {self.url}: HTTP {response.status_code}")
+        self.fetches += 1
+        now = time.time()
+        self._certs = response.json()
+        self._expires_at = now + _max_age(response.headers)
+        self._fetched_at = now
+        if self.path:
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('url') == self.url and data.get('expires_at', 0) > time.time():
+            self._certs = data['certs']
+            self._expires_at = data['expires_at']
+
+    def _save(self):
+        # write and rename, so another process never reads half a file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+                json.dump({'url': self.url, 'certs': self._certs, 'expires_at': self._expires_at}, f)
+            os.replace(f.name, self.path)
+        except OSError:
+            logger.exception("Could not save Google certs to %s", self.path)
+
+
+def verify_id_token(token, audience, certs, clock_skew_in_seconds=10):
+    # What google.oauth2.id_token.verify_oauth2_token does, with the certs from the cache
+    from google.auth import exceptions, jwt
+    if isinstance(token, bytes):
+        token = token.decode()
+    id_info = jwt.decode(
+        token,
+        certs=certs.get(_key_id(token)),
+        audience=audience,
+        clock_skew_in_seconds=clock_skew_in_seconds,
+    )
+    if id_info.get('iss') not in GOOGLE_ISSUERS:
+        raise exceptions.GoogleAuthError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+    return id_info
+
+
+def _key_id(token):
+    try:
+        header = token.split('.', 1)[0]
+        return json.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4))).get('kid')
+    except (ValueError, AttributeError):
+        return None
+
+
+def _max_age(headers):
+    # max-age counts from when the response was generated; Age says how long ago that was
+    match = _MAX_AGE.search(headers.get('Cache-Control', ''))
+    if not match:
+        return DEFAULT_MAX_AGE
+    try:
+        age = int(headers.get('Age', 0))
+    except ValueError:
+        age = 0
+    return max(0, int(match.group(1)) - age)
+
+
+def from_env(app):
+    path = server_config.setting(app, 'GOOGLE_CERTS_CACHE_PATH')
+    if path is None:
+        path = os.path.join(app.instance_path, 'google_certs.json')
+    return CertCache(url=server_config.setting(app, 'GOOGLE_CERTS_URL', GOOGLE_CERTS_URL), path=path or None)
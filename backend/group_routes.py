@@ -0,0 +1,294 @@
+# The group grid and a group's members: adding, removing and bulk importing them.
+from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify
+import os
+import collections
+import types
+from sqlalchemy import delete, insert, update
+
+import calendar_routes
+import page_cache
+import person_import
+from pagination import keyset_page, page_args
+from person_routes import CALENDAR_FIELDS, MAX_BULK_DELETE, delete_people, requested_ids
+from query_budget import max_queries
+from models import db, insert_ignore, group_members, Group, Person
+
+bp = Blueprint('groups', __name__)
+
+@bp.route('/')
+@bp.route('/base')
+@max_queries(1)
+@page_cache.conditional
+def base():
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    username = session['username']
+    after, limit = page_args()
+
+    def render_grid():
+        groups, next_after = keyset_page(Group.for_user(user_id), Group.group_id, after, limit)
+        return render_template('group_grid.html', groups=groups, next_after=next_after)
+
+    group_grid = page_cache.fragment('group_grid', (after, limit), render_grid)
+    return render_template('base.html', group_grid=group_grid, username=username)
+
+@bp.route('/api/groups')
+@max_queries(1)
+def list_groups():
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+
+    after, limit = page_args()
+    groups, next_after = keyset_page(Group.for_user(session['user_id']), Group.group_id, after, limit)
+    return jsonify(
+        items=[
+            {
+                'group_id': group.group_id,
+                'group_name': group.group_name,
+                'url': url_for('groups.view_group', group_id=group.group_id),
+                'delete_url': url_for('groups.delete_group', group_id=group.group_id),
+            }
+            for group in groups
+        ],
+        next_after=next_after,
+    )
+
+@bp.route('/create_group', methods=['POST'])
+def create_group():
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    group_name = request.form['group_name']
+    
+    new_group = Group(user_id=user_id, group_name=group_name)
+    db.session.add(new_group)
+    db.session.commit()
+    page_cache.invalidate(user_id)
+    
+    return redirect(url_for('groups.base'))
+
+@bp.route('/delete_group/<int:group_id>', methods=['POST'])
+@max_queries(1)
+def delete_group(group_id):
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    delete_groups(session['user_id'], [group_id])
+    
+    return redirect(url_for('groups.base'))
+
+@bp.route('/api/groups/delete', methods=['POST'])
+@max_queries(1)
+def delete_groups_api():
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+    group_ids = requested_ids('group_ids')
+    if group_ids is None:
+        return jsonify(error=f'Send {{"group_ids": [...]}} with 1 to {MAX_BULK_DELETE} ids'), 400
+    return jsonify(deleted=delete_groups(session['user_id'], group_ids))
+
+def delete_groups(user_id, group_ids):
+    # One DELETE, however many members the groups have: the database drops their GroupMembers
+    # rows (ON DELETE CASCADE). The people stay, they may be in other groups.
+    deleted = db.session.execute(
+        delete(Group).where(Group.user_id == user_id, Group.group_id.in_(group_ids))
+    ).rowcount
+    db.session.commit()
+    if deleted:
+        page_cache.invalidate(user_id)
+    return deleted
+
+@bp.route('/group/<int:group_id>')
+@max_queries(2)
+@page_cache.conditional
+def view_group(group_id):
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    after, limit = page_args()
+
+    def render_members():
+        group = Group.query.get(group_id)
+        if not group or group.user_id != session['user_id']:
+            return None
+        group_members_data, next_after = keyset_page(Person.members_of(group_id), group_members.c.person_id, after, limit)
+        return render_template('member_list.html', group=group, members=group_members_data, next_after=next_after)
+
+    member_list = page_cache.fragment('member_list', (group_id, after, limit), render_members)
+    if member_list is None:
+        return redirect(url_for('groups.base'))
+    return render_template('group.html', member_list=member_list)
+
+@bp.route('/api/group/<int:group_id>/members')
+@max_queries(2)
+def list_members(group_id):
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+
+    group = Group.query.get(group_id)
+    if not group or group.user_id != session['user_id']:
+        return jsonify(error='Group not found'), 404
+    after, limit = page_args()
+    members, next_after = keyset_page(Person.members_of(group_id), group_members.c.person_id, after, limit)
+    return jsonify(
+        items=[
+            {
+                'person_id': member.person_id,
+                'name': member.name,
+                'url': url_for('people.view_person', person_id=member.person_id),
+                'remove_url': url_for('groups.remove_member', group_id=group_id, person_id=member.person_id),
+            }
+            for member in members
+        ],
+        next_after=next_after,
+    )
+
+@bp.route('/group/<int:group_id>/add_member', methods=['POST'])
+@max_queries(4)
+def add_member(group_id):
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    name = request.form['name']
+    user_id = session['user_id']
+    
+    if not Group.owned_by(group_id, user_id):
+        return redirect(url_for('groups.base'))
+    
+    # Check if the person already exists
+    person_id = db.session.query(Person.person_id).filter_by(name=name, user_id=user_id).limit(1).scalar()
+    
+    if person_id is None:
+        # Create a new person
+        new_person = Person(user_id=user_id, name=name)
+        db.session.add(new_person)
+        db.session.flush()
+        person_id = new_person.person_id
+    
+    # Add the person to the group; already being a member is not an error
+    db.session.execute(insert_ignore(group_members).values(person_id=person_id, group_id=group_id))
+    db.session.commit()
+    page_cache.invalidate(user_id)
+    
+    return redirect(url_for('groups.view_group', group_id=group_id))
+
+@bp.route('/group/<int:group_id>/remove_member/<int:person_id>', methods=['POST'])
+@max_queries(4)
+def remove_member(group_id, person_id):
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    # Removing a member deletes the person, their Google Calendar events included
+    delete_people(session['user_id'], [person_id])
+        
+    return redirect(url_for('groups.view_group', group_id=group_id))
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+
+@bp.route('/group/<int:group_id>/import', methods=['POST'])
+def import_members(group_id):
+    # Adds people from a CSV, JSON Lines or JSON array upload (form field "file", or the raw
+    # request body) to the group. Columns are Person fields; "name" is required and people
+    # whose name already exists for this user are updated instead of duplicated; blank cells
+    # leave their stored value alone.
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+
+    user_id = session['user_id']
+    if not Group.owned_by(group_id, user_id):
+        return jsonify(error='Group not found'), 404
+
+    upload = request.files.get('file')
+    if upload:
+        stream, fmt = upload.stream, person_import.detect_format(upload.filename, upload.mimetype)
+    else:
+        stream, fmt = request.stream, person_import.detect_format(None, request.mimetype)
+    fmt = request.args.get('format', fmt)
+    if fmt not in ('csv', 'ndjson', 'json'):
+        return jsonify(error='Upload a .csv, .ndjson/.jsonl or .json file'), 400
+    batch_size = max(1, min(request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int), 10000))
+
+    summary = {'rows': 0, 'created': 0, 'updated': 0, 'in_group': 0, 'invalid': 0, 'errors': []}
+
+    def valid_rows():
+        for line, row in person_import.read_rows(stream, fmt):
+            summary['rows'] += 1
+            try:
+                yield person_import.normalize_row(row, Person.__table__.c)
+            except person_import.InvalidImport as e:
+                summary['invalid'] += 1
+                if len(summary['errors']) < 20:
+                    summary['errors'].append(f"row {line}: {e}")
+
+    try:
+        for batch in person_import.batched(valid_rows(), batch_size):
+            import_people_batch(user_id, group_id, batch, summary)
+    except person_import.InvalidImport as e:
+        # batches before the bad spot are already committed
+        summary['errors'].append(str(e))
+        return jsonify(summary), 400
+    return jsonify(summary)
+
+def import_people_batch(user_id, group_id, rows, summary):
+    # One transaction per batch: a lookup of existing names, bulk insert/update, the memberships
+    # and the calendar jobs of people whose events change
+    people = {row['name']: row for row in rows}  # the last row for a name wins
+    existing = {
+        person.name: person
+        for person in db.session.query(Person.person_id, *(getattr(Person, field) for field in person_import.PERSON_FIELDS))
+        .filter(Person.user_id == user_id, Person.name.in_(people))
+    }
+    new_rows = [dict(row, user_id=user_id, **Person.month_day_columns(row)) for name, row in people.items() if name not in existing]
+    if new_rows:
+        db.session.execute(insert(Person), new_rows)
+    # A blank cell keeps the stored value, like a field left out of PATCH /api/person, and
+    # people whose values are all the same as stored are not written at all.
+    # executemany needs the same keys in every row, so group updates by the fields they set
+    updates = collections.defaultdict(list)
+    changed = {}
+    for name, person in existing.items():
+        stored = person._asdict()
+        values = {field: value for field, value in people[name].items() if value is not None and value != stored[field]}
+        if values:
+            updates[tuple(sorted(values))].append(dict(values, person_id=person.person_id, **Person.month_day_columns(values)))
+            changed[person.person_id] = (stored, dict(stored, **values))
+    for same_fields in updates.values():
+        db.session.execute(update(Person), same_fields)
+
+    ids = {name: person.person_id for name, person in existing.items()}
+    if new_rows:
+        ids.update(
+            db.session.query(Person.name, Person.person_id)
+            .filter(Person.user_id == user_id, Person.name.in_([row['name'] for row in new_rows]))
+            .all()
+        )
+        for row in new_rows:
+            changed[ids[row['name']]] = ({'name': row['name']}, row)
+    db.session.execute(insert_ignore(group_members), [{'person_id': person_id, 'group_id': group_id} for person_id in ids.values()])
+    queued = enqueue_calendar_jobs(user_id, changed) if calendar_routes.syncs_calendar(user_id) else 0
+    db.session.commit()
+    if queued:
+        calendar_routes.job_queue().notify()
+    page_cache.invalidate(user_id)
+
+    summary['created'] += len(new_rows)
+    summary['updated'] += sum(len(same_fields) for same_fields in updates.values())
+    summary['in_group'] += len(ids)
+
+def enqueue_calendar_jobs(user_id, changed):
+    # What update_person() does for one person, for the {person_id: (before, after)} field
+    # dicts of an import batch, in a few statements; returns how many jobs were queued
+    changes = {}
+    for person_id, (before, after) in changed.items():
+        prev_events, new_events = calendar_events(before), calendar_events(after)
+        if new_events != prev_events:
+            changes[person_id] = (prev_events, new_events)
+    if not changes:
+        return 0
+    return calendar_routes.job_queue().enqueue_many(user_id, 'events', changes)
+
+def calendar_events(fields):
+    return calendar_routes.person_calendar_events(types.SimpleNamespace(**{field: fields.get(field) for field in CALENDAR_FIELDS}))
@@ -0,0 +1,176 @@
+# Where the time goes: request latency and SQL queries per route, and every call
+# out to Google, as in-process histograms served in the Prometheus text format on
+# /metrics. Each process has its own numbers; with WSGI_PROCESSES > 1 scrape every
+# worker or sum them at the collector. The histograms are module globals, so apps
+# created in one process (tests) add to the same numbers; Google calls are also made
+# from threads with no app to attribute them to. The slow query threshold is per app.
+#
+#   METRICS_TOKEN          when set, /metrics wants "Authorization: Bearer <token>"
+#   METRICS_SLOW_QUERY_MS  log statements slower than this, with their route (off)
+import bisect
+import contextlib
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+
+import server_config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # {label values: [count per bucket..., +Inf count, sum]}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = {labels: list(values) for labels, values in sorted(self._series.items())}
+        for label_values, values in series.items():
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{labels}}} {values[-1]}'
+            yield f'{self.name}_count{{{labels}}} {cumulative}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, value in series:
+            yield f'{self.name}{{{_labels(self.labels, label_values)}}} {value}'
+
+
+def _labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time from the start of a request to its response.', ('route', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_sql_queries', 'SQL statements run by one request.', ('route',), buckets=COUNT_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    'sql_query_duration_seconds', 'Time of one SQL statement, by the route that ran it.', ('route',),
+)
+GOOGLE_DURATION = Histogram(
+    'google_api_call_duration_seconds', 'Time of one call to a Google API.', ('operation',),
+)
+GOOGLE_ERRORS = Counter(
+    'google_api_errors_total', 'Google API calls that failed, by error type.', ('operation', 'error'),
+)
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, QUERY_DURATION, GOOGLE_DURATION, GOOGLE_ERRORS)
+
+
+@contextlib.contextmanager
+def google_call(operation):
+    # with google_call('calendar.events.list'): ...
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        GOOGLE_ERRORS.inc(operation, type(e).__name__)
+        raise
+    finally:
+        GOOGLE_DURATION.observe(time.perf_counter() - start, operation)
+
+
+def google_error(operation, error):
+    # for failures that are reported rather than raised, like the parts of a batch request
+    GOOGLE_ERRORS.inc(operation, type(error).__name__)
+
+
+def render():
+    return '\n'.join(line for metric in METRICS for line in metric.collect()) + '\n'
+
+
+def _route():
+    if has_request_context():
+        return request.endpoint or 'none'
+    return 'background' if has_app_context() else 'none'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    route = _route()
+    QUERY_DURATION.observe(elapsed, route)
+    slow_query_seconds = current_app.extensions.get('metrics_slow_query_seconds') if has_app_context() else None
+    if slow_query_seconds is not None and elapsed >= slow_query_seconds:
+        logger.warning("Slow query (%.1f ms) in %s: %s", elapsed * 1000, route, statement)
+
+
+def init_app(app):
+    slow_query_ms = server_config.setting(app, 'METRICS_SLOW_QUERY_MS')
+    app.extensions['metrics_slow_query_seconds'] = float(slow_query_ms) / 1000 if slow_query_ms else None
+    # SQL latency per route, timed around every statement of every app
+    server_config.listen_on_every_engine({
+        'before_cursor_execute': _before_cursor_execute, 'after_cursor_execute': _after_cursor_execute,
+    })
+    token = server_config.setting(app, 'METRICS_TOKEN')
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'metrics_start' in g:
+            route = request.endpoint or 'none'
+            REQUEST_DURATION.observe(time.perf_counter() - g.metrics_start, route, request.method, response.status_code)
+            # counted by query_budget
+            REQUEST_QUERIES.observe(len(g.get('sql_statements', ())), route)
+        return response
+
+    def metrics_view():
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return 'Forbidden', 403
+        return render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -90,13 +90,31 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    connectable = get_engine()
+
+    # Full-text search is per database: keep autogenerate from dropping the SQLite
+    # index (PeopleSearch and its FTS5 shadow tables), or adding the MySQL-only one elsewhere
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and name.startswith('PeopleSearch'):
+            return False
+        if type_ == 'index' and name == 'ix_People_fulltext':
+            return connectable.dialect.name == 'mysql'
+        return True
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
-
-    connectable = get_engine()
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     with connectable.connect() as connection:
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            # batch migrations copy a table and drop the old one, which with foreign keys
+            # on would cascade to the rows that point at it (see models.py)
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            # ends the transaction that statement began, so the migrations get one of their own
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -105,6 +123,9 @@ def run_migrations_online():
 
         with context.begin_transaction():
             context.run_migrations()
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+            connection.commit()
 
 
 if context.is_offline_mode():
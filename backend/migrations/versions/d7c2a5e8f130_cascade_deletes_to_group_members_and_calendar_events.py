@@ -0,0 +1,76 @@
+"""Cascade deletes to GroupMembers and PersonCalendarEvents
+
+Revision ID: d7c2a5e8f130
+Revises: 9b3e6f1d2a47
+Create Date: 2026-10-18 23:05:17.442816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7c2a5e8f130'
+down_revision = '9b3e6f1d2a47'
+branch_labels = None
+depends_on = None
+
+# SQLite's foreign keys have no names; batch mode names them by this convention so
+# they can be dropped, and the new ones get the same names everywhere
+naming_convention = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+# (table, column, referred table, referred column)
+FOREIGN_KEYS = [
+    ('GroupMembers', 'person_id', 'People', 'person_id'),
+    ('GroupMembers', 'group_id', 'Groups', 'group_id'),
+    ('PersonCalendarEvents', 'person_id', 'People', 'person_id'),
+]
+
+
+def replace_foreign_keys(ondelete):
+    existing = {}
+    inspector = sa.inspect(op.get_bind())
+    for table in {fk[0] for fk in FOREIGN_KEYS}:
+        for fk in inspector.get_foreign_keys(table):
+            existing[table, tuple(fk['constrained_columns'])] = fk['name']
+
+    for table in ('GroupMembers', 'PersonCalendarEvents'):
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            for _, column, referred, referred_column in (fk for fk in FOREIGN_KEYS if fk[0] == table):
+                name = f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(existing.get((table, (column,))) or name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], [referred_column], ondelete=ondelete)
+
+
+def upgrade():
+    # Rows left behind by deletes from before the database enforced them. Tables, not raw
+    # SQL, so Groups is quoted on MySQL
+    people = sa.table('People', sa.column('person_id'))
+    groups = sa.table('Groups', sa.column('group_id'))
+    group_members = sa.table('GroupMembers', sa.column('person_id'), sa.column('group_id'))
+    events = sa.table('PersonCalendarEvents', sa.column('person_id'))
+    op.execute(group_members.delete().where(group_members.c.person_id.not_in(sa.select(people.c.person_id))))
+    op.execute(group_members.delete().where(group_members.c.group_id.not_in(sa.select(groups.c.group_id))))
+    op.execute(events.delete().where(events.c.person_id.not_in(sa.select(people.c.person_id))))
+    replace_foreign_keys('CASCADE')
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('CalendarJobs', schema=None) as batch_op:
+        batch_op.alter_column('person_id',
+               existing_type=sa.Integer(),
+               nullable=True)
+
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # cleanup jobs have no person
+    op.execute('DELETE FROM CalendarJobs WHERE person_id IS NULL')
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('CalendarJobs', schema=None) as batch_op:
+        batch_op.alter_column('person_id',
+               existing_type=sa.Integer(),
+               nullable=False)
+
+    # ### end Alembic commands ###
+    replace_foreign_keys(None)
@@ -0,0 +1,55 @@
+"""Add full-text search over people's names and notes
+
+Revision ID: e5b27c8d4f16
+Revises: c4a9e1f27d85
+Create Date: 2026-10-18 16:52:37.418206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b27c8d4f16'
+down_revision = 'c4a9e1f27d85'
+branch_labels = None
+depends_on = None
+
+# Same as person_search.SEARCH_FIELDS at the time of this revision
+FIELDS = ['name', 'nickname', 'likes', 'dislikes', 'allergies', 'reminders', 'how_we_met', 'favorite_memory', 'recent_updates']
+COLUMNS = ', '.join(FIELDS)
+NEW_VALUES = ', '.join(f'new.{field}' for field in FIELDS)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        # InnoDB builds the index from the existing rows and keeps it current from here on
+        op.create_index('ix_People_fulltext', 'People', FIELDS, unique=False, mysql_prefix='FULLTEXT')
+    elif dialect == 'sqlite':
+        op.execute(f"CREATE VIRTUAL TABLE PeopleSearch USING fts5({COLUMNS}, owner, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        op.execute(f"INSERT INTO PeopleSearch(rowid, {COLUMNS}, owner) SELECT person_id, {COLUMNS}, 'u' || user_id FROM People")
+        op.execute(
+            "CREATE TRIGGER People_search_insert AFTER INSERT ON People BEGIN "
+            f"INSERT INTO PeopleSearch(rowid, {COLUMNS}, owner) VALUES (new.person_id, {NEW_VALUES}, 'u' || new.user_id); END"
+        )
+        op.execute(
+            "CREATE TRIGGER People_search_delete AFTER DELETE ON People BEGIN "
+            "DELETE FROM PeopleSearch WHERE rowid = old.person_id; END"
+        )
+        op.execute(
+            f"CREATE TRIGGER People_search_update AFTER UPDATE OF user_id, {COLUMNS} ON People BEGIN "
+            "DELETE FROM PeopleSearch WHERE rowid = old.person_id; "
+            f"INSERT INTO PeopleSearch(rowid, {COLUMNS}, owner) VALUES (new.person_id, {NEW_VALUES}, 'u' || new.user_id); END"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ix_People_fulltext', table_name='People')
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS People_search_update")
+        op.execute("DROP TRIGGER IF EXISTS People_search_delete")
+        op.execute("DROP TRIGGER IF EXISTS People_search_insert")
+        op.execute("DROP TABLE PeopleSearch")
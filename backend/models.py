@@ -0,0 +1,200 @@
+# Database models. db is not bound to an app here; create_app() in main.py does
+# that, so the models can be imported without configuring anything.
+import sqlite3
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import load_only, selectinload
+
+import person_search
+import upcoming
+
+db = SQLAlchemy()
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite leaves foreign keys, and so ON DELETE CASCADE, off unless each connection asks
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+class User(db.Model):
+    __tablename__ = 'Users'
+    user_id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), nullable=False, unique=True)
+    email = db.Column(db.String(100), nullable=False, unique=True)
+    # a werkzeug hash, see passwords.py
+    password = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+# When querying in MySQL server, use backticks because Groups is a reserved keyword
+class Group(db.Model):
+    __tablename__ = 'Groups'
+    __table_args__ = (
+        # a user's groups in group_id order, for the keyset-paginated group grid
+        db.Index('ix_Groups_user_id_group_id', 'user_id', 'group_id'),
+    )
+    group_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.user_id'), nullable=False)
+    group_name = db.Column(db.String(100), nullable=False)
+
+    @classmethod
+    def owned_by(cls, group_id, user_id):
+        # EXISTS instead of loading the group just to compare user_id
+        return db.session.query(cls.query.filter_by(group_id=group_id, user_id=user_id).exists()).scalar()
+
+    @classmethod
+    def for_user(cls, user_id):
+        # Only what the group grid renders
+        return cls.query.options(load_only(cls.group_id, cls.group_name)).filter_by(user_id=user_id)
+
+class Person(db.Model):
+    __tablename__ = 'People'
+    __table_args__ = (
+        # add_member looks people up by name within a user; not unique, names can repeat
+        db.Index('ix_People_user_id_name', 'user_id', 'name'),
+        # /search on MySQL; SQLite gets an FTS5 table instead, see person_search.py
+        db.Index('ix_People_fulltext', *person_search.SEARCH_FIELDS, mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        # the upcoming dates page, see upcoming.py
+        db.Index('ix_People_user_id_birthday_day', 'user_id', 'birthday_day'),
+        db.Index('ix_People_user_id_anniversary_day', 'user_id', 'anniversary_day'),
+    )
+    person_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.user_id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    nickname = db.Column(db.String(100), nullable=True)
+    pronouns = db.Column(db.String(100), nullable=True)
+    birthday = db.Column(db.Date, nullable=True)
+    relationship = db.Column(db.String(100), nullable=True)  # New field for relationship
+    anniversary_title = db.Column(db.String(100), nullable=True)  # New field for anniversary title
+    anniversary_date = db.Column(db.Date, nullable=True)  # New field for anniversary date
+    likes = db.Column(db.Text, nullable=True)  # Renamed field from interests to likes
+    dislikes = db.Column(db.Text, nullable=True)  # New field for dislikes
+    allergies = db.Column(db.Text, nullable=True)
+    reminders = db.Column(db.Text, nullable=True)
+    how_we_met = db.Column(db.Text, nullable=True)
+    favorite_memory = db.Column(db.Text, nullable=True)
+    recent_updates = db.Column(db.Text, nullable=True)
+    # month * 100 + day of birthday and anniversary_date, kept in step by set_month_day()
+    birthday_day = db.Column(db.SmallInteger, nullable=True)
+    anniversary_day = db.Column(db.SmallInteger, nullable=True)
+
+    # Many-to-many relationship between People and Group; the database drops the
+    # GroupMembers rows of a deleted person or group (ON DELETE CASCADE)
+    groups = db.relationship(
+        'Group', secondary='GroupMembers', passive_deletes=True,
+        backref=db.backref('people', lazy='dynamic', passive_deletes=True),
+    )
+
+    @db.validates('birthday', 'anniversary_date')
+    def set_month_day(self, key, value):
+        setattr(self, 'birthday_day' if key == 'birthday' else 'anniversary_day', upcoming.month_day(value))
+        return value
+
+    @staticmethod
+    def month_day_columns(row):
+        # The same for the bulk import, which writes plain dicts rather than Person objects
+        columns = {}
+        if 'birthday' in row:
+            columns['birthday_day'] = upcoming.month_day(row['birthday'])
+        if 'anniversary_date' in row:
+            columns['anniversary_day'] = upcoming.month_day(row['anniversary_date'])
+        return columns
+
+    @classmethod
+    def members_of(cls, group_id):
+        # (person_id, name) rows for a member list, without pulling the Text columns
+        return (
+            db.session.query(cls.person_id, cls.name)
+            .join(group_members, cls.person_id == group_members.c.person_id)
+            .filter(group_members.c.group_id == group_id)
+        )
+
+    @classmethod
+    def with_groups(cls):
+        # Loads every person's groups in one extra query instead of one per person
+        return cls.query.options(selectinload(cls.groups).load_only(Group.group_id))
+
+person_search.install(Person.__table__)
+
+# Join table
+group_members = db.Table('GroupMembers',
+    db.Column('person_id', db.Integer, db.ForeignKey('People.person_id', ondelete='CASCADE'), primary_key=True),
+    db.Column('group_id', db.Integer, db.ForeignKey('Groups.group_id', ondelete='CASCADE'), primary_key=True),
+    # the primary key starts with person_id, this covers listing a group's members
+    db.Index('ix_GroupMembers_group_id_person_id', 'group_id', 'person_id'),
+)
+
+# Google Calendar events created for a person, so they can be changed by ID
+class PersonCalendarEvent(db.Model):
+    __tablename__ = 'PersonCalendarEvents'
+    person_id = db.Column(db.Integer, db.ForeignKey('People.person_id', ondelete='CASCADE'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)  # 'birthday' or 'anniversary'
+    google_event_id = db.Column(db.String(255), nullable=False)
+    etag = db.Column(db.String(64), nullable=True)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    person = db.relationship('Person', backref=db.backref('calendar_events', cascade='all, delete-orphan', passive_deletes=True))
+
+# Progress of pushing all of a user's existing people to Google Calendar, so it can resume
+class CalendarBackfill(db.Model):
+    __tablename__ = 'CalendarBackfills'
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.user_id'), primary_key=True)
+    last_person_id = db.Column(db.Integer, nullable=False, default=0)  # everyone up to here is done
+    people_synced = db.Column(db.Integer, nullable=False, default=0)
+    events_created = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(10), nullable=False, default='running')
+    last_error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+# the databases insert_ignore() has an INSERT for; create_app() turns others away
+SUPPORTED_DIALECTS = ('mysql', 'sqlite', 'postgresql')
+
+def check_database(uri):
+    # Fails at startup rather than at the first add_member or import; a missing URI is
+    # left to Flask-SQLAlchemy to report
+    if not uri:
+        return
+    dialect = make_url(uri).get_backend_name()
+    if dialect not in SUPPORTED_DIALECTS:
+        raise RuntimeError(f"Unsupported database {dialect}, use one of: {', '.join(SUPPORTED_DIALECTS)}")
+
+def insert_ignore(table):
+    # INSERT that skips rows whose key already exists, in one statement on every backend we run on
+    # the dialect modules are imported here: only the one in use is needed, and the
+    # others take longer to import than everything else models.py uses
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        # a no-op update, so a duplicate key is not an error
+        key = table.primary_key.columns.values()[0].name
+        return stmt.on_duplicate_key_update({key: stmt.inserted[key]})
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(table).on_conflict_do_nothing()
+    raise RuntimeError(f"insert_ignore does not support {dialect}, only {', '.join(SUPPORTED_DIALECTS)}")
+
+# Outbox of Google Calendar work, drained by background workers (see calendar_jobs.py)
+class CalendarJob(db.Model):
+    __tablename__ = 'CalendarJobs'
+    job_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.user_id'), nullable=False)
+    # no FK, the person may be gone by the time the job runs; None for jobs about many people
+    person_id = db.Column(db.Integer, nullable=True, index=True)
+    # 'events': sync the person's birthday and anniversary, 'cleanup': delete the events of deleted people
+    kind = db.Column(db.String(20), nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # 'create', 'update' or 'delete'
+    payload = db.Column(db.Text, nullable=False)  # JSON: previous and new events, or the event IDs to delete
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, index=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
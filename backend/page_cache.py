@@ -0,0 +1,190 @@
+# Rendered fragments (the group grid, a group's member list, a person's sheet) and
+# ETags for the pages around them, so repeat views skip the database and the
+# templates. Everything a user sees is keyed by a version per user, which the
+# write routes bump with invalidate(user_id) after they commit; entries for older
+# versions are simply never asked for again and fall out of the cache.
+#
+#   PAGE_CACHE_BACKEND   memory (default), redis (needs `pip install redis`) or off
+#   PAGE_CACHE_SIZE      fragments kept per process by the memory backend (2048)
+#   PAGE_CACHE_VERSIONS_PATH  SQLite file with the versions for the memory backend,
+#                        shared by the processes on a host (instance/page_versions.sqlite3)
+#   PAGE_CACHE_REDIS_URL fragments and versions for the redis backend, shared by
+#                        every process that uses it (redis://localhost:6379/0)
+#   PAGE_CACHE_TTL       seconds a fragment is kept in redis (86400)
+import collections
+import functools
+import hashlib
+import os
+import threading
+import time
+
+from flask import current_app, g, request, session
+from markupsafe import Markup
+
+import server_config
+
+
+class MemoryStore:
+    # Fragments in a per-process LRU; versions in SQLite, so a write in one worker
+    # invalidates the pages of every worker
+    def __init__(self, size, versions_path):
+        self.size = size
+        self.versions_path = versions_path
+        self._fragments = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._connections = server_config.SQLiteConnections(versions_path)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS versions (user_id INTEGER PRIMARY KEY, version INTEGER NOT NULL)')
+
+    def _connect(self):
+        return self._connections.get()
+
+    def version(self, user_id):
+        row = self._connect().execute('SELECT version FROM versions WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_id):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO versions (user_id, version) VALUES (?, ?)', (user_id, time.time_ns())
+            )
+
+    def get(self, key):
+        with self._lock:
+            value = self._fragments.get(key)
+            if value is not None:
+                self._fragments.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._fragments[key] = value
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.size:
+                self._fragments.popitem(last=False)
+
+
+class RedisStore:
+    # Fragments and versions in Redis (or anything speaking its protocol); needs the
+    # redis package, which is not in requirements.txt: pip install redis
+    def __init__(self, url, ttl):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("PAGE_CACHE_BACKEND=redis needs the redis package, install it with `pip install redis`") from None
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def version(self, user_id):
+        value = self.client.get(f'page-version:{user_id}')
+        return int(value) if value else 0
+
+    def bump(self, user_id):
+        self.client.set(f'page-version:{user_id}', time.time_ns())
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+
+def init_app(app):
+    backend = server_config.setting(app, 'PAGE_CACHE_BACKEND', 'memory')
+    if backend == 'off':
+        store = None
+    elif backend == 'memory':
+        path = server_config.setting(app, 'PAGE_CACHE_VERSIONS_PATH') or os.path.join(app.instance_path, 'page_versions.sqlite3')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        store = MemoryStore(int(server_config.setting(app, 'PAGE_CACHE_SIZE', 2048)), path)
+    elif backend == 'redis':
+        store = RedisStore(
+            server_config.setting(app, 'PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+            int(server_config.setting(app, 'PAGE_CACHE_TTL', 86400)),
+        )
+    else:
+        raise ValueError(f"Unknown PAGE_CACHE_BACKEND: {backend}")
+    app.extensions['page_cache'] = store
+    # part of every key and ETag, so a deploy with changed templates does not serve old pages
+    templates = hashlib.sha1()
+    for name in sorted(app.jinja_env.list_templates()):
+        templates.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode())
+    app.config['PAGE_CACHE_SALT'] = templates.hexdigest()[:12]
+
+
+def _store():
+    return current_app.extensions.get('page_cache')
+
+
+def _version(user_id):
+    # read once per request
+    versions = g.setdefault('page_cache_versions', {})
+    if user_id not in versions:
+        versions[user_id] = _store().version(user_id)
+    return versions[user_id]
+
+
+def version(user_id):
+    # The user's current version, for other per-process caches that want to be invalidated
+    # with the pages (see upcoming.py); None when the page cache is off
+    if _store() is None:
+        return None
+    return _version(user_id)
+
+
+def invalidate(user_id):
+    store = _store()
+    if store is not None:
+        store.bump(user_id)
+        g.pop('page_cache_versions', None)
+
+
+def fragment(name, args, render):
+    # The HTML of render() for the logged-in user, cached under their current version.
+    # render() returns None when there is nothing to show, which is not cached.
+    store = _store()
+    if store is not None:
+        user_id = session['user_id']
+        key = f"fragment:{current_app.config['PAGE_CACHE_SALT']}:{name}:{user_id}:{_version(user_id)}:" + ':'.join(map(str, args))
+        html = store.get(key)
+        if html is not None:
+            return Markup(html)
+    html = render()
+    if html is None:
+        return None
+    if store is not None:
+        store.set(key, html)
+    return Markup(html)
+
+
+def etag():
+    # Everything the page can depend on: the user's data, the URL and what the templates read from the session
+    user_id = session['user_id']
+    parts = (
+        current_app.config['PAGE_CACHE_SALT'], user_id, _version(user_id), request.full_path,
+        session.get('username'), 'google_calendar' in session,
+    )
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def conditional(view):
+    # For GET views of a logged-in user's pages: answers 304 when the browser's copy
+    # is current, and tags 200 responses with an ETag the browser revalidates every time
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if _store() is None or 'user_id' not in session:
+            return view(*args, **kwargs)
+        tag = etag()
+        if request.if_none_match.contains(tag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(tag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
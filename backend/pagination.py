@@ -0,0 +1,30 @@
+# Keyset ("load more") pagination on an increasing id column.
+# Each page is `WHERE id > :after ORDER BY id LIMIT :limit + 1`, which is a range scan
+# on the primary key however deep into the listing you are, unlike OFFSET.
+import collections
+import os
+
+from flask import request
+
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE', 100))
+MAX_PAGE_SIZE = 500
+
+# next_after is the cursor for the following page, or None on the last page
+Page = collections.namedtuple('Page', ['items', 'next_after'])
+
+
+def page_args():
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return after, max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, column, after=None, limit=DEFAULT_PAGE_SIZE):
+    if after is not None:
+        query = query.filter(column > after)
+    # one extra row tells us whether there is another page without a COUNT
+    rows = query.order_by(column).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return Page(rows, None)
+    rows = rows[:limit]
+    return Page(rows, getattr(rows[-1], column.key))
@@ -0,0 +1,112 @@
+# Password hashing off the request threads. scrypt is deliberately slow (~70 ms of
+# CPU at the default cost), so hashes are made and checked in a small process pool
+# of PASSWORD_HASH_WORKERS processes: a burst of logins keeps those cores busy
+# instead of every waitress thread, and the thread that waits on one holds neither
+# the GIL nor a core. At most PASSWORD_HASH_QUEUE hashes wait for a worker; past
+# that, and after PASSWORD_HASH_TIMEOUT seconds, callers get HasherBusy.
+#
+# Hashes are werkzeug's, "method$salt$hash". A stored hash made with another
+# PASSWORD_HASH_METHOD than the current one, or a password still stored in plain
+# text from before hashing, is replaced with a new hash at the next login.
+#
+# The workers are spawned, not forked, so like any multiprocessing user the script
+# that starts the server needs the `if __name__ == '__main__':` guard.
+#
+#   PASSWORD_HASH_METHOD   as werkzeug writes it (scrypt:32768:8:1)
+#   PASSWORD_HASH_WORKERS  processes; 0 hashes in the request thread (CPU count, 0 under app.testing)
+#   PASSWORD_HASH_QUEUE    hashes waiting for a worker before logins are turned away (4 per worker)
+#   PASSWORD_HASH_TIMEOUT  seconds to wait for a slot and a result (10)
+import concurrent.futures
+import hmac
+import multiprocessing
+import os
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import server_config
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+# stored for accounts without a password (Google logins); matches no password
+UNUSABLE = '!'
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=None, queue=None, timeout=10):
+        self.method = method
+        self.workers = os.cpu_count() if workers is None else workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + (self.workers * 4 if queue is None else queue))
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # a hash to check when there is no user, so an unknown email takes as long as a wrong password
+        self._dummy = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        # (matches, new hash to store or None)
+        if stored is None or stored == UNUSABLE:
+            self._run(check_password_hash, self._dummy_hash(), password)
+            return False, None
+        if not _is_hash(stored):
+            # from before passwords were hashed
+            if hmac.compare_digest(stored.encode(), password.encode()):
+                return True, self.hash(password)
+            return False, None
+        if not self._run(check_password_hash, stored, password):
+            return False, None
+        return True, self.hash(password) if self.needs_rehash(stored) else None
+
+    def needs_rehash(self, stored):
+        return stored.split('$', 1)[0] != self.method
+
+    def _dummy_hash(self):
+        if self._dummy is None:
+            self._dummy = self._run(generate_password_hash, os.urandom(16).hex(), self.method)
+        return self._dummy
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy()
+        try:
+            return self._executor().submit(function, *args).result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise HasherBusy()
+        finally:
+            self._slots.release()
+
+    def _executor(self):
+        # created on first use in each process, so forked servers do not share one;
+        # the workers are spawned, forking a process with running threads is not safe
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+
+def _is_hash(stored):
+    return '$' in stored and stored.split('$', 1)[0].split(':', 1)[0] in ('scrypt', 'pbkdf2')
+
+
+def from_env(app):
+    workers = server_config.setting(app, 'PASSWORD_HASH_WORKERS', 0 if app.testing else None)
+    queue = server_config.setting(app, 'PASSWORD_HASH_QUEUE')
+    return PasswordHasher(
+        method=server_config.setting(app, 'PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=None if workers is None else int(workers),
+        queue=None if queue is None else int(queue),
+        timeout=float(server_config.setting(app, 'PASSWORD_HASH_TIMEOUT', 10)),
+    )
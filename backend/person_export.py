@@ -0,0 +1,64 @@
+# Streaming writers for a user's people, the other half of person_import.py.
+# People and their group memberships arrive as two result streams ordered by
+# person_id and are merged on the fly, so an export holds one chunk of output in
+# memory whatever the number of people, and the files it writes can be imported again.
+import csv
+import io
+import json
+
+from person_import import PERSON_FIELDS
+
+EXPORT_FIELDS = ['person_id'] + PERSON_FIELDS + ['groups']
+# rows per chunk handed to the WSGI server, so it is not flushing one line at a time
+CHUNK_ROWS = 500
+
+
+def with_groups(people, memberships):
+    # Merge join: people is (person_id, *PERSON_FIELDS) rows and memberships is
+    # (person_id, group_name) rows, both ascending by person_id
+    memberships = iter(memberships)
+    membership = next(memberships, None)
+    for row in people:
+        person = dict(zip(['person_id'] + PERSON_FIELDS, row))
+        groups = []
+        while membership is not None and membership[0] <= person['person_id']:
+            if membership[0] == person['person_id']:
+                groups.append(membership[1])
+            membership = next(memberships, None)
+        person['groups'] = groups
+        yield person
+
+
+def ndjson_chunks(people):
+    lines = []
+    for person in people:
+        lines.append(json.dumps(person, default=_isoformat, ensure_ascii=False))
+        if len(lines) == CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_chunks(people):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, person in enumerate(people, start=1):
+        person['groups'] = ';'.join(person['groups'])
+        writer.writerow([_csv_value(person[field]) for field in EXPORT_FIELDS])
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    return _isoformat(value) if hasattr(value, 'isoformat') else value
+
+
+def _isoformat(value):
+    return value.isoformat()
@@ -0,0 +1,154 @@
+# Lazy readers for people uploaded as CSV, JSON Lines or a JSON array.
+# Rows are yielded one at a time so an import of any size is processed in
+# fixed-size batches without ever holding the whole file in memory.
+import csv
+import datetime
+import io
+import itertools
+import json
+import re
+
+# Everything a person has besides ids, in the order of the edit form
+PERSON_FIELDS = [
+    'name', 'nickname', 'pronouns', 'relationship', 'birthday', 'anniversary_title', 'anniversary_date',
+    'likes', 'dislikes', 'allergies', 'reminders', 'how_we_met', 'favorite_memory', 'recent_updates',
+]
+DATE_FIELDS = {'birthday', 'anniversary_date'}
+
+_WHITESPACE = re.compile(r'\s*')
+# a JSON element bigger than this is treated as malformed rather than buffered further
+MAX_ELEMENT_SIZE = 1024 * 1024
+
+
+class InvalidImport(ValueError):
+    pass
+
+
+def detect_format(filename, content_type):
+    filename = (filename or '').lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if filename.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if filename.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if filename.endswith('.json') or content_type == 'application/json':
+        return 'json'
+    return None
+
+
+def read_rows(binary_stream, fmt):
+    # Yields (line_or_index, dict) pairs
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == 'ndjson':
+            for line_number, line in enumerate(text, start=1):
+                if line.strip():
+                    yield line_number, _load_object(line, line_number)
+        elif fmt == 'json':
+            yield from enumerate(iter_json_array(text), start=1)
+        else:
+            raise InvalidImport(f"Unsupported format: {fmt}")
+    except UnicodeDecodeError:
+        # a Latin-1 export from Excel, a UTF-16 file
+        raise InvalidImport("file is not UTF-8 text")
+
+
+def iter_json_array(text, chunk_size=64 * 1024):
+    # Decodes the objects of a top-level JSON array one by one as the text is read, as
+    # strictly as json.loads(): one comma between elements, none after the last one and
+    # nothing but whitespace after the closing bracket
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    # what comes next: '[', 'first' (an element or ']'), 'element', 'separator' (',' or ']'), 'end'
+    expect = '['
+    while True:
+        position = _WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                if expect == 'end':
+                    return
+                raise InvalidImport("Unexpected end of JSON")
+        elif expect == '[':
+            if buffer[position] != '[':
+                raise InvalidImport("Expected a JSON array of people")
+            expect = 'first'
+            position += 1
+            continue
+        elif expect == 'end':
+            raise InvalidImport("Unexpected data after the JSON array")
+        elif buffer[position] == ']' and expect != 'element':
+            expect = 'end'
+            position += 1
+            continue
+        elif expect == 'separator':
+            if buffer[position] != ',':
+                raise InvalidImport("Expected , or ] after an element of the array")
+            expect = 'element'
+            position += 1
+            continue
+        elif buffer[position] in ',]':
+            raise InvalidImport("Expected an element of the array")
+        else:
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # most likely an object cut in half by the chunk boundary
+                if eof or len(buffer) - position > MAX_ELEMENT_SIZE:
+                    raise InvalidImport("Invalid JSON")
+            else:
+                if not isinstance(item, dict):
+                    raise InvalidImport("Every element of the array must be an object")
+                yield item
+                expect = 'separator'
+                continue
+        chunk = text.read(chunk_size)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def normalize_row(row, columns, partial=False):
+    # Maps an uploaded row onto Person columns; blank values become None. With partial,
+    # name is only required to be non-blank when it is given.
+    person = {}
+    for field in PERSON_FIELDS:
+        if field not in row:
+            continue
+        value = row[field]
+        if isinstance(value, str):
+            value = value.strip() or None
+        if value is not None and field in DATE_FIELDS:
+            try:
+                value = datetime.date.fromisoformat(str(value))
+            except ValueError:
+                raise InvalidImport(f"{field} must be a YYYY-MM-DD date")
+        elif value is not None:
+            value = str(value)
+            length = columns[field].type.length
+            if length and len(value) > length:
+                raise InvalidImport(f"{field} is longer than {length} characters")
+        person[field] = value
+    if (not partial or 'name' in person) and not person.get('name'):
+        raise InvalidImport("name is required")
+    return person
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _load_object(line, line_number):
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError:
+        raise InvalidImport(f"line {line_number}: invalid JSON")
+    if not isinstance(item, dict):
+        raise InvalidImport(f"line {line_number}: expected an object")
+    return item
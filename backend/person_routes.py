@@ -0,0 +1,241 @@
+# A person's page and edit form, search, and the export of everyone a user knows.
+from flask import Blueprint, render_template, redirect, url_for, session, request, Response, stream_with_context, jsonify
+import os
+import logging
+import datetime
+from sqlalchemy import delete, select
+
+import calendar_routes
+import page_cache
+import person_export
+import person_import
+import person_search
+from query_budget import max_queries
+from models import db, group_members, Group, Person, PersonCalendarEvent, User
+
+bp = Blueprint('people', __name__)
+
+@bp.route('/person/<int:person_id>')
+@max_queries(1)
+@page_cache.conditional
+def view_person(person_id):
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    
+    def render_sheet():
+        person = Person.query.get(person_id)
+        if not person or person.user_id != session['user_id']:
+            return None
+        return render_template('person_sheet.html', person=person)
+
+    person_sheet = page_cache.fragment('person_sheet', (person_id,), render_sheet)
+    if person_sheet is None:
+        return redirect(url_for('groups.base'))
+    return render_template('person.html', person_sheet=person_sheet)
+
+# the fields person_calendar_events() reads
+CALENDAR_FIELDS = {'name', 'birthday', 'anniversary_title', 'anniversary_date'}
+
+@bp.route('/edit_person/<int:person_id>', methods=['GET', 'POST'])
+def edit_person(person_id):
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+
+    person = Person.query.get_or_404(person_id)
+    if person.user_id != session['user_id']:
+        return redirect(url_for('groups.base'))
+    if request.method == 'POST':
+        try:
+            values = person_import.normalize_row(request.form, Person.__table__.c)
+        except person_import.InvalidImport as e:
+            return str(e), 400
+        update_person(person, values)
+        return redirect(url_for('people.view_person', person_id=person_id))
+    
+    return render_template('edit_person.html', person=person)
+
+@bp.route('/api/person/<int:person_id>', methods=['PATCH'])
+@max_queries(4)
+def patch_person(person_id):
+    # Saves the fields in a JSON object, e.g. {"likes": "tea"} from the edit form's autosave;
+    # fields that are left out keep their value
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error='Send a JSON object of fields'), 400
+    unknown = sorted(set(data) - set(person_import.PERSON_FIELDS))
+    if unknown:
+        return jsonify(error=f"Unknown fields: {', '.join(unknown)}"), 400
+    try:
+        values = person_import.normalize_row(data, Person.__table__.c, partial=True)
+    except person_import.InvalidImport as e:
+        return jsonify(error=str(e)), 400
+
+    person = db.session.get(Person, person_id)
+    if person is None or person.user_id != session['user_id']:
+        return jsonify(error='Person not found'), 404
+    changes = update_person(person, values)
+    return jsonify(
+        person_id=person_id,
+        changed={field: value.isoformat() if isinstance(value, datetime.date) else value for field, value in changes.items()},
+    )
+
+def update_person(person, values):
+    # Sets the fields whose value differs and returns them; when nothing differs there is
+    # no UPDATE, no calendar job and no cache invalidation
+    changes = {field: value for field, value in values.items() if getattr(person, field) != value}
+    if not changes:
+        return changes
+
+    # needed to remove old data from google calendar
+    prev_events = calendar_routes.person_calendar_events(person)
+    for field, value in changes.items():
+        setattr(person, field, value)
+
+    # Check if the user has given us access to their Google Calendar
+    queued = False
+    if CALENDAR_FIELDS & changes.keys() and calendar_routes.syncs_calendar(person.user_id):
+        # Calendar updates are queued in the same commit and run by the calendar workers
+        # prevent duplicate events
+        new_events = calendar_routes.person_calendar_events(person)
+        if new_events != prev_events:
+            queued = calendar_routes.job_queue().enqueue(
+                person.user_id, person.person_id, 'events', prev_events, new_events
+            ) is not None
+
+    user_id = person.user_id
+    db.session.commit()
+    if queued:
+        calendar_routes.job_queue().notify()
+    page_cache.invalidate(user_id)
+    return changes
+
+# ids a bulk delete takes in one statement
+MAX_BULK_DELETE = 10000
+
+def requested_ids(key):
+    # The list of ids under key in the JSON body, e.g. {"person_ids": [1, 2]}, or None if it is not one
+    data = request.get_json(silent=True)
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not 0 < len(ids) <= MAX_BULK_DELETE:
+        return None
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return ids
+
+@bp.route('/api/people/delete', methods=['POST'])
+@max_queries(3)
+def delete_people_api():
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+    person_ids = requested_ids('person_ids')
+    if person_ids is None:
+        return jsonify(error=f'Send {{"person_ids": [...]}} with 1 to {MAX_BULK_DELETE} ids'), 400
+    return jsonify(deleted=delete_people(session['user_id'], person_ids))
+
+def delete_people(user_id, person_ids):
+    # Deletes the user's people among person_ids in one statement; the database drops their
+    # memberships and calendar event rows with them. Their Google Calendar events are
+    # deleted by a single queued job rather than one per person. Returns how many were deleted.
+    owned = Person.person_id.in_(person_ids) & (Person.user_id == user_id)
+    # read whatever session this is: once the rows are gone the events cannot be found again
+    event_ids = db.session.execute(
+        select(PersonCalendarEvent.google_event_id)
+        .join(Person, Person.person_id == PersonCalendarEvent.person_id)
+        .where(owned)
+    ).scalars().all()
+    if event_ids and not calendar_routes.syncs_calendar(user_id):
+        logging.warning(f"No Google credentials stored for user {user_id}, leaving {len(event_ids)} calendar events behind")
+        event_ids = []
+    deleted = db.session.execute(delete(Person).where(owned)).rowcount
+    if event_ids:
+        calendar_routes.job_queue().enqueue_cleanup(user_id, event_ids)
+    db.session.commit()
+    if event_ids:
+        calendar_routes.job_queue().notify()
+    if deleted:
+        page_cache.invalidate(user_id)
+    return deleted
+
+@bp.route('/search')
+@max_queries(1)
+def search():
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    query = request.args.get('q', '').strip()
+    results = person_search.search(db.session, session['user_id'], query) if query else []
+    return render_template('search.html', query=query, results=results)
+
+@bp.route('/api/search')
+@max_queries(1)
+def search_people():
+    if 'username' not in session:
+        return jsonify(error='Not logged in'), 401
+    results = person_search.search(db.session, session['user_id'], request.args.get('q', ''))
+    return jsonify(items=[
+        dict(result, snippet=str(result['snippet']), url=url_for('people.view_person', person_id=result['person_id']))
+        for result in results
+    ])
+
+EXPORT_YIELD_PER = int(os.getenv('EXPORT_YIELD_PER', 1000))
+
+@bp.route('/export')
+def export_people():
+    # Every person of the logged-in user with the names of their groups, as JSON Lines
+    # (default) or CSV with ?format=csv, streamed while it is read from the database
+    if 'username' not in session:
+        return redirect(url_for('auth.login'))
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return "format must be ndjson or csv", 400
+
+    user_id = session['user_id']
+    people = (
+        db.session.query(Person.person_id, *(getattr(Person, field) for field in person_import.PERSON_FIELDS))
+        .filter(Person.user_id == user_id)
+        .order_by(Person.person_id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    memberships = (
+        select(group_members.c.person_id, Group.group_name)
+        .join(Group, Group.group_id == group_members.c.group_id)
+        .where(Group.user_id == user_id)
+        .order_by(group_members.c.person_id, group_members.c.group_id)
+    )
+
+    def generate():
+        # Memberships are read on a second connection: MySQL cannot run another query on a
+        # connection while a server-side cursor is still being read
+        with db.engine.connect() as connection:
+            rows = connection.execution_options(yield_per=EXPORT_YIELD_PER).execute(memberships)
+            records = person_export.with_groups(people, rows)
+            if fmt == 'csv':
+                yield from person_export.csv_chunks(records)
+            else:
+                yield from person_export.ndjson_chunks(records)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=character-sheets.{fmt}'},
+    )
+
+# use /users to see the tables, just to make sure the sql works with the flask.
+# No query budget: it dumps every table, and the groups of every person are loaded
+# 500 people to a query, so the count grows with the data.
+@bp.route('/users')
+def show_users():
+    logging.info("Displaying users table")
+    users = User.query.all()
+    groups = Group.query.all()
+    people = Person.with_groups().all()
+    group_members_data = [
+        {'group_id': group.group_id, 'person_id': person.person_id}
+        for person in people
+        for group in person.groups
+    ]
+
+    return render_template('users.html', users=users, groups=groups, people=people, group_members=group_members_data)
@@ -0,0 +1,152 @@
+# Full-text search over people's names and notes.
+# On MySQL the People table carries a FULLTEXT index that InnoDB keeps current on
+# every commit. On SQLite an FTS5 table, PeopleSearch, mirrors those columns and is
+# kept in step by triggers on People, so edits, imports and deletes all update the
+# index incrementally, in the same transaction as the change itself. PostgreSQL
+# matches with to_tsvector() over the user's rows, found by ix_People_user_id_name,
+# and any other database with LIKE; neither has an index of its own.
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, and_, column, event, func, or_, select, table, text
+
+SEARCH_FIELDS = [
+    'name', 'nickname', 'likes', 'dislikes', 'allergies', 'reminders', 'how_we_met', 'favorite_memory', 'recent_updates',
+]
+MAX_RESULTS = 50
+SNIPPET_WORDS = 12
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+# stand-ins for <mark> and </mark> that survive HTML escaping
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_columns = ', '.join(SEARCH_FIELDS)
+# bm25 column weights: owner never scores, a hit in a name counts more than one in the notes
+_WEIGHTS = ', '.join(['5', '3'] + ['1'] * (len(SEARCH_FIELDS) - 2) + ['0'])
+_new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+_people = table('People', column('person_id'), column('user_id'), *(column(field) for field in SEARCH_FIELDS))
+_fields = [_people.c[field] for field in SEARCH_FIELDS]
+
+# Each row also stores its owner as a token ("u42"), so matching within one user
+# intersects two posting lists instead of filtering every user's matches. owner is
+# the last column so snippet() prefers a note when their hit counts tie.
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS PeopleSearch USING fts5("
+    f"{_columns}, owner, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS People_search_insert AFTER INSERT ON People BEGIN "
+    f"INSERT INTO PeopleSearch(rowid, {_columns}, owner) VALUES (new.person_id, {_new_values}, 'u' || new.user_id); END",
+    "CREATE TRIGGER IF NOT EXISTS People_search_delete AFTER DELETE ON People BEGIN "
+    "DELETE FROM PeopleSearch WHERE rowid = old.person_id; END",
+    f"CREATE TRIGGER IF NOT EXISTS People_search_update AFTER UPDATE OF user_id, {_columns} ON People BEGIN "
+    f"DELETE FROM PeopleSearch WHERE rowid = old.person_id; "
+    f"INSERT INTO PeopleSearch(rowid, {_columns}, owner) VALUES (new.person_id, {_new_values}, 'u' || new.user_id); END",
+]
+
+
+def install(table):
+    # Creates the SQLite index along with the People table under create_all();
+    # existing databases get it from the migration
+    for statement in SQLITE_DDL:
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    # and drops it with the table under drop_all(), or a recreated table would clash with its old rows
+    event.listen(table, 'after_drop', DDL('DROP TABLE IF EXISTS PeopleSearch').execute_if(dialect='sqlite'))
+
+
+def search(session, user_id, query, limit=MAX_RESULTS):
+    # Best matches first, as dicts with person_id, name and an HTML snippet
+    terms = _TERM.findall(query.lower())
+    if not terms:
+        return []
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return _search_sqlite(session, user_id, terms, limit)
+    if dialect == 'mysql':
+        return _search_mysql(session, user_id, terms, limit)
+    if dialect == 'postgresql':
+        return _search_postgresql(session, user_id, terms, limit)
+    return _search_like(session, user_id, terms, limit)
+
+
+def _search_sqlite(session, user_id, terms, limit):
+    # every term must match, the last one as a prefix so results show up while typing
+    match = f'owner:u{int(user_id)} AND {{{" ".join(SEARCH_FIELDS)}}} : ({" ".join(_fts5_terms(terms))})'
+    rows = session.execute(text(
+        "SELECT PeopleSearch.rowid, PeopleSearch.name, "
+        f"snippet(PeopleSearch, -1, '{_OPEN}', '{_CLOSE}', '…', {SNIPPET_WORDS}) "
+        f"FROM PeopleSearch WHERE PeopleSearch MATCH :match ORDER BY bm25(PeopleSearch, {_WEIGHTS}) LIMIT :limit"
+    ), {'match': match, 'limit': limit})
+    return [{'person_id': person_id, 'name': name, 'snippet': _marked(snippet)} for person_id, name, snippet in rows]
+
+
+def _search_mysql(session, user_id, terms, limit):
+    rows = session.execute(text(
+        f"SELECT person_id, {_columns}, MATCH({_columns}) AGAINST(:match IN BOOLEAN MODE) AS score "
+        f"FROM People WHERE user_id = :user_id AND MATCH({_columns}) AGAINST(:match IN BOOLEAN MODE) "
+        "ORDER BY score DESC LIMIT :limit"
+    ), {'match': ' '.join(f'+{term}' for term in terms[:-1]) + f' +{terms[-1]}*', 'user_id': user_id, 'limit': limit})
+    return _with_snippets(rows, terms)
+
+
+def _search_postgresql(session, user_id, terms, limit):
+    # 'simple' keeps words as they are, like the other backends
+    document = func.to_tsvector('simple', func.concat_ws(' ', *_fields))
+    query = func.to_tsquery('simple', ' & '.join(terms[:-1] + [f'{terms[-1]}:*']))
+    rows = session.execute(
+        select(_people.c.person_id, *_fields)
+        .where(_people.c.user_id == user_id, document.op('@@')(query))
+        .order_by(func.ts_rank(document, query).desc())
+        .limit(limit)
+    )
+    return _with_snippets(rows, terms)
+
+
+def _search_like(session, user_id, terms, limit):
+    # Every term inside one of the fields; unranked, by name
+    def contains(field, term):
+        return field.ilike('%' + term.replace('_', '\\_') + '%', escape='\\')
+
+    rows = session.execute(
+        select(_people.c.person_id, *_fields)
+        .where(_people.c.user_id == user_id, and_(*(or_(*(contains(field, term) for field in _fields)) for term in terms)))
+        .order_by(_people.c.name, _people.c.person_id)
+        .limit(limit)
+    )
+    return _with_snippets(rows, terms)
+
+
+def _with_snippets(rows, terms):
+    # rows start with person_id and the SEARCH_FIELDS
+    return [
+        {'person_id': row[0], 'name': row[1], 'snippet': _marked(make_snippet(row[1:len(SEARCH_FIELDS) + 1], terms))}
+        for row in rows
+    ]
+
+
+def _fts5_terms(terms):
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return quoted
+
+
+def make_snippet(texts, terms):
+    # The words around the first hit in the first field that has one, like FTS5's snippet()
+    for value in texts:
+        if not value:
+            continue
+        words = value.split()
+        for i, word in enumerate(words):
+            if _matches(word, terms):
+                start = max(0, i - SNIPPET_WORDS // 2)
+                window = words[start:start + SNIPPET_WORDS]
+                marked = [f'{_OPEN}{w}{_CLOSE}' if _matches(w, terms) else w for w in window]
+                return ('…' if start else '') + ' '.join(marked) + ('…' if start + SNIPPET_WORDS < len(words) else '')
+    return ''
+
+
+def _matches(word, terms):
+    tokens = _TERM.findall(word.lower())
+    return any(token == term or (term == terms[-1] and token.startswith(term)) for token in tokens for term in terms)
+
+
+def _marked(snippet):
+    return Markup(str(escape(snippet or '')).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
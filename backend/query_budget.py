@@ -0,0 +1,83 @@
+# Counts SQL statements per request and checks them against per-route budgets.
+#
+#   @app.route('/group/<int:group_id>')
+#   @max_queries(2)
+#   def view_group(group_id): ...
+#
+# Over budget, a route logs a warning, or raises QueryBudgetExceeded when
+# QUERY_BUDGET_STRICT is set (it defaults to on under app.testing), so tests fail
+# as soon as a change sneaks an N+1 query into a page. count_queries() and
+# assert_max_queries() do the same for arbitrary blocks of code.
+import contextlib
+import logging
+import threading
+
+from flask import g, has_app_context, request
+
+import server_config
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def max_queries(limit):
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def init_app(app):
+    # the statements of every request, whichever app's engine runs them
+    server_config.listen_on_every_engine({'before_cursor_execute': _count_query})
+
+    @app.before_request
+    def start_counting():
+        g.sql_statements = []
+
+    @app.after_request
+    def check_budget(response):
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        # popped, so the 500 response for a QueryBudgetExceeded is not checked (and raised) again
+        statements = g.pop('sql_statements', [])
+        if budget is not None and len(statements) > budget:
+            message = f"{request.endpoint} ran {len(statements)} queries, its budget is {budget}"
+            if app.config.get('QUERY_BUDGET_STRICT', app.testing):
+                raise QueryBudgetExceeded(message + ':\n' + '\n'.join(statements))
+            logger.warning(message)
+        return response
+
+
+@contextlib.contextmanager
+def count_queries():
+    # Collects the statements run on this thread inside the block
+    statements = []
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    counters.append(statements)
+    try:
+        yield statements
+    finally:
+        counters.remove(statements)
+
+
+@contextlib.contextmanager
+def assert_max_queries(max_queries):
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > max_queries:
+        raise QueryBudgetExceeded(f"{len(statements)} queries, expected at most {max_queries}:\n" + '\n'.join(statements))
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for statements in getattr(_local, 'counters', ()):
+        statements.append(statement)
+    if has_app_context() and 'sql_statements' in g:
+        g.sql_statements.append(statement)
@@ -0,0 +1,105 @@
+# Process model settings, from the environment. wsgi.py serves the app with
+# waitress_options(); main.py sizes the SQLAlchemy pool with engine_options() so
+# every request thread and calendar worker can hold a connection at once instead
+# of queueing for one.
+#
+#   WAITRESS_THREADS           request threads (8)
+#   WAITRESS_CONNECTION_LIMIT  open client connections before new ones wait (100)
+#   WAITRESS_BACKLOG           listen() backlog (1024)
+#   WAITRESS_CHANNEL_TIMEOUT   seconds an idle keep-alive connection is kept (60)
+#   DB_POOL_SIZE               pooled connections (threads + calendar workers)
+#   DB_MAX_OVERFLOW            extra connections under bursts (10)
+#   DB_POOL_TIMEOUT            seconds to wait for a free connection (10)
+#   DB_POOL_RECYCLE            reconnect connections older than this, in seconds
+#   DB_POOL_PRE_PING           check connections on checkout (off)
+#
+# The per-app settings read through setting() (session store, credential store,
+# cert cache) can also be given in the app's config, which wins over the
+# environment; tests use that to give each app its own stores.
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+
+def setting(app, name, default=None):
+    value = app.config.get(name)
+    if value is None:
+        value = os.getenv(name, default)
+    return value
+
+
+def private_file(path):
+    # Creates path readable by its owner only, or takes other users' access away from an
+    # existing one; for the SQLite files holding OAuth tokens or session ids. SQLite gives
+    # the -wal and -shm files it creates next to it the same mode.
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    for name in (path, f'{path}-wal', f'{path}-shm'):
+        if os.path.exists(name):
+            os.chmod(name, 0o600)
+
+
+class SQLiteConnections:
+    # One connection per thread to a SQLite file shared by the processes on a host, for
+    # the stores that live next to the app (sessions, credentials, page versions).
+    # pragmas run on every new connection.
+    def __init__(self, path, pragmas=()):
+        self.path = path
+        self.pragmas = pragmas
+        self._local = threading.local()
+
+    def get(self):
+        # a connection opened before a fork belongs to the parent; open a new one in the child
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=10)
+            self._local.pid = os.getpid()
+            for pragma in self.pragmas:
+                connection.execute(pragma)
+        return connection
+
+
+def listen_on_every_engine(listeners):
+    # {event name: function} on the Engine class, so on the engine of every app; for the
+    # init_app() of modules that see every statement (metrics, query_budget). Only the
+    # first call registers them: a second app would otherwise run each one twice per statement.
+    for identifier, function in listeners.items():
+        if not event.contains(Engine, identifier, function):
+            event.listen(Engine, identifier, function)
+
+
+def threads():
+    return int(os.getenv('WAITRESS_THREADS', 8))
+
+
+def calendar_workers():
+    return int(os.getenv('CALENDAR_WORKERS', 4))
+
+
+def waitress_options():
+    return {
+        'host': os.getenv('HOST', '0.0.0.0'),
+        'port': int(os.getenv('PORT', 3000)),
+        'threads': threads(),
+        'connection_limit': int(os.getenv('WAITRESS_CONNECTION_LIMIT', 100)),
+        'backlog': int(os.getenv('WAITRESS_BACKLOG', 1024)),
+        'channel_timeout': int(os.getenv('WAITRESS_CHANNEL_TIMEOUT', 60)),
+    }
+
+
+def engine_options(uri):
+    url = make_url(uri) if uri else None
+    if url is None or (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        # Flask-SQLAlchemy gives in-memory SQLite a StaticPool, which takes no sizing
+        return {}
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', threads() + calendar_workers())),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '') not in ('', '0', 'false'),
+    }
+    if os.getenv('DB_POOL_RECYCLE'):
+        options['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE'))
+    return options
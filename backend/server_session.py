@@ -0,0 +1,260 @@
+# Server-side sessions: the browser only holds a random session id, the data lives
+# in a SessionStore. Flask's default cookie session sends (and re-verifies the
+# signature of) everything in the session, OAuth credentials included, with every
+# request; here a request carries a 43 character id and reads one small record.
+# The OAuth credentials themselves are not in the session at all, they live in the
+# credential store (see credential_manager.py).
+import abc
+import collections
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import server_config
+
+_serializer = TaggedJSONSerializer()
+
+
+class SessionStore(abc.ABC):
+    # get() returns (data, expires) or None; data is the serialized session
+    @abc.abstractmethod
+    def get(self, key):
+        pass
+
+    @abc.abstractmethod
+    def set(self, key, data, expires):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    # Bounded LRU; sessions are lost on restart and not shared between processes
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, data, expires):
+        with self._lock:
+            self._entries[key] = (data, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteSessionStore(SessionStore):
+    # A local SQLite file, shared by every process on the host and kept across restarts
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._connections = server_config.SQLiteConnections(path, ['PRAGMA synchronous=NORMAL'])
+        self._writes = 0
+        # the keys are session ids: reading one is enough to be logged in as its user
+        server_config.private_file(path)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)')
+
+    def _connect(self):
+        return self._connections.get()
+
+    def get(self, key):
+        row = self._connect().execute('SELECT data, expires FROM sessions WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row
+
+    def set(self, key, data, expires):
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO sessions (key, data, expires) VALUES (?, ?, ?)', (key, data, expires))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                connection.execute('DELETE FROM sessions WHERE expires < ?', (time.time(),))
+
+    def delete(self, key):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM sessions WHERE key = ?', (key,))
+
+    def data_version(self):
+        # changes whenever another connection, in this process or another, commits to the file
+        return self._connect().execute('PRAGMA data_version').fetchone()[0]
+
+
+class CachedSessionStore(SessionStore):
+    # An in-memory LRU in front of a SQLiteSessionStore. Writes go to both. Before every
+    # read the cache asks SQLite whether anything else wrote to the file since it last
+    # looked, and starts over if so, so a session that another worker (WSGI_PROCESSES)
+    # or another thread logged out or rotated is not served from here. Reads between
+    # writes, the common case, still skip the SELECT.
+    def __init__(self, backend, max_entries=10000):
+        self.backend = backend
+        self.cache = MemorySessionStore(max_entries)
+        # data_version is per connection, and the backend has one per thread
+        self._local = threading.local()
+
+    def get(self, key):
+        # with the pid, since a forked worker starts with its parent's cache and a new connection
+        version = (os.getpid(), self.backend.data_version())
+        if getattr(self._local, 'version', None) != version:
+            self.cache.clear()
+            self._local.version = version
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.cache.set(key, *entry)
+        return entry
+
+    def set(self, key, data, expires):
+        self.backend.set(key, data, expires)
+        self.cache.set(key, data, expires)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        self.cache.delete(key)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, store, sid=None, initial=None, expires=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.store = store
+        self.sid = sid
+        self.new = sid is None
+        self.expires = expires
+        self.modified = False
+        self.accessed = False
+        self.old_sid = None
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def regenerate(self):
+        # A new id for the same data; call on login so a session id planted before
+        # authentication is worthless afterwards
+        if not self.new:
+            self.old_sid = self.old_sid or self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    # Sessions in use are written again at most this often to push their expiry back,
+    # so they do not expire while reads still do not write every time
+    REFRESH_AFTER = 24 * 60 * 60
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.get(sid)
+            if entry is not None:
+                data, expires = entry
+                return ServerSession(self.store, sid, _serializer.loads(data), expires)
+        return ServerSession(self.store)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.old_sid:
+            self.store.delete(session.old_sid)
+
+        if not session:
+            if session.sid and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        expires = time.time() + app.permanent_session_lifetime.total_seconds()
+        if session.expires is not None and session.expires < expires - self.REFRESH_AFTER:
+            session.modified = True
+        if session.modified:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            self.store.set(session.sid, _serializer.dumps(dict(session)), expires)
+
+        if self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add('Cookie')
+
+
+def regenerate(session):
+    # No-op for Flask's cookie sessions, whose contents are all client side anyway
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+def init_app(app):
+    # SESSION_BACKEND=cookie keeps Flask's signed cookie sessions
+    backend = server_config.setting(app, 'SESSION_BACKEND', 'sqlite')
+    if backend == 'cookie':
+        return
+    cache_size = int(server_config.setting(app, 'SESSION_CACHE_SIZE', 10000))
+    if backend == 'memory':
+        store = MemorySessionStore(cache_size)
+    elif backend == 'sqlite':
+        path = server_config.setting(app, 'SESSION_SQLITE_PATH') or os.path.join(app.instance_path, 'sessions.sqlite3')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        store = SQLiteSessionStore(path)
+        if cache_size:
+            store = CachedSessionStore(store, cache_size)
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    app.session_interface = ServerSessionInterface(store)
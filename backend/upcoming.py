@@ -0,0 +1,102 @@
+# Upcoming birthdays and anniversaries, worked out from the database instead of
+# asking Google Calendar on every page view.
+# People store each date's month and day as one number, MMDD (0101-1231), next to
+# the date itself. MMDD sorts in calendar order whatever the year, so "the next N
+# days" is a BETWEEN on an indexed column, or, when the window runs past New Year,
+# two: today's MMDD to 1231 and 0101 to the last day.
+import calendar
+import collections
+import datetime
+import threading
+
+from sqlalchemy import literal, select, union_all
+
+MAX_DAYS = 366
+CACHE_SIZE = 1024
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def month_day(date):
+    return date and date.month * 100 + date.day
+
+
+def month_day_ranges(start, days):
+    # (first, last) MMDD ranges covering the days from start on, inclusive: one range,
+    # or two when the window runs past December 31st
+    end = start + datetime.timedelta(days=days)
+    first, last = month_day(start), month_day(end)
+    if last == 228 and not calendar.isleap(end.year):
+        # February 29th birthdays are celebrated on the 28th
+        last = 229
+    if days >= 365:
+        return [(101, 1231)]
+    if first <= last:
+        return [(first, last)]
+    return [(first, 1231), (101, last)]
+
+
+def upcoming_query(person, user_id, start, days):
+    # One statement for both kinds of date, each part a range seek on a (user_id, MMDD) index
+    selects = []
+    for kind, date_column, day_column, title in (
+        ('birthday', person.birthday, person.birthday_day, literal(None)),
+        ('anniversary', person.anniversary_date, person.anniversary_day, person.anniversary_title),
+    ):
+        for first, last in month_day_ranges(start, days):
+            selects.append(
+                select(person.person_id, person.name, literal(kind).label('kind'), date_column.label('date'), title.label('title'))
+                .where(person.user_id == user_id, day_column.between(first, last))
+            )
+    return union_all(*selects)
+
+
+def next_occurrence(date, start):
+    # The first anniversary of date on or after start; February 29th falls on the 28th in other years
+    for year in (start.year, start.year + 1):
+        try:
+            occurrence = date.replace(year=year)
+        except ValueError:
+            occurrence = datetime.date(year, 2, 28)
+        if occurrence >= start:
+            return occurrence
+
+
+def upcoming_events(session, person, user_id, start, days):
+    events = []
+    for person_id, name, kind, date, title in session.execute(upcoming_query(person, user_id, start, days)):
+        occurrence = next_occurrence(date, start)
+        events.append({
+            'person_id': person_id,
+            'name': name,
+            'kind': kind,
+            'title': title or ('Birthday' if kind == 'birthday' else 'Anniversary'),
+            'date': occurrence,
+            'days_away': (occurrence - start).days,
+            'years': occurrence.year - date.year,
+        })
+    events.sort(key=lambda event: (event['date'], event['name']))
+    return events
+
+
+def cached_upcoming_events(session, person, user_id, start, days, version):
+    # Per-process cache keyed by database and user. An entry is only good for the day it was
+    # computed on and for the user's version, which page_cache keeps where every process
+    # sees it, so an edit in one worker is seen by all; no version means no caching.
+    if version is None:
+        return upcoming_events(session, person, user_id, start, days)
+    key = (session.get_bind(), user_id, days)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[:2] == (start, version):
+            _cache.move_to_end(key)
+            return cached[2]
+    # the caller read version before this query, so a result from before an edit is stored under the old one
+    events = upcoming_events(session, person, user_id, start, days)
+    with _cache_lock:
+        _cache[key] = (start, version, events)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return events
@@ -0,0 +1,107 @@
+# Production entry point: the app under waitress, with the background workers
+# (credential refresher, calendar job queue) started next to it. Threads,
+# connection limits and the database pool come from the environment, see
+# server_config.py. Tables are not created here; set up a new database once with
+# `flask --app main init-db` and apply schema changes with `flask --app main db upgrade`
+# before starting the new version.
+#
+#   python wsgi.py
+#
+# With WSGI_PROCESSES=N the parent binds the socket, builds and preloads the app
+# (main.preload_app(); WSGI_PRELOAD=0 turns that off) and forks N workers that
+# serve it, each with its own threads, pool and background workers. Preloaded
+# pages are shared copy-on-write between them. The parent restarts workers that
+# die and passes SIGTERM/SIGINT on. Prefork servers that load a factory work too,
+# e.g. `gunicorn --preload 'main:create_app()'`.
+#
+# Load balancers should send traffic once /ready answers 200 and use /healthz for liveness.
+import logging
+import os
+import signal
+import socket
+import sys
+
+from waitress import serve
+
+import server_config
+from main import after_fork, create_app, preload_app
+
+logger = logging.getLogger(__name__)
+
+
+def start_workers(app):
+    app.extensions['google_credentials'].start()
+    app.extensions['calendar_queue'].start(app, workers=server_config.calendar_workers())
+
+
+def listen(options):
+    sock = socket.socket(socket.AF_INET6 if ':' in options['host'] else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((options['host'], options['port']))
+    sock.listen(options['backlog'])
+    return sock
+
+
+def serve_worker(app, sock, options):
+    after_fork(app)
+    start_workers(app)
+    serve(
+        app, sockets=[sock], threads=options['threads'],
+        connection_limit=options['connection_limit'], channel_timeout=options['channel_timeout'],
+    )
+
+
+def fork_worker(app, sock, options):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            serve_worker(app, sock, options)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def serve_forked(app, processes, options):
+    sock = listen(options)
+    if os.getenv('WSGI_PRELOAD', '1') not in ('0', 'false'):
+        preload_app(app)
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(processes):
+        workers.add(fork_worker(app, sock, options))
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning("Worker %s exited with status %s, starting another", pid, status)
+            workers.add(fork_worker(app, sock, options))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    app = create_app()
+    options = server_config.waitress_options()
+    processes = int(os.getenv('WSGI_PROCESSES', 1))
+    logging.info(
+        "Serving on %s:%s, %s process(es) of %s threads, at most %s connections each",
+        options['host'], options['port'], processes, options['threads'], options['connection_limit'],
+    )
+    if processes > 1:
+        serve_forked(app, processes, options)
+    else:
+        start_workers(app)
+        serve(app, **options)
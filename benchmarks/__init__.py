@@ -0,0 +1,2 @@
+# Benchmarks of the backend. Most modules are scripts (python benchmarks/<name>.py);
+# the regression suite runs as a package: python -m benchmarks.suite
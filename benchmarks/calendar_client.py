@@ -0,0 +1,65 @@
+# Per-edit Google Calendar latency: build() on every call vs the cached clients in
+# backend/calendar_service.py, measured against the local fake Calendar server.
+#
+#   python benchmarks/calendar_client.py --edits 200 --latency 0.005
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+import calendar_service
+import fake_calendar
+
+
+def one_edit(get_service, credentials, day):
+    # What edit_person costs for one changed date: list + delete the old event, insert the new one
+    date = datetime.date(2000, 1, 1) + datetime.timedelta(days=day)
+    service = get_service(credentials)
+    for event in service.events().list(calendarId='primary', q='Birthday', timeMin=f'{date}T00:00:00Z', timeMax=f'{date}T23:59:59Z').execute().get('items', []):
+        service.events().delete(calendarId='primary', eventId=event['id']).execute()
+    service = get_service(credentials)
+    body = {'summary': 'Bench Birthday', 'start': {'date': date.isoformat()}, 'end': {'date': date.isoformat()}}
+    service.events().insert(calendarId='primary', body=body).execute()
+
+
+def run(name, get_service, credentials, edits):
+    timings = []
+    for i in range(edits):
+        start = time.perf_counter()
+        one_edit(get_service, credentials, i % 365)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{name:>10}: mean {statistics.mean(timings) * 1000:7.2f} ms  "
+          f"p50 {timings[len(timings) // 2] * 1000:7.2f} ms  p99 {timings[int(len(timings) * 0.99)] * 1000:7.2f} ms")
+    return statistics.mean(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edits', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated server latency in seconds')
+    args = parser.parse_args()
+
+    server = fake_calendar.make_server(port=0, latency=args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}/calendar/v3/'
+    os.environ['GOOGLE_CALENDAR_API_ENDPOINT'] = endpoint
+
+    credentials = Credentials(token='bench-token', refresh_token='bench-refresh', client_id='bench', client_secret='bench', token_uri='http://127.0.0.1/token')
+
+    def uncached(credentials):
+        return build('calendar', 'v3', credentials=credentials, client_options={'api_endpoint': endpoint})
+
+    calendar_service.load_discovery_document()
+    before = run('build()', uncached, credentials, args.edits)
+    after = run('cached', calendar_service.get_service, credentials, args.edits)
+    print(f"speedup: {before / after:.1f}x")
+    server.shutdown()
@@ -0,0 +1,125 @@
+# Seeded synthetic data: users, their groups and people, and memberships, at any
+# scale from a few thousand people to millions. The same arguments always give the
+# same rows. Sizes are skewed the way real address books are: a few users own most
+# of the people, and within a user a few groups hold most of the members (Zipf,
+# --skew), while every person is in one to three groups.
+#
+#   python -m benchmarks.dataset --people 1000000 --database /tmp/people.db
+import argparse
+import datetime
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+FIRST_NAMES = ['Ada', 'Bo', 'Cleo', 'Dev', 'Eli', 'Fatima', 'Gus', 'Hana', 'Ira', 'Jun', 'Kai', 'Lena', 'Mo', 'Noor', 'Oren', 'Pia']
+LAST_NAMES = ['Abara', 'Baptiste', 'Chen', 'Dubois', 'Eze', 'Fischer', 'Garcia', 'Haddad', 'Ivanova', 'Jensen', 'Kim', 'Lopez']
+WORDS = [
+    'tea', 'coffee', 'hiking', 'board games', 'jazz', 'cats', 'dogs', 'baking', 'cycling', 'poetry', 'sushi', 'chess',
+    'gardening', 'karaoke', 'running', 'films', 'pottery', 'climbing', 'podcasts', 'camping', 'knitting', 'travel',
+]
+RELATIONSHIPS = ['friend', 'cousin', 'coworker', 'neighbour', 'old roommate', 'partner', 'sibling', None]
+CHUNK_SIZE = 10000
+
+
+def zipf_weights(count, skew):
+    # cumulative weights of ranks 1..count under Zipf(skew)
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def person_row(rng, number, user_id):
+    row = {
+        'user_id': user_id,
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {number}',
+        'nickname': rng.choice(FIRST_NAMES).lower() if rng.random() < 0.3 else None,
+        'relationship': rng.choice(RELATIONSHIPS),
+        'birthday': datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randrange(365 * 55)) if rng.random() < 0.7 else None,
+        'anniversary_title': None,
+        'anniversary_date': None,
+        'likes': ', '.join(rng.sample(WORDS, 3)),
+        'dislikes': ', '.join(rng.sample(WORDS, 2)) if rng.random() < 0.5 else None,
+        'how_we_met': f'at a {rng.choice(WORDS)} meetup' if rng.random() < 0.6 else None,
+        'recent_updates': f'started {rng.choice(WORDS)}' if rng.random() < 0.4 else None,
+    }
+    if rng.random() < 0.2:
+        row['anniversary_title'] = f"{row['name']}'s anniversary"
+        row['anniversary_date'] = datetime.date(1980, 1, 1) + datetime.timedelta(days=rng.randrange(365 * 40))
+    return row
+
+
+def generate(app, people, users=10, groups=None, skew=1.1, seed=1):
+    # Fills the app's (empty) database; returns {user_id: [group ids]}
+    from sqlalchemy import insert
+
+    from models import db, group_members, Group, Person, User
+
+    rng = random.Random(seed)
+    groups = groups or max(users, people // 50)
+    user_weights = zipf_weights(users, skew)
+    # every user gets at least one group, the rest follow the same skew as people
+    group_owners = list(range(1, users + 1)) + rng.choices(range(1, users + 1), cum_weights=user_weights, k=groups - users)
+    groups_of = {user_id: [] for user_id in range(1, users + 1)}
+    for group_id, user_id in enumerate(sorted(group_owners), start=1):
+        groups_of[user_id].append(group_id)
+    group_weights = {user_id: zipf_weights(len(ids), skew) for user_id, ids in groups_of.items()}
+
+    with app.app_context():
+        db.session.execute(insert(User), [
+            # no password, the suite logs in through the session
+            {'user_id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com', 'password': '!'}
+            for user_id in range(1, users + 1)
+        ])
+        db.session.execute(insert(Group), [
+            {'group_id': group_id, 'user_id': user_id, 'group_name': f'group {group_id}'}
+            for user_id, ids in groups_of.items() for group_id in ids
+        ])
+        for start in range(0, people, CHUNK_SIZE):
+            numbers = range(start, min(start + CHUNK_SIZE, people))
+            owners = rng.choices(range(1, users + 1), cum_weights=user_weights, k=len(numbers))
+            rows, memberships = [], []
+            for number, user_id in zip(numbers, owners):
+                row = person_row(rng, number, user_id)
+                row['person_id'] = number + 1
+                row.update(Person.month_day_columns(row))
+                rows.append(row)
+                # one to three groups, weighted towards the user's big ones
+                picks = rng.choices(groups_of[user_id], cum_weights=group_weights[user_id], k=rng.choice((1, 1, 1, 2, 2, 3)))
+                memberships.extend({'person_id': number + 1, 'group_id': group_id} for group_id in set(picks))
+            db.session.execute(insert(Person), rows)
+            db.session.execute(insert(group_members), memberships)
+        db.session.commit()
+    return groups_of
+
+
+def create_database(path, people, users=10, groups=None, skew=1.1, seed=1):
+    # A new SQLite file at path with the schema at the latest migration and the data in it
+    from main import create_app, create_schema
+
+    if os.path.exists(path):
+        os.remove(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'SESSION_BACKEND': 'memory', 'PAGE_CACHE_BACKEND': 'off'})
+    with app.app_context():
+        # what `flask init-db` does
+        create_schema()
+    return generate(app, people, users, groups, skew, seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--people', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--groups', type=int, help='groups across all users (people / 50)')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of people per user and members per group')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', required=True, help='SQLite file to create')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    groups_of = create_database(args.database, args.people, args.users, args.groups, args.skew, args.seed)
+    print(
+        f"{args.people} people, {args.users} users, {sum(map(len, groups_of.values()))} groups "
+        f"in {args.database} ({time.perf_counter() - start:.1f}s)"
+    )
@@ -0,0 +1,61 @@
+# Checks with EXPLAIN that the hot lookups use an index instead of scanning a table.
+# Runs against an in-memory SQLite database by default, or any DATABASE_URI, e.g. a
+# local MySQL container (the schema must already be migrated there):
+#
+#   python benchmarks/explain_indexes.py
+#   DATABASE_URI=mysql+pymysql://root:pw@127.0.0.1/main_database python benchmarks/explain_indexes.py
+#
+# Exits non-zero if any query scans. On SQLite, tests/test_indexes.py checks the same
+# lookups, and which index each one uses, on every test run.
+import os
+import sys
+
+os.environ.setdefault('DATABASE_URI', 'sqlite://')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import text
+
+from main import create_app
+from models import db, Group, Person, group_members
+
+app = create_app()
+
+
+def hot_queries():
+    yield 'add_member: person by name', Person.query.filter_by(name='Ada', user_id=1)
+    yield 'base: groups of a user', Group.for_user(1).filter(Group.group_id > 0).order_by(Group.group_id).limit(101)
+    yield 'view_group: members of a group', Person.members_of(1).filter(group_members.c.person_id > 0).order_by(group_members.c.person_id).limit(101)
+    yield 'groups of a person', db.session.query(group_members.c.group_id).filter(group_members.c.person_id == 1)
+
+
+def compile_query(query):
+    return str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+
+
+def scans(sql):
+    # Returns the plan lines and the names of tables that are read without an index
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        plan = [row[-1] for row in rows]
+        return plan, [line.split()[1] for line in plan if line.startswith('SCAN') and 'USING' not in line]
+    if dialect == 'mysql':
+        rows = db.session.execute(text('EXPLAIN ' + sql)).mappings().all()
+        plan = [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+        return plan, [row['table'] for row in rows if row['type'] == 'ALL']
+    raise SystemExit(f"EXPLAIN checks are not written for {dialect}")
+
+
+if __name__ == '__main__':
+    failed = False
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        for name, query in hot_queries():
+            plan, scanned = scans(compile_query(query))
+            status = 'FAIL' if scanned else 'ok'
+            failed = failed or bool(scanned)
+            print(f"[{status}] {name}")
+            for line in plan:
+                print(f"       {line}")
+    sys.exit(1 if failed else 0)
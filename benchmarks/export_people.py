@@ -0,0 +1,103 @@
+# Throughput and memory of /export for one user with many people, against an
+# SQLite file, next to loading the same data the way /users does.
+#
+#   python benchmarks/export_people.py --people 100000 --format csv
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DATABASE = os.path.join(tempfile.gettempdir(), 'character_sheets_export_bench.db')
+os.environ.setdefault('DATABASE_URI', f'sqlite:///{DATABASE}')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert
+
+from main import create_app
+from models import db, group_members, Group, Person, User
+
+app = create_app()
+
+
+def seed(people, groups):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='bench', email='bench@example.com', password='x'))
+        db.session.execute(insert(Group), [{'user_id': 1, 'group_name': f'group {i}'} for i in range(groups)])
+        for start in range(0, people, 10000):
+            rows = range(start, min(start + 10000, people))
+            db.session.execute(insert(Person), [
+                {
+                    'user_id': 1, 'name': f'person {i}', 'nickname': f'p{i}',
+                    'birthday': datetime.date(1990, 1, 1) + datetime.timedelta(days=i % 3650),
+                    'likes': 'tea, long walks and board games', 'how_we_met': 'at a friend of a friend\'s party',
+                } for i in rows
+            ])
+            # everyone is in one or two groups
+            db.session.execute(insert(group_members), [
+                {'person_id': i + 1, 'group_id': group + 1}
+                for i in rows for group in {i % groups, (i * 7) % groups}
+            ])
+        db.session.commit()
+
+
+def export(fmt, trace_memory):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bench'
+        session['user_id'] = 1
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(f'/export?format={fmt}', buffered=False)
+    size = lines = 0
+    for chunk in response.response:
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    response.close()
+    return elapsed, size, lines, peak
+
+
+def load_everything():
+    # What /users does: every person as an ORM object, with their groups
+    with app.app_context():
+        tracemalloc.start()
+        start = time.perf_counter()
+        people = Person.with_groups().filter_by(user_id=1).all()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        count = len(people)
+        db.session.remove()
+    return elapsed, count, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--people', type=int, default=100000)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed(args.people, args.groups)
+    print(f"seeded {args.people} people in {time.perf_counter() - start:.1f}s")
+
+    # tracemalloc slows everything down, so time and memory are measured in separate runs
+    elapsed, size, lines, _ = export(args.format, trace_memory=False)
+    _, _, _, peak = export(args.format, trace_memory=True)
+    print(
+        f"/export?format={args.format}: {lines} lines, {size / 1e6:.1f} MB in {elapsed:.2f}s, "
+        f"{args.people / elapsed:,.0f} people/s, peak Python memory {peak / 1e6:.1f} MB"
+    )
+    elapsed, count, peak = load_everything()
+    print(f"loading all {count} people with their groups: {elapsed:.2f}s, peak Python memory {peak / 1e6:.1f} MB")
+    os.remove(DATABASE)
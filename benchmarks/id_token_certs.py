@@ -0,0 +1,142 @@
+# Login-time ID token verification against a local stand-in for Google's cert
+# endpoint: a new cachecontrol session per login (what callback() used to do) vs
+# the shared cache in backend/google_certs.py. Also checks that the cache honours
+# max-age, picks up rotated keys and survives a restart through its file.
+#
+#   python benchmarks/id_token_certs.py --logins 200 --latency 0.05
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import rsa
+from google.auth import crypt, jwt
+
+import google_certs
+
+CLIENT_ID = 'bench.apps.googleusercontent.com'
+
+
+class CertServer(ThreadingHTTPServer):
+    def __init__(self, latency, max_age):
+        super().__init__(('127.0.0.1', 0), CertHandler)
+        self.latency = latency
+        self.max_age = max_age
+        self.requests = 0
+        self.keys = {}
+        self.rotate()
+
+    def rotate(self):
+        # a new signing key, served next to the previous one like Google does
+        public, private = rsa.newkeys(1024)
+        kid = f'key{len(self.keys) + 1}'
+        self.keys = dict(list(self.keys.items())[-1:], **{kid: (public, private)})
+        self.current = kid
+
+    def sign(self, **claims):
+        now = int(time.time())
+        payload = dict({'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'sub': '42', 'email': 'someone@example.com',
+                        'iat': now, 'exp': now + 3600}, **claims)
+        private = self.keys[self.current][1]
+        signer = crypt.RSASigner.from_string(private.save_pkcs1().decode(), key_id=self.current)
+        return jwt.encode(signer, payload).decode()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/oauth2/v1/certs'
+
+
+class CertHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        time.sleep(server.latency)
+        body = json.dumps({kid: public.save_pkcs1().decode() for kid, (public, _) in server.keys.items()}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', f'public, max-age={server.max_age}, must-revalidate, no-transform')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def old_verify(token, url):
+    # callback() before: a fresh cachecontrol session for every login
+    import google.auth.transport.requests
+    import requests
+    from google.oauth2 import id_token
+    from pip._vendor import cachecontrol
+    request = google.auth.transport.requests.Request(session=cachecontrol.CacheControl(requests.session()))
+    return id_token.verify_token(token, request, audience=CLIENT_ID, certs_url=url)
+
+
+def timed(label, verify, tokens):
+    start = time.perf_counter()
+    for token in tokens:
+        assert verify(token)['sub'] == '42'
+    elapsed = time.perf_counter() - start
+    print(f"{label:<26} {elapsed / len(tokens) * 1000:7.2f} ms per login")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the cert server takes to answer')
+    args = parser.parse_args()
+
+    server = CertServer(args.latency, max_age=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tokens = [server.sign() for _ in range(args.logins)]
+
+    server.requests = 0
+    timed('new cachecontrol session', lambda token: old_verify(token, server.url), tokens)
+    print(f"{'':<26} {server.requests} cert fetches")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'google_certs.json')
+        cache = google_certs.CertCache(server.url, path=path, min_refetch_interval=1)
+        server.requests = 0
+        timed('shared cert cache', lambda token: google_certs.verify_id_token(token, CLIENT_ID, cache), tokens)
+        print(f"{'':<26} {server.requests} cert fetches")
+
+        # concurrent logins on a cold cache fetch once
+        cache.clear()
+        server.requests = 0
+        threads = [threading.Thread(target=google_certs.verify_id_token, args=(tokens[0], CLIENT_ID, cache)) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"20 concurrent cold logins: {server.requests} cert fetch")
+
+        # a restart reads the file instead of fetching
+        server.requests = 0
+        restarted = google_certs.CertCache(server.url, path=path)
+        google_certs.verify_id_token(tokens[0], CLIENT_ID, restarted)
+        print(f"after a restart: {server.requests} cert fetches")
+
+        # max-age is honoured, and a token signed with a new key triggers a fetch
+        time.sleep(2.1)
+        google_certs.verify_id_token(tokens[0], CLIENT_ID, cache)
+        print(f"after max-age expired: {server.requests} cert fetch")
+        time.sleep(1.1)
+        server.rotate()
+        google_certs.verify_id_token(server.sign(), CLIENT_ID, cache)
+        print(f"after key rotation: {server.requests} cert fetches")
+
+        try:
+            google_certs.verify_id_token(server.sign(iss='https://evil.example.com'), CLIENT_ID, cache)
+        except Exception as e:
+            print(f"wrong issuer rejected: {e.__class__.__name__}")
+    server.shutdown()
@@ -0,0 +1,175 @@
+# Load test of the main pages under the production server (wsgi.py's waitress
+# settings), against a seeded SQLite file. Client threads keep their connections
+# open and loop over the routes for --seconds; reported per route are req/s, p50
+# and p99 latency and errors.
+#
+#   python benchmarks/load_test.py --clients 16 --seconds 20
+#   WAITRESS_THREADS=16 DB_POOL_SIZE=20 python benchmarks/load_test.py
+#
+# With --url it drives a server that is already running instead, logging in as
+# --email/--password.
+import argparse
+import datetime
+import http.client
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+DATABASE = os.path.join(tempfile.gettempdir(), 'character_sheets_load_test.db')
+
+ROUTES = [
+    ('base', '/'),
+    ('list_groups', '/api/groups'),
+    ('view_group', '/group/{group_id}'),
+    ('list_members', '/api/group/{group_id}/members'),
+    ('view_person', '/person/{person_id}'),
+    ('search', '/search?q={term}'),
+    ('calendar', '/calendar'),
+    ('ready', '/ready'),
+]
+TERMS = ['tea', 'walks', 'party', 'person', 'games']
+
+
+def seed(app, people, groups):
+    from sqlalchemy import insert
+    from main import create_schema
+    from models import db, group_members, Group, Person, User
+
+    with app.app_context():
+        # what `flask init-db` does
+        create_schema()
+        db.session.add(User(username='load', email='load@example.com', password='load'))
+        db.session.execute(insert(Group), [{'user_id': 1, 'group_name': f'group {i}'} for i in range(groups)])
+        for start in range(0, people, 10000):
+            rows = range(start, min(start + 10000, people))
+            values = []
+            for i in rows:
+                row = {
+                    'user_id': 1, 'name': f'person {i}', 'nickname': f'p{i}',
+                    'birthday': datetime.date(1990, 1, 1) + datetime.timedelta(days=i % 3650),
+                    'likes': 'tea, long walks and board games', 'how_we_met': 'at a friend of a friend\'s party',
+                }
+                row.update(Person.month_day_columns(row))
+                values.append(row)
+            db.session.execute(insert(Person), values)
+            db.session.execute(insert(group_members), [{'person_id': i + 1, 'group_id': i % groups + 1} for i in rows])
+        db.session.commit()
+    return 'load@example.com', 'load'
+
+
+def start_server(app):
+    from waitress import create_server
+
+    import server_config
+
+    options = dict(server_config.waitress_options(), host='127.0.0.1', port=0)
+    server = create_server(app, **options)
+    threading.Thread(target=server.run, daemon=True).start()
+    return f'http://127.0.0.1:{server.effective_port}', options
+
+
+def login(host, email, password):
+    connection = http.client.HTTPConnection(host)
+    body = urllib.parse.urlencode({'email': email, 'password': password})
+    connection.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        sys.exit(f"Could not log in as {email}: HTTP {response.status}")
+    return cookie.split(';', 1)[0]
+
+
+def client(host, cookie, people, groups, deadline, results):
+    connection = http.client.HTTPConnection(host, timeout=30)
+    headers = {'Cookie': cookie}
+    order = list(ROUTES)
+    random.shuffle(order)
+    while time.perf_counter() < deadline:
+        for name, path in order:
+            path = path.format(group_id=random.randint(1, groups), person_id=random.randint(1, people), term=random.choice(TERMS))
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(host, timeout=30)
+                ok = False
+            results[name].append((time.perf_counter() - start, ok))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--people', type=int, default=20000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--url', help='a running server to test instead of starting one')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    if args.url:
+        url, email, password = args.url, args.email, args.password
+        print(f"Testing {url}")
+    else:
+        if os.path.exists(DATABASE):
+            os.remove(DATABASE)
+        os.environ.setdefault('DATABASE_URI', f'sqlite:///{DATABASE}')
+        os.environ.setdefault('SECRET_KEY', 'load test')
+        os.environ.setdefault('SESSION_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'character_sheets_load_test_sessions.db'))
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+        from main import create_app
+        app = create_app()
+        email, password = seed(app, args.people, args.groups)
+        url, options = start_server(app)
+        print(
+            f"waitress: {options['threads']} threads, connection limit {options['connection_limit']}; "
+            f"{args.people} people in {args.groups} groups"
+        )
+
+    host = urllib.parse.urlsplit(url).netloc
+    cookie = login(host, email, password)
+    results = {name: [] for name, _ in ROUTES}
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=client, args=(host, cookie, args.people, args.groups, deadline, results))
+        for _ in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.clients} clients for {elapsed:.1f}s")
+    print(f"{'route':<14} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    everything = []
+    for name, _ in ROUTES:
+        samples = results[name]
+        if not samples:
+            continue
+        latencies = sorted(latency for latency, _ in samples)
+        everything.extend(latencies)
+        errors = sum(1 for _, ok in samples if not ok)
+        print(
+            f"{name:<14} {len(samples):>9} {len(samples) / elapsed:>8.1f} "
+            f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}"
+        )
+    everything.sort()
+    print(
+        f"{'all':<14} {len(everything):>9} {len(everything) / elapsed:>8.1f} "
+        f"{percentile(everything, 0.5) * 1000:>8.1f} {percentile(everything, 0.99) * 1000:>8.1f}"
+    )
@@ -0,0 +1,132 @@
+# Statements and commits per add_member / remove_member / delete_group, old
+# implementation vs current, and removing everyone through one /api/people/delete,
+# measured through the real routes with the Flask test client on SQLite.
+#
+#   python benchmarks/membership_ops.py --members 200
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask import redirect, request, url_for
+from sqlalchemy import bindparam, event
+
+from main import create_app
+from models import db, group_members, Group, Person, User
+from query_budget import count_queries
+
+app = create_app()
+
+
+def legacy_add_member(group_id):
+    # add_member before it was made a single transaction
+    name = request.form['name']
+    user_id = 1
+    group = Group.query.get(group_id)
+    existing_person = Person.query.filter_by(name=name, user_id=user_id).first()
+    if existing_person:
+        if existing_person not in group.people:
+            group.people.append(existing_person)
+            db.session.commit()
+        return redirect(url_for('groups.view_group', group_id=group_id))
+    new_person = Person(user_id=user_id, name=name)
+    db.session.add(new_person)
+    db.session.commit()
+    group.people.append(new_person)
+    db.session.commit()
+    return redirect(url_for('groups.view_group', group_id=group_id))
+
+
+def legacy_remove_member(group_id, person_id):
+    group = Group.query.get(group_id)
+    person = Person.query.get(person_id)
+    if person:
+        group.people.remove(person)
+        db.session.commit()
+        db.session.delete(person)
+        db.session.commit()
+    return redirect(url_for('groups.view_group', group_id=group_id))
+
+
+def legacy_delete_group(group_id):
+    # delete_group before ON DELETE CASCADE: what the ORM did, load every member and
+    # delete their GroupMembers rows one by one before the group
+    group = Group.query.get(group_id)
+    if group and group.user_id == 1:
+        members = group.people.all()
+        db.session.execute(
+            group_members.delete().where(group_members.c.group_id == group_id, group_members.c.person_id == bindparam('member')),
+            [{'member': person.person_id} for person in members],
+        )
+        db.session.delete(group)
+        db.session.commit()
+    return redirect(url_for('groups.base'))
+
+
+def measure(client, label, requests, json=None):
+    commits = 0
+
+    def count_commit(session):
+        nonlocal commits
+        commits += 1
+
+    event.listen(db.session, 'after_commit', count_commit)
+    start = time.perf_counter()
+    with count_queries() as statements:
+        for url, data in requests:
+            client.post(url, data=data, json=json)
+    elapsed = time.perf_counter() - start
+    event.remove(db.session, 'after_commit', count_commit)
+    n = len(requests)
+    print(f"{label:<34} {len(statements) / n:6.1f} statements  {commits / n:4.1f} commits  {elapsed / n * 1000:6.2f} ms per op")
+
+
+def run(members, legacy):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='bench', email='bench@example.com', password='x'))
+        # the groups point at the user, which the database checks
+        db.session.flush()
+        db.session.add(Group(user_id=1, group_name='bench'))
+        db.session.add(Group(user_id=1, group_name='other'))
+        db.session.add(Group(user_id=1, group_name='to delete'))
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bench'
+        session['user_id'] = 1
+
+    prefix = 'old' if legacy else 'new'
+    measure(client, f'{prefix} add_member (new person)', [('/group/1/add_member', {'name': f'p{i}'}) for i in range(members)])
+    measure(client, f'{prefix} add_member (existing person)', [('/group/2/add_member', {'name': f'p{i}'}) for i in range(members)])
+    measure(client, f'{prefix} add_member (already a member)', [('/group/2/add_member', {'name': f'p{i}'}) for i in range(members)])
+    # a group the size of the first, deleted in one request
+    for i in range(members):
+        client.post('/group/3/add_member', data={'name': f'p{i}'})
+    measure(client, f'{prefix} delete_group ({members} members)', [('/delete_group/3', {})])
+    if not legacy:
+        # the old remove_member fails on foreign keys for people that are in a second group
+        measure(client, f'{prefix} remove_member', [(f'/group/1/remove_member/{i}', {}) for i in range(1, members // 2 + 1)])
+        measure(client, f'{prefix} /api/people/delete ({members - members // 2})', [('/api/people/delete', None)], json={
+            'person_ids': list(range(members // 2 + 1, members + 1)),
+        })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=200)
+    args = parser.parse_args()
+
+    current = {name: app.view_functions[name] for name in ('groups.add_member', 'groups.remove_member', 'groups.delete_group')}
+    app.view_functions['groups.add_member'] = legacy_add_member
+    app.view_functions['groups.remove_member'] = legacy_remove_member
+    app.view_functions['groups.delete_group'] = legacy_delete_group
+    run(args.members, legacy=True)
+    app.view_functions.update(current)
+    run(args.members, legacy=False)
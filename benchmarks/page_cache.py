@@ -0,0 +1,84 @@
+# Repeat views of the group grid, a group's member list and a person's sheet with
+# backend/page_cache.py off, with its fragment cache, and as conditional requests
+# answered 304 from the ETag. Reports time and SQL statements per request.
+#
+#   python benchmarks/page_cache.py --requests 500 --groups 50 --members 50
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert
+
+from main import create_app
+from models import db, group_members, Group, Person, User
+from query_budget import count_queries
+
+PAGES = [('group grid', '/'), ('member list', '/group/1'), ('person sheet', '/person/1')]
+
+
+def make_app(name, backend, directory, groups, members):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, f'{name}.db')}",
+        'SESSION_BACKEND': 'memory',
+        'PAGE_CACHE_BACKEND': backend,
+        'PAGE_CACHE_VERSIONS_PATH': os.path.join(directory, f'{name}_versions.sqlite3'),
+        'CREDENTIALS_STORE_PATH': os.path.join(directory, 'credentials.sqlite3'),
+        'GOOGLE_CERTS_CACHE_PATH': '',
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', email='bench@example.com', password='bench'))
+        db.session.execute(insert(Group), [{'user_id': 1, 'group_name': f'group {i}'} for i in range(groups)])
+        people = []
+        for i in range(members):
+            row = {
+                'user_id': 1, 'name': f'person {i}', 'birthday': datetime.date(1990, 1, 1) + datetime.timedelta(days=i),
+                'likes': 'tea, long walks and board games', 'how_we_met': 'at a friend of a friend\'s party',
+            }
+            row.update(Person.month_day_columns(row))
+            people.append(row)
+        db.session.execute(insert(Person), people)
+        db.session.execute(insert(group_members), [{'person_id': i + 1, 'group_id': 1} for i in range(members)])
+        db.session.commit()
+    return app
+
+
+def measure(app, path, requests, conditional):
+    client = app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+    response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+    headers = {'If-None-Match': response.headers['ETag']} if conditional else {}
+    with count_queries() as statements:
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = client.get(path, headers=headers)
+        elapsed = time.perf_counter() - start
+    assert response.status_code == (304 if conditional else 200), (path, response.status_code)
+    return elapsed / requests * 1000, len(statements) / requests
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--groups', type=int, default=50, help='groups on the grid')
+    parser.add_argument('--members', type=int, default=50, help='members of the group')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        modes = [
+            ('no cache', make_app('off', 'off', directory, args.groups, args.members), False),
+            ('fragments', make_app('fragments', 'memory', directory, args.groups, args.members), False),
+            ('ETag 304', make_app('etag', 'memory', directory, args.groups, args.members), True),
+        ]
+        print(f"{'page':<14} {'mode':<10} {'ms/request':>10} {'queries':>8}")
+        for name, path in PAGES:
+            for mode, app, conditional in modes:
+                ms, queries = measure(app, path, args.requests, conditional)
+                print(f"{name:<14} {mode:<10} {ms:>10.3f} {queries:>8.1f}")
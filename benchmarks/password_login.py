@@ -0,0 +1,117 @@
+# Password logins under concurrent load, with scrypt in the request threads
+# (PASSWORD_HASH_WORKERS=0) and in backend/passwords.py's process pool. Client
+# threads POST /login for --seconds against waitress while another thread times
+# /healthz, to show what a burst of logins does to every other request. The pool
+# only beats the request threads with more than one core to spread hashes over.
+#
+#   python benchmarks/password_login.py --clients 16 --seconds 10
+import argparse
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from load_test import percentile, start_server
+
+
+def make_app(directory, workers, users):
+    from main import create_app
+    from models import db, User
+    import passwords
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, f'logins_{workers}.db')}",
+        'SECRET_KEY': 'benchmark',
+        'SESSION_BACKEND': 'memory',
+        'PAGE_CACHE_VERSIONS_PATH': os.path.join(directory, 'page_versions.sqlite3'),
+        'CREDENTIALS_STORE_PATH': os.path.join(directory, 'credentials.sqlite3'),
+        'GOOGLE_CERTS_CACHE_PATH': '',
+        'PASSWORD_HASH_WORKERS': workers,
+    })
+    # one hash for everyone, it is the checking that is measured
+    password_hash = passwords.PasswordHasher(method=app.extensions['password_hasher'].method, workers=0).hash('password')
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(User(username=f'user{i}', email=f'user{i}@example.com', password=password_hash) for i in range(users))
+        db.session.commit()
+    return app
+
+
+def log_in(host, users, deadline, results):
+    connection = http.client.HTTPConnection(host, timeout=60)
+    i = 0
+    while time.perf_counter() < deadline:
+        body = urllib.parse.urlencode({'email': f'user{i % users}@example.com', 'password': 'password'})
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 302 and response.getheader('Location', '').endswith('/base')
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(host, timeout=60)
+            ok = False
+        results.append((time.perf_counter() - start, ok))
+        i += 1
+
+
+def probe(host, deadline, latencies):
+    connection = http.client.HTTPConnection(host, timeout=60)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        connection.request('GET', '/healthz')
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+
+
+def run(app, clients, seconds, users):
+    url, _ = start_server(app)
+    host = urllib.parse.urlsplit(url).netloc
+    # start the pool's processes before the clock runs
+    log_in(host, users, time.perf_counter() + 0.5, [])
+    results, latencies = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=log_in, args=(host, users, deadline, results)) for _ in range(clients)]
+    threads.append(threading.Thread(target=probe, args=(host, deadline, latencies)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    logins = sorted(latency for latency, _ in results)
+    latencies.sort()
+    return {
+        'logins/s': len(results) / elapsed,
+        'login p50': percentile(logins, 0.5) * 1000,
+        'login p99': percentile(logins, 0.99) * 1000,
+        'failed': sum(1 for _, ok in results if not ok),
+        'healthz p50': percentile(latencies, 0.5) * 1000,
+        'healthz p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes in the pool')
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {os.cpu_count()} CPUs, waitress threads {os.getenv('WAITRESS_THREADS', 8)}")
+    print(f"{'hashing':<16} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7} {'healthz p50':>12} {'healthz p99':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, workers in (('request threads', 0), (f'pool of {args.workers}', args.workers)):
+            stats = run(make_app(directory, workers, args.users), args.clients, args.seconds, args.users)
+            print(
+                f"{label:<16} {stats['logins/s']:>9.1f} {stats['login p50']:>8.1f} {stats['login p99']:>8.1f} "
+                f"{stats['failed']:>7} {stats['healthz p50']:>12.1f} {stats['healthz p99']:>12.1f}"
+            )
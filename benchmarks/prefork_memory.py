@@ -0,0 +1,97 @@
+# Memory of wsgi.py's prefork mode, with and without main.preload_app() in the
+# parent. Starts WSGI_PROCESSES workers against a fresh SQLite file, warms each
+# one up with a few requests and reports the workers' PSS (their share of the
+# pages they use, shared ones split between the processes) and USS (pages only
+# they use) from /proc/<pid>/smaps_rollup. Linux only.
+#
+#   python benchmarks/prefork_memory.py --processes 4
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+PATHS = ['/healthz', '/ready', '/login', '/signup']
+
+
+def smaps_rollup(pid):
+    # {field: kB}
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"Server on port {port} did not become ready")
+
+
+def measure(directory, processes, preload, port, requests):
+    env = dict(
+        os.environ, DATABASE_URI=f"sqlite:///{os.path.join(directory, 'memory.db')}", SECRET_KEY='memory',
+        SESSION_SQLITE_PATH=os.path.join(directory, 'sessions.db'),
+        CREDENTIALS_STORE_PATH=os.path.join(directory, 'credentials.db'), GOOGLE_CERTS_CACHE_PATH='',
+        HOST='127.0.0.1', PORT=str(port), WSGI_PROCESSES=str(processes), WSGI_PRELOAD='1' if preload else '0',
+    )
+    server = subprocess.Popen([sys.executable, 'wsgi.py'], cwd=BACKEND, env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        # connections are spread over the workers by the kernel, so enough of them reach each one
+        for _ in range(requests):
+            for path in PATHS:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                connection.request('GET', path)
+                connection.getresponse().read()
+                connection.close()
+        workers = children(server.pid)
+        rollups = [smaps_rollup(pid) for pid in workers]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    pss = sum(rollup['Pss'] for rollup in rollups)
+    uss = sum(rollup['Private_Clean'] + rollup['Private_Dirty'] for rollup in rollups)
+    rss = sum(rollup['Rss'] for rollup in rollups)
+    return len(workers), pss, uss, rss
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50, help='rounds of requests to warm the workers up')
+    parser.add_argument('--port', type=int, default=3971)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'main', 'init-db'], cwd=BACKEND, check=True, capture_output=True,
+            env=dict(os.environ, DATABASE_URI=f"sqlite:///{os.path.join(directory, 'memory.db')}"),
+        )
+        print(f"{'mode':<12} {'workers':>7} {'PSS MiB':>8} {'USS MiB':>8} {'RSS MiB':>8} {'PSS/worker':>11}")
+        for preload in (False, True):
+            workers, pss, uss, rss = measure(directory, args.processes, preload, args.port, args.requests)
+            print(
+                f"{'preload' if preload else 'no preload':<12} {workers:>7} {pss / 1024:>8.1f} {uss / 1024:>8.1f} "
+                f"{rss / 1024:>8.1f} {pss / 1024 / max(workers, 1):>11.1f}"
+            )
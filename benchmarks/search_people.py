@@ -0,0 +1,95 @@
+# Latency of person_search.search() on SQLite FTS5 next to the LIKE '%term%' scan it
+# replaces, over generated notes spread across many users.
+#
+#   python benchmarks/search_people.py --people 1000000 --users 100
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DATABASE = os.path.join(tempfile.gettempdir(), 'character_sheets_search_bench.db')
+os.environ.setdefault('DATABASE_URI', f'sqlite:///{DATABASE}')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert, or_
+
+from main import create_app
+from models import db, Person, User
+import person_search
+
+app = create_app()
+
+WORDS = (
+    'tea coffee hiking climbing jazz opera gardening chess poker cooking baking sushi tacos ramen '
+    'dogs cats horses running cycling swimming painting pottery knitting reading poetry films '
+    'peanuts shellfish gluten dairy pollen penicillin birthday wedding graduation concert camping '
+    'beach mountains travel museum theatre podcasts football basketball tennis golf vinyl guitar'
+).split()
+QUERIES = ['jazz', 'peanuts', 'hiking mountains', 'pott', 'shellfish dairy', 'gradu', 'vinyl guitar jazz', 'nothingmatches']
+
+
+def note(rng, words):
+    # mostly a long tail of everyday words (Zipf-like), with the odd interest mixed in
+    return ' '.join(
+        rng.choice(WORDS) if rng.random() < 0.03 else f'word{int(rng.paretovariate(1.1)) % 50000}'
+        for _ in range(words)
+    )
+
+
+def seed(people, users):
+    rng = random.Random(42)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(User), [{'username': f'u{i}', 'email': f'u{i}@example.com', 'password': 'x'} for i in range(users)])
+        for start in range(0, people, 20000):
+            db.session.execute(insert(Person), [
+                {
+                    'user_id': i % users + 1, 'name': f'person {i}', 'likes': note(rng, 8), 'dislikes': note(rng, 6),
+                    'allergies': note(rng, 2), 'how_we_met': note(rng, 15), 'recent_updates': note(rng, 20),
+                } for i in range(start, min(start + 20000, people))
+            ])
+            db.session.commit()
+
+
+def like_search(user_id, query):
+    # the scan an ad hoc search would do without an index
+    fields = [getattr(Person, field) for field in person_search.SEARCH_FIELDS]
+    scan = Person.query.with_entities(Person.person_id).filter(Person.user_id == user_id)
+    for term in query.split():
+        scan = scan.filter(or_(*(field.like(f'%{term}%') for field in fields)))
+    return scan.limit(person_search.MAX_RESULTS).all()
+
+
+def timed(search, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        search()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99) - 1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--people', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed(args.people, args.users)
+    print(f"seeded {args.people} people for {args.users} users in {time.perf_counter() - start:.1f}s")
+
+    with app.app_context():
+        for query in QUERIES:
+            hits = len(person_search.search(db.session, 1, query))
+            p50, p99 = timed(lambda: person_search.search(db.session, 1, query), args.repeat)
+            like_p50, _ = timed(lambda: like_search(1, query), max(1, args.repeat // 20))
+            print(f"{query!r:<22} {hits:3d} hits  fts p50 {p50:6.2f} ms  p99 {p99:6.2f} ms   LIKE p50 {like_p50:8.2f} ms")
+    os.remove(DATABASE)
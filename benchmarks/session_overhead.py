@@ -0,0 +1,77 @@
+# Cookie size and per-request session cost of Flask's signed cookie sessions vs the
+# server-side stores in backend/server_session.py, for a user logged in with Google.
+#
+#   python benchmarks/session_overhead.py --requests 5000
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask import request
+from flask.sessions import SecureCookieSessionInterface
+
+from main import create_app
+import server_session
+
+app = create_app()
+
+# What callback() puts in the session; the tokens are in the credential store
+GOOGLE_LOGIN = {
+    'google_id': '1' * 21,
+    'email': 'someone@example.com',
+    'name': 'Some One',
+    'user_id': 1,
+    'username': 'Some One',
+    'google_calendar': True,
+}
+
+
+def measure(label, interface, requests):
+    app.session_interface = interface
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(GOOGLE_LOGIN)
+    cookie = client.get_cookie('session')
+    header = len(f'session={cookie.value}')
+
+    # /check_session reads user_id and username, like most pages
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get('/check_session')
+    elapsed = time.perf_counter() - start
+
+    # the session machinery alone: open, read what a page reads, save
+    start = time.perf_counter()
+    with app.test_request_context(headers={'Cookie': f'session={cookie.value}'}):
+        response = app.response_class()
+        for _ in range(requests):
+            session = interface.open_session(app, request)
+            session.get('user_id'), session.get('username')
+            interface.save_session(app, session, response)
+    overhead = time.perf_counter() - start
+    print(
+        f"{label:<22} Cookie header {header:5d} bytes  {elapsed / requests * 1e6:7.1f} us per request"
+        f"  {overhead / requests * 1e6:6.1f} us in open+save"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_store = server_session.SQLiteSessionStore(os.path.join(directory, 'sessions.sqlite3'))
+        measure('signed cookie', SecureCookieSessionInterface(), args.requests)
+        measure('memory', server_session.ServerSessionInterface(server_session.MemorySessionStore()), args.requests)
+        measure('sqlite', server_session.ServerSessionInterface(sqlite_store), args.requests)
+        measure(
+            'sqlite + memory LRU',
+            server_session.ServerSessionInterface(server_session.CachedSessionStore(sqlite_store)),
+            args.requests,
+        )
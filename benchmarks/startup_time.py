@@ -0,0 +1,102 @@
+# Cold start of the app: `import main; main.create_app()` in a fresh interpreter,
+# from a directory without credentials.json, timed with `python -X importtime`.
+# Flask and SQLAlchemy are timed on their own as well: they are most of the total
+# and how long they take depends on the machine, so the budget is for the rest,
+# what main.py and its modules add on top of them. Fails (exit 1) when that is over
+# --budget-ms or when one of the modules that main.py only imports on first use
+# (the Google client libraries, Flask-Migrate) is imported at startup.
+# tests/test_startup.py runs the same check.
+#
+#   python benchmarks/startup_time.py --runs 5 --budget-ms 150
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+# imported lazily by main.py and the modules it imports at startup
+LAZY_MODULES = (
+    'googleapiclient', 'google_auth_oauthlib', 'google.oauth2', 'google.auth', 'httplib2', 'requests', 'pip._vendor',
+    'flask_migrate', 'alembic',
+)
+CODE = f'import sys; sys.path.insert(0, {os.path.abspath(BACKEND)!r}); import main; main.create_app()'
+# what main.py cannot start without
+FRAMEWORK_CODE = 'import flask, flask_sqlalchemy, sqlalchemy.orm'
+BUDGET_MS = 150
+
+
+def import_times(directory, code=CODE):
+    # [(name, depth, self us, cumulative us)] in the order the imports finished
+    env = dict(os.environ, DATABASE_URI='sqlite://', SECRET_KEY='startup', SESSION_BACKEND='memory')
+    env['CREDENTIALS_STORE_PATH'] = os.path.join(directory, 'credentials.sqlite3')
+    env['GOOGLE_CERTS_CACHE_PATH'] = ''
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=directory, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def total_ms(rows):
+    return sum(cumulative for _, depth, _, cumulative in rows if depth == 0) / 1000
+
+
+def main_ms(rows):
+    return next(cumulative for name, _, _, cumulative in rows if name == 'main') / 1000
+
+
+def measure(runs):
+    # The median run of main, the median time of the framework alone, and the lazy
+    # modules imported at startup
+    with tempfile.TemporaryDirectory() as directory:
+        main_runs = [import_times(directory) for _ in range(runs)]
+        framework = statistics.median(total_ms(import_times(directory, FRAMEWORK_CODE)) for _ in range(runs))
+    totals = [main_ms(rows) for rows in main_runs]
+    rows = main_runs[totals.index(sorted(totals)[len(totals) // 2])]
+    imported = sorted({name for name, _, _, _ in rows if name.startswith(LAZY_MODULES)})
+    return rows, framework, imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='median import time of main over Flask and SQLAlchemy')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    rows, framework, imported = measure(args.runs)
+    median = main_ms(rows)
+    own = median - framework
+    # main's own imports are the rows one level deeper that finished just before it
+    index = next(i for i, row in enumerate(rows) if row[0] == 'main')
+    direct = []
+    for name, depth, _, cumulative in reversed(rows[:index]):
+        if depth <= rows[index][1]:
+            break
+        if depth == rows[index][1] + 1:
+            direct.append((name, cumulative))
+    print(
+        f"import main: median {median:.0f} ms over {args.runs} runs, Flask and SQLAlchemy alone {framework:.0f} ms, "
+        f"the app {own:.0f} ms (budget {args.budget_ms:.0f} ms)"
+    )
+    for name, cumulative in sorted(direct, key=lambda row: -row[1])[:args.top]:
+        print(f"  {cumulative / 1000:7.1f} ms  {name}")
+
+    failed = False
+    if imported:
+        print(f"FAIL: imported at startup: {', '.join(imported)}")
+        failed = True
+    if own > args.budget_ms:
+        print(f"FAIL: over budget by {own - args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,286 @@
+# The regression suite: the main routes through the Flask test client against a
+# seeded SQLite dataset (see dataset.py), reporting requests per second, p50 and
+# p99 latency and SQL statements per request, and failing (exit 1) when a route
+# runs more statements than in benchmarks/baseline.json or gets slower than it by
+# more than --tolerance. Query budgets are strict, so a request running more
+# statements than its route's @max_queries fails the run too, baseline or not.
+#
+#   python -m benchmarks.suite                      # 10k people, compare to the baseline
+#   python -m benchmarks.suite --people 1000000     # generated once, then reused
+#   python -m benchmarks.suite --update-baseline    # after an intended change
+#
+# Requests are logged in through the session, with Google credentials in the
+# credential store so edit_person queues its calendar job; the calendar workers are not started, so
+# no call reaches Google. Each run works on a fresh copy of the generated
+# database, so writes from one run do not leak into the next. Timings depend on
+# the machine: record the baseline on the one that runs the comparison.
+import argparse
+import datetime
+import gc
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from benchmarks import dataset
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+FAKE_CREDENTIALS = {
+    'token': 'benchmark', 'refresh_token': 'benchmark', 'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'benchmark', 'client_secret': 'benchmark', 'scopes': ['https://www.googleapis.com/auth/calendar'],
+}
+# /users renders every row of every table; past this many people it is skipped
+USERS_ROUTE_MAX_PEOPLE = 20000
+
+
+class Scenario:
+    # next_request() gives (method, path, form data) for one request, made outside the timed part
+    def __init__(self, name, status, next_request, max_requests=None, json=False):
+        self.name = name
+        self.status = status
+        self.next_request = next_request
+        # for routes too slow to repeat --requests times
+        self.max_requests = max_requests
+        # the data is sent as a JSON body instead of a form
+        self.json = json
+
+
+def scenarios(app, groups_of, rng, people):
+    from models import db, group_members, Group, Person, PersonCalendarEvent
+    import person_import
+
+    user_id = 1
+    groups = groups_of[user_id]
+    with app.app_context():
+        person_ids = db.session.execute(db.select(Person.person_id).filter_by(user_id=user_id)).scalars().all()
+    added = iter(range(1, 10 ** 9))
+
+    def edit_request():
+        person_id = rng.choice(person_ids)
+        with app.app_context():
+            person = db.session.get(Person, person_id)
+            form = {field: '' if getattr(person, field) is None else str(getattr(person, field)) for field in person_import.PERSON_FIELDS}
+        form['recent_updates'] = f'update {next(added)}'
+        if rng.random() < 0.25:
+            # a calendar field, so a calendar job is queued
+            form['birthday'] = (datetime.date(1960, 1, 1) + datetime.timedelta(days=rng.randrange(20000))).isoformat()
+        return 'POST', f'/edit_person/{person_id}', form
+
+    def delete_people_request():
+        # 50 new people, each in a group and with a birthday event, so the delete cascades
+        # to both and queues the cleanup of their Google events
+        with app.app_context():
+            people = [Person(user_id=user_id, name=f'deleted person {next(added)}') for _ in range(50)]
+            db.session.add_all(people)
+            db.session.flush()
+            db.session.execute(group_members.insert(), [{'person_id': person.person_id, 'group_id': rng.choice(groups)} for person in people])
+            db.session.add_all(
+                PersonCalendarEvent(person_id=person.person_id, kind='birthday', google_event_id=f'event{person.person_id}')
+                for person in people
+            )
+            db.session.commit()
+            return 'POST', '/api/people/delete', {'person_ids': [person.person_id for person in people]}
+
+    def delete_groups_request():
+        # a new group with 200 of the user's people; the delete drops the memberships, the people stay
+        with app.app_context():
+            group = Group(user_id=user_id, group_name=f'deleted group {next(added)}')
+            db.session.add(group)
+            db.session.flush()
+            members = rng.sample(person_ids, min(200, len(person_ids)))
+            db.session.execute(group_members.insert(), [{'person_id': person_id, 'group_id': group.group_id} for person_id in members])
+            db.session.commit()
+            return 'POST', '/api/groups/delete', {'group_ids': [group.group_id]}
+
+    result = [
+        Scenario('base', 200, lambda: ('GET', '/', None)),
+        Scenario('view_group', 200, lambda: ('GET', f'/group/{rng.choice(groups)}', None)),
+        Scenario('add_member', 302, lambda: ('POST', f'/group/{rng.choice(groups)}/add_member', {'name': f'new person {next(added)}'})),
+        Scenario('edit_person', 302, edit_request),
+        Scenario('delete_people', 200, delete_people_request, json=True),
+        Scenario('delete_groups', 200, delete_groups_request, json=True),
+    ]
+    if people <= USERS_ROUTE_MAX_PEOPLE:
+        result.append(Scenario('users', 200, lambda: ('GET', '/users', None), max_requests=20))
+    return result
+
+
+def run_scenario(client, scenario, requests, warmup, rounds):
+    # the median of each number over the rounds, so one noisy stretch does not decide the p99
+    requests = min(requests, scenario.max_requests or requests)
+    warmup = min(warmup, requests)
+    runs = [_run_round(client, scenario, requests, warmup if i == 0 else 0) for i in range(rounds)]
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    for key in ('errors', 'over_budget'):
+        result[key] = sum(run[key] for run in runs)
+    return result
+
+
+def _run_round(client, scenario, requests, warmup):
+    from flask import got_request_exception
+    from query_budget import QueryBudgetExceeded, count_queries
+
+    latencies, statements, errors, over_budget = [], [], 0, []
+
+    def record_over_budget(sender, exception, **extra):
+        # the request itself ends as a 500, the app logs the statements it ran
+        if isinstance(exception, QueryBudgetExceeded):
+            over_budget.append(exception)
+
+    got_request_exception.connect(record_over_budget)
+    # start every round from the same heap, so one route's garbage is not collected in another's p99
+    gc.collect()
+    for i in range(warmup + requests):
+        method, path, data = scenario.next_request()
+        with count_queries() as executed:
+            start = time.perf_counter()
+            response = client.open(path, method=method, **{'json' if scenario.json else 'data': data})
+            response.get_data()
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        statements.append(len(executed))
+        if response.status_code != scenario.status:
+            errors += 1
+    got_request_exception.disconnect(record_over_budget)
+    latencies.sort()
+    return {
+        'requests_per_second': round(len(latencies) / sum(latencies), 1),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+        'queries': round(statistics.mean(statements), 2),
+        'errors': errors,
+        'over_budget': len(over_budget),
+    }
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def budget_failures(results):
+    # [messages] for every route that ran more statements than its @max_queries allows
+    return [
+        f"{name}: {result['over_budget']} requests ran more queries than the route's @max_queries budget"
+        for name, result in results.items()
+        if result['over_budget']
+    ]
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    # [messages] for every route that got worse than its baseline
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['errors']:
+            failures.append(f"{name}: {result['errors']} requests had an unexpected status")
+        # statements per request do not depend on the machine, so any increase counts
+        if result['queries'] > expected['queries'] + 0.05:
+            failures.append(f"{name}: {result['queries']} queries per request, baseline {expected['queries']}")
+        # a few requests make the p99 of fast routes jump by a few milliseconds, hence the slack
+        for key in ('p50_ms', 'p99_ms'):
+            if result[key] > expected[key] * (1 + tolerance) and result[key] - expected[key] > slack_ms:
+                failures.append(f"{name}: {key} {result[key]}, baseline {expected[key]} (+{tolerance:.0%} allowed)")
+    return failures
+
+
+def dataset_key(args):
+    return f'people={args.people},users={args.users},skew={args.skew},seed={args.seed}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--people', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3, help='each route is timed this many times, the median is reported')
+    parser.add_argument('--page-cache', default='off', help='PAGE_CACHE_BACKEND; off measures the database and templates')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown of p50/p99, 0.5 = 50%%')
+    parser.add_argument('--slack-ms', type=float, default=5, help='slowdowns smaller than this are never regressions')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--cache-dir', default=tempfile.gettempdir(), help='where generated datasets are kept')
+    args = parser.parse_args()
+
+    # a new migration means a new dataset
+    from alembic.script import ScriptDirectory
+    revision = ScriptDirectory(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'migrations')).get_current_head()
+    source = os.path.join(args.cache_dir, f'character_sheets_{revision}_{args.people}_{args.users}_{args.skew}_{args.seed}.db')
+    groups_file = source + '.groups.json'
+    if not (os.path.exists(source) and os.path.exists(groups_file)):
+        start = time.perf_counter()
+        groups_of = dataset.create_database(source, args.people, args.users, skew=args.skew, seed=args.seed)
+        with open(groups_file, 'w') as f:
+            json.dump(groups_of, f)
+        print(f"Generated {args.people} people in {time.perf_counter() - start:.1f}s: {source}")
+    with open(groups_file) as f:
+        groups_of = {int(user_id): ids for user_id, ids in json.load(f).items()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'suite.db')
+        shutil.copyfile(source, database)
+        from main import create_app
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+            'SECRET_KEY': 'benchmark',
+            'SESSION_BACKEND': 'memory',
+            'PAGE_CACHE_BACKEND': args.page_cache,
+            'PAGE_CACHE_VERSIONS_PATH': os.path.join(directory, 'page_versions.sqlite3'),
+            'CREDENTIALS_STORE_PATH': os.path.join(directory, 'credentials.sqlite3'),
+            'GOOGLE_CERTS_CACHE_PATH': '',
+            'PASSWORD_HASH_WORKERS': 0,
+            'QUERY_BUDGET_STRICT': True,
+        })
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session.update(user_id=1, username='user1', google_calendar=True)
+        app.extensions['google_credentials'].save(1, FAKE_CREDENTIALS)
+
+        rng = random.Random(args.seed)
+        results = {}
+        print(f"{dataset_key(args)}, {args.rounds} rounds of {args.requests} requests per route")
+        print(f"{'route':<14} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+        for scenario in scenarios(app, groups_of, rng, args.people):
+            result = results[scenario.name] = run_scenario(client, scenario, args.requests, args.warmup, args.rounds)
+            print(
+                f"{scenario.name:<14} {result['requests_per_second']:>8.1f} {result['p50_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['queries']:>8.2f} {result['errors']:>7}"
+            )
+
+    over_budget = budget_failures(results)
+    for failure in over_budget:
+        print(f"OVER BUDGET {failure}")
+    if over_budget:
+        sys.exit(1)
+
+    baselines = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baselines = json.load(f)
+    if args.update_baseline:
+        baselines[dataset_key(args)] = results
+        with open(BASELINE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline for {dataset_key(args)} written to {BASELINE}")
+        sys.exit(0)
+    if dataset_key(args) not in baselines:
+        print(f"No baseline for {dataset_key(args)}; record one with --update-baseline")
+        sys.exit(0)
+    failures = compare(results, baselines[dataset_key(args)], args.tolerance, args.slack_ms)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if not failures:
+        print("No regressions against the baseline")
+    sys.exit(1 if failures else 0)
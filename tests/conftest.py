@@ -0,0 +1,70 @@
+# Apps for the tests, each from create_app() with its database, session store, page
+# versions and credential store in files under tmp_path. Two apps made with the same
+# tmp_path share them, like the workers of `WSGI_PROCESSES=2 python wsgi.py`.
+# calendar is a fake Google Calendar (backend/fake_calendar.py) to sync against.
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    from main import create_app
+    from models import db
+
+    def make(**config):
+        app = create_app({
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+            'SESSION_SQLITE_PATH': str(tmp_path / 'sessions.sqlite3'),
+            'PAGE_CACHE_VERSIONS_PATH': str(tmp_path / 'page_versions.sqlite3'),
+            'CREDENTIALS_STORE_PATH': str(tmp_path / 'credentials.sqlite3'),
+            'GOOGLE_CERTS_CACHE_PATH': '',
+            **config,
+        })
+        with app.app_context():
+            db.create_all()
+        return app
+
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def user(app):
+    # user_id of a user with the password "password"
+    from models import db, User
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com', password=app.extensions['password_hasher'].hash('password'))
+        db.session.add(user)
+        db.session.commit()
+        return user.user_id
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    # A fake_calendar.py server on a free port that calendar_service talks to
+    import calendar_service
+    import fake_calendar
+    server = fake_calendar.make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('GOOGLE_CALENDAR_API_ENDPOINT', f'http://127.0.0.1:{server.server_address[1]}/calendar/v3/')
+    calendar_service.clear_cache()
+    yield server.RequestHandlerClass.calendar
+    server.shutdown()
+    server.server_close()
+    calendar_service.clear_cache()
+
+
+def log_in(client):
+    response = client.post('/login', data={'email': 'ada@example.com', 'password': 'password'})
+    assert response.status_code == 302 and response.headers['Location'].endswith('/base')
@@ -0,0 +1,85 @@
+# backfill_calendar() against fake_calendar.py: running it again, or after it stopped
+# on a failure, never creates an event twice.
+import datetime
+
+from calendar_routes import backfill_calendar
+
+INFO = {'token': 'test', 'refresh_token': 'refresh', 'client_id': 'client', 'client_secret': 'secret', 'token_uri': 'http://127.0.0.1/token'}
+
+
+def add_people(app, user, count):
+    # everyone has a birthday, every other person an anniversary too
+    from models import db, Person
+    with app.app_context():
+        db.session.add_all(
+            Person(
+                user_id=user, name=f'Person {i}', birthday=datetime.date(1990, 1, 1) + datetime.timedelta(days=i),
+                anniversary_title=f'Anniversary {i}' if i % 2 else None,
+                anniversary_date=datetime.date(2015, 1, 1) + datetime.timedelta(days=i) if i % 2 else None,
+            )
+            for i in range(count)
+        )
+        db.session.add(Person(user_id=user, name='No dates'))
+        db.session.commit()
+    app.extensions['google_credentials'].save(user, INFO)
+
+
+def backfill(app, user, **kwargs):
+    with app.app_context():
+        return list(backfill_calendar(user, workers=2, chunk_size=4, **kwargs))
+
+
+def recorded(app):
+    from models import db, PersonCalendarEvent
+    with app.app_context():
+        return sorted(db.session.query(PersonCalendarEvent.person_id, PersonCalendarEvent.kind, PersonCalendarEvent.google_event_id))
+
+
+def test_backfill_pushes_everyone_once(app, user, calendar):
+    add_people(app, user, 10)
+
+    progress = backfill(app, user)
+
+    assert progress[-1]['status'] == 'done'
+    assert (progress[-1]['processed'], progress[-1]['events_created']) == (10, 15)
+    assert len(calendar.events) == 15
+    assert sorted(event['id'] for event in calendar.events.values()) == sorted(row[2] for row in recorded(app))
+
+
+def test_running_it_again_creates_nothing(app, user, calendar):
+    add_people(app, user, 10)
+    backfill(app, user)
+    rows = recorded(app)
+
+    progress = backfill(app, user)
+
+    assert progress[-1]['status'] == 'done'
+    assert progress[-1]['events_created'] == 0
+    assert len(calendar.events) == 15
+    assert recorded(app) == rows
+
+
+def test_resuming_after_a_failure_creates_nothing_twice(app, user, calendar):
+    add_people(app, user, 10)
+    # one event of the second chunk (person_id 5 to 8) fails
+    calendar.fail_when = lambda method, path, body: 500 if b'Person 6' in body else None
+
+    progress = backfill(app, user)
+
+    assert progress[-1]['status'] == 'failed'
+    assert 'Injected failure' in progress[-1]['error']
+    with app.app_context():
+        from models import db, CalendarBackfill
+        checkpoint = db.session.get(CalendarBackfill, user)
+        # only the first chunk is done; the rest of the second one is recorded all the same
+        assert (checkpoint.status, checkpoint.last_person_id) == ('failed', 4)
+    # 'Person 6' is person_id 7
+    assert (7, 'birthday') not in {row[:2] for row in recorded(app)}
+    assert len(recorded(app)) == len(calendar.events) == 14
+
+    calendar.fail_when = None
+    progress = backfill(app, user)
+
+    assert progress[-1]['status'] == 'done'
+    assert len(calendar.events) == 15
+    assert len(recorded(app)) == 15
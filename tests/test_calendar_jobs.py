@@ -0,0 +1,119 @@
+import datetime
+import threading
+import types
+
+import calendar_jobs
+from calendar_jobs import CalendarJobQueue
+
+A = {'birthday': ('Ada', datetime.date(1990, 1, 1))}
+B = {'birthday': ('Ada', datetime.date(1990, 2, 2))}
+NONE = {'birthday': None}
+
+
+def make_queue(ran):
+    from models import db, CalendarJob
+    return CalendarJobQueue(db, CalendarJob, lambda job, payload: ran.append((payload['prev'], payload['new'])))
+
+
+def run_all(queue):
+    while queue.run_once():
+        pass
+
+
+def test_edits_while_a_job_waits_collapse_into_it(app, user):
+    from models import db
+    ran = []
+    queue = make_queue(ran)
+    with app.app_context():
+        queue.enqueue(user, 1, 'events', NONE, A)
+        db.session.commit()
+        queue.enqueue(user, 1, 'events', A, B)
+        db.session.commit()
+        run_all(queue)
+    assert ran == [(NONE, B)]
+
+
+def test_edit_back_to_where_the_waiting_job_started_drops_it(app, user):
+    from models import db
+    ran = []
+    queue = make_queue(ran)
+    with app.app_context():
+        queue.enqueue(user, 1, 'events', NONE, A)
+        db.session.commit()
+        assert queue.enqueue(user, 1, 'events', A, NONE) is None
+        db.session.commit()
+        run_all(queue)
+    assert ran == []
+
+
+def test_job_claimed_while_an_edit_is_enqueued_still_gets_the_edit(app, user, monkeypatch):
+    from models import db
+    ran = []
+    queue = make_queue(ran)
+    with app.app_context():
+        queue.enqueue(user, 1, 'events', NONE, A)
+        db.session.commit()
+
+    load_events = calendar_jobs._load_events
+
+    def worker_runs_the_job_first(data):
+        # between enqueue's SELECT of the waiting job and its UPDATE, a worker claims and runs it
+        monkeypatch.setattr(calendar_jobs, '_load_events', load_events)
+
+        def work():
+            with app.app_context():
+                assert queue.run_once()
+        worker = threading.Thread(target=work)
+        worker.start()
+        worker.join()
+        return load_events(data)
+
+    with app.app_context():
+        monkeypatch.setattr(calendar_jobs, '_load_events', worker_runs_the_job_first)
+        assert queue.enqueue(user, 1, 'events', A, B) is not None
+        db.session.commit()
+        run_all(queue)
+    assert ran == [(NONE, A), (A, B)]
+
+
+def test_jobs_of_a_dead_worker_are_released_while_the_queue_runs(app, user, monkeypatch):
+    from models import db, CalendarJob
+    ran = []
+    queue = make_queue(ran)
+    clock = [1000.0]
+    monkeypatch.setattr(calendar_jobs, 'time', types.SimpleNamespace(monotonic=lambda: clock[0]))
+    with app.app_context():
+        # the queue has been running for a while
+        assert not queue.run_once()
+        # a worker claimed a job and died, a later edit waits behind it
+        queue.enqueue(user, 1, 'events', NONE, A)
+        db.session.commit()
+        job = db.session.query(CalendarJob).one()
+        job.status = calendar_jobs.RUNNING
+        job.locked_at = calendar_jobs._now() - datetime.timedelta(seconds=queue.lease_seconds + 1)
+        db.session.commit()
+        queue.enqueue(user, 1, 'events', A, B)
+        db.session.commit()
+
+        assert not queue.run_once()
+        clock[0] += queue.lease_seconds / 2
+        run_all(queue)
+    assert ran == [(NONE, A), (A, B)]
+
+
+def test_running_jobs_within_their_lease_are_not_released(app, user):
+    from models import db, CalendarJob
+    ran = []
+    queue = make_queue(ran)
+    with app.app_context():
+        queue.enqueue(user, 1, 'events', NONE, A)
+        db.session.commit()
+        job = db.session.query(CalendarJob).one()
+        job.status, job.locked_at = calendar_jobs.RUNNING, calendar_jobs._now()
+        db.session.commit()
+        queue.enqueue(user, 1, 'events', A, B)
+        db.session.commit()
+
+        run_all(queue)
+        assert db.session.query(CalendarJob.status).order_by(CalendarJob.job_id).all() == [('running',), ('pending',)]
+    assert ran == []
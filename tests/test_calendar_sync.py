@@ -0,0 +1,118 @@
+# reconcile_person_events() and delete_events() against fake_calendar.py. Every case
+# fails one call of its batch request: the calls that succeeded must still be recorded.
+import datetime
+
+from google.oauth2.credentials import Credentials
+
+import calendar_service
+from calendar_sync import delete_events, event_body, reconcile_person_events
+
+BIRTHDAY = ("Ada's Birthday", datetime.date(1990, 1, 1))
+ANNIVERSARY = ('Wedding', datetime.date(2015, 6, 1))
+
+
+def service():
+    return calendar_service.get_service(Credentials(token='test'))
+
+
+def fail(method, event_id=None, title=None):
+    # fail_when for the calls with this method on event_id, or with title in their body
+    def fail_when(call_method, path, body):
+        if call_method != method:
+            return None
+        if event_id is not None and path.split('?')[0].endswith(f'/events/{event_id}'):
+            return 500
+        if title is not None and title.encode() in body:
+            return 500
+        return None
+    return fail_when
+
+
+def add_event(calendar, kind, event):
+    stored = calendar.insert('primary', event_body(1, kind, *event))
+    return {'id': stored['id'], 'etag': stored['etag']}
+
+
+def test_create_records_the_event_that_was_inserted(calendar):
+    calendar.fail_when = fail('POST', title='Wedding')
+
+    result = reconcile_person_events(service(), 1, {'birthday': BIRTHDAY, 'anniversary': ANNIVERSARY}, {}, previous={})
+
+    assert list(result.events) == ['birthday']
+    assert result.counts == {'inserted': 1}
+    assert result.error.resp.status == 500
+    assert [event['summary'] for event in calendar.events.values()] == ["Ada's Birthday"]
+
+
+def test_patch_keeps_the_stored_event_whose_patch_failed(calendar):
+    stored = {'birthday': add_event(calendar, 'birthday', BIRTHDAY), 'anniversary': add_event(calendar, 'anniversary', ANNIVERSARY)}
+    calendar.fail_when = fail('PATCH', event_id=stored['anniversary']['id'])
+    desired = {'birthday': (BIRTHDAY[0], datetime.date(1990, 1, 2)), 'anniversary': (ANNIVERSARY[0], datetime.date(2015, 6, 2))}
+
+    result = reconcile_person_events(service(), 1, desired, stored, previous={'birthday': BIRTHDAY, 'anniversary': ANNIVERSARY})
+
+    assert result.counts == {'patched': 1}
+    assert result.error.resp.status == 500
+    assert result.events['birthday']['id'] == stored['birthday']['id']
+    assert result.events['birthday']['etag'] != stored['birthday']['etag']
+    assert result.events['anniversary'] == stored['anniversary']
+    assert calendar.get('primary', stored['birthday']['id'])['start']['date'] == '1990-01-02'
+    assert calendar.get('primary', stored['anniversary']['id'])['start']['date'] == '2015-06-01'
+
+
+def test_patch_of_an_event_deleted_by_hand_inserts_it_again(calendar):
+    stored = {'birthday': add_event(calendar, 'birthday', BIRTHDAY), 'anniversary': add_event(calendar, 'anniversary', ANNIVERSARY)}
+    calendar.delete('primary', stored['birthday']['id'])
+    calendar.fail_when = fail('PATCH', event_id=stored['anniversary']['id'])
+    desired = {'birthday': (BIRTHDAY[0], datetime.date(1990, 1, 2)), 'anniversary': (ANNIVERSARY[0], datetime.date(2015, 6, 2))}
+
+    result = reconcile_person_events(service(), 1, desired, stored, previous={'birthday': BIRTHDAY, 'anniversary': ANNIVERSARY})
+
+    assert result.counts == {'inserted': 1}
+    assert result.error.resp.status == 500
+    assert result.events['birthday']['id'] != stored['birthday']['id']
+    assert calendar.get('primary', result.events['birthday']['id'])['start']['date'] == '1990-01-02'
+
+
+def test_clearing_a_date_deletes_its_event(calendar):
+    stored = {'birthday': add_event(calendar, 'birthday', BIRTHDAY), 'anniversary': add_event(calendar, 'anniversary', ANNIVERSARY)}
+    calendar.fail_when = fail('PATCH', event_id=stored['anniversary']['id'])
+    desired = {'birthday': None, 'anniversary': (ANNIVERSARY[0], datetime.date(2015, 6, 2))}
+
+    result = reconcile_person_events(service(), 1, desired, stored, previous={'birthday': BIRTHDAY, 'anniversary': ANNIVERSARY})
+
+    assert result.counts == {'deleted': 1}
+    assert result.error.resp.status == 500
+    assert result.events == {'anniversary': stored['anniversary']}
+    assert calendar.get('primary', stored['birthday']['id']) is None
+
+
+def test_unchanged_events_are_not_sent(calendar):
+    stored = {'birthday': add_event(calendar, 'birthday', BIRTHDAY)}
+    requests = calendar.requests
+
+    result = reconcile_person_events(service(), 1, {'birthday': BIRTHDAY, 'anniversary': None}, stored, previous={'birthday': BIRTHDAY, 'anniversary': None})
+
+    assert (result.events, result.counts, result.error) == (stored, {}, None)
+    assert calendar.requests == requests
+
+
+def test_delete_events_returns_the_ones_left(calendar):
+    ids = [add_event(calendar, 'birthday', BIRTHDAY)['id'] for _ in range(3)]
+    calendar.fail_when = fail('DELETE', event_id=ids[1])
+
+    failed, error = delete_events(service(), ids + ['gone'])
+
+    # an event that is already gone counts as deleted
+    assert failed == [ids[1]]
+    assert error.resp.status == 500
+    assert list(calendar.events) == [('primary', ids[1])]
+
+
+def test_delete_events_sends_50_calls_per_batch_request(calendar):
+    ids = [add_event(calendar, 'birthday', BIRTHDAY)['id'] for _ in range(120)]
+
+    assert delete_events(service(), ids) == ([], None)
+
+    assert calendar.requests == 3
+    assert calendar.events == {}
@@ -0,0 +1,173 @@
+import datetime
+import os
+import stat
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import calendar_routes
+from calendar_sync import SyncResult
+from conftest import log_in
+from credential_manager import CredentialManager
+from models import db, CalendarJob, Person
+
+INFO = {
+    'token': 'access-token', 'refresh_token': 'refresh-token', 'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'client-id', 'client_secret': 'client-secret', 'scopes': ['https://www.googleapis.com/auth/calendar'],
+}
+
+
+@pytest.fixture
+def person(app, user):
+    with app.app_context():
+        person = Person(user_id=user, name='Alice')
+        db.session.add(person)
+        db.session.commit()
+        return person.person_id
+
+
+def log_in_with_google(app, client, user):
+    log_in(client)
+    with client.session_transaction() as session:
+        session['google_calendar'] = True
+    app.extensions['google_credentials'].save(user, INFO)
+
+
+def test_calendar_jobs_look_up_the_credentials_when_they_run(app, user, person, monkeypatch):
+    client = app.test_client()
+    log_in_with_google(app, client, user)
+    assert client.patch(f'/api/person/{person}', json={'birthday': '1990-04-01'}).status_code == 200
+    with app.app_context():
+        payload = db.session.query(CalendarJob.payload).scalar()
+    assert 'token' not in payload and 'secret' not in payload
+
+    used = []
+
+    def service(credentials):
+        used.append(credentials)
+        raise RuntimeError('offline')
+    monkeypatch.setattr(calendar_routes, 'get_google_calendar_service', service)
+    with app.app_context():
+        assert app.extensions['calendar_queue'].run_once()
+    assert [(credentials.refresh_token, credentials.client_secret) for credentials in used] == [('refresh-token', 'client-secret')]
+
+
+def test_token_stores_are_private(app):
+    for name in ('CREDENTIALS_STORE_PATH', 'SESSION_SQLITE_PATH'):
+        assert stat.S_IMODE(os.stat(app.config[name]).st_mode) == 0o600
+
+
+def test_calendar_jobs_queued_before_logout_still_run(app, user, person, monkeypatch):
+    client = app.test_client()
+    log_in_with_google(app, client, user)
+    assert client.patch(f'/api/person/{person}', json={'birthday': '1990-04-01'}).status_code == 200
+    client.get('/logout')
+
+    used = []
+    monkeypatch.setattr(calendar_routes, 'get_google_calendar_service', used.append)
+    monkeypatch.setattr('calendar_sync.reconcile_person_events', lambda *args, **kwargs: SyncResult({}, Counter(), None))
+    with app.app_context():
+        assert app.extensions['calendar_queue'].run_once()
+        assert db.session.query(CalendarJob).count() == 0
+    assert [credentials.refresh_token for credentials in used] == ['refresh-token']
+
+
+def test_revoked_grant_is_forgotten(app, user, monkeypatch):
+    from google.auth.exceptions import RefreshError
+    from google.oauth2.credentials import Credentials
+    manager = app.extensions['google_credentials']
+    manager.save(user, dict(INFO, expiry='2000-01-01T00:00:00'))
+
+    def refresh(self, request):
+        raise RefreshError('invalid_grant: Token has been expired or revoked.', {'error': 'invalid_grant'})
+    monkeypatch.setattr(Credentials, 'refresh', refresh)
+    with pytest.raises(RefreshError):
+        manager.get(user)
+
+    assert manager.get(user) is None
+    assert manager._connect().execute('SELECT count(*) FROM credentials').fetchone() == (0,)
+
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    # Credentials.refresh() without the token endpoint: a new token valid for an hour
+    from google.oauth2.credentials import Credentials
+    calls = []
+
+    def refresh(self, request):
+        calls.append(self.token)
+        time.sleep(0.2)
+        self.token = f'access-token-{len(calls)}'
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    monkeypatch.setattr(Credentials, 'refresh', refresh)
+    return calls
+
+
+def expiring_in(seconds):
+    return dict(INFO, expiry=(datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds)).isoformat())
+
+
+def test_processes_sharing_a_store_refresh_once(app, user, refreshes):
+    # two managers on one file, like two server processes
+    path = app.config['CREDENTIALS_STORE_PATH']
+    managers = [CredentialManager(path), CredentialManager(path)]
+    managers[0].save(user, expiring_in(-60))
+    start = threading.Barrier(len(managers))
+    tokens = []
+
+    def get(manager):
+        start.wait()
+        tokens.append(manager.get(user).token)
+    threads = [threading.Thread(target=get, args=(manager,)) for manager in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert refreshes == ['access-token']
+    assert tokens == ['access-token-1', 'access-token-1']
+    assert managers[0]._connect().execute('SELECT refreshing_until FROM credentials').fetchone() == (None,)
+
+
+def test_tokens_inside_the_margin_are_refreshed_ahead(app, user, refreshes):
+    manager = CredentialManager(app.config['CREDENTIALS_STORE_PATH'], refresh_margin=300)
+    manager.save(user, expiring_in(3600))
+    manager.get(user)
+    assert manager.refresh_due() == 0
+
+    manager.save(user, expiring_in(100))
+    # still valid, so handed out as it is; the refresh happens in the background
+    assert manager.get(user).token == 'access-token'
+    assert manager.refresh_due() == 1
+
+    assert refreshes == ['access-token']
+    assert manager.get(user).token == 'access-token-1'
+    assert CredentialManager(manager.path).get(user).token == 'access-token-1'
+
+
+def test_a_refresh_does_not_bring_back_a_forgotten_grant(app, user, refreshes):
+    path = app.config['CREDENTIALS_STORE_PATH']
+    manager = CredentialManager(path, refresh_margin=300)
+    manager.save(user, expiring_in(100))
+    manager.get(user)
+
+    # logged out of Google in another process
+    CredentialManager(path).forget(user)
+
+    assert manager.refresh_due() == 0
+    assert refreshes == []
+    assert manager.get(user) is None
+    assert manager._connect().execute('SELECT count(*) FROM credentials').fetchone() == (0,)
+
+
+def test_a_refresh_past_a_stuck_lease_leaves_it_alone(app, user, refreshes):
+    manager = CredentialManager(app.config['CREDENTIALS_STORE_PATH'], lease_seconds=0.3)
+    manager.save(user, expiring_in(-60))
+    until = time.time() + 3600
+    with manager._connect() as connection:
+        connection.execute('UPDATE credentials SET refreshing_until = ?', (until,))
+
+    assert manager.get(user).token == 'access-token-1'
+    assert manager._connect().execute('SELECT refreshing_until FROM credentials').fetchone() == (until,)
@@ -0,0 +1,67 @@
+import json
+
+from conftest import log_in
+
+
+def add_people(app, user):
+    # Alice and Bob in both groups, each with a birthday event in Google Calendar
+    from models import db, group_members, Group, Person, PersonCalendarEvent
+    with app.app_context():
+        db.session.add_all([Group(user_id=user, group_name='Friends'), Group(user_id=user, group_name='Work')])
+        db.session.add_all([Person(user_id=user, name='Alice'), Person(user_id=user, name='Bob')])
+        db.session.flush()
+        db.session.execute(group_members.insert(), [
+            {'person_id': person_id, 'group_id': group_id} for person_id in (1, 2) for group_id in (1, 2)
+        ])
+        db.session.add_all(
+            PersonCalendarEvent(person_id=person_id, kind='birthday', google_event_id=f'event{person_id}')
+            for person_id in (1, 2)
+        )
+        db.session.commit()
+
+
+def test_bulk_delete_cascades_to_memberships_and_event_rows(app, user):
+    from models import db, group_members, Group, Person, PersonCalendarEvent
+    add_people(app, user)
+    client = app.test_client()
+    log_in(client)
+
+    assert client.post('/api/people/delete', json={'person_ids': [1, 3]}).get_json() == {'deleted': 1}
+
+    with app.app_context():
+        assert db.session.query(Person.name).all() == [('Bob',)]
+        assert sorted(db.session.query(group_members.c.person_id, group_members.c.group_id)) == [(2, 1), (2, 2)]
+        assert db.session.query(PersonCalendarEvent.person_id).all() == [(2,)]
+
+    assert client.post('/api/groups/delete', json={'group_ids': [1, 2]}).get_json() == {'deleted': 2}
+
+    with app.app_context():
+        assert db.session.query(Group).count() == 0
+        assert db.session.query(group_members).count() == 0
+        assert db.session.query(Person.name).all() == [('Bob',)]
+
+
+def test_deleting_from_a_password_session_cleans_up_the_google_events(app, user):
+    from models import db, CalendarJob
+    add_people(app, user)
+    app.extensions['google_credentials'].save(user, {'token': 'test'})
+    client = app.test_client()
+    log_in(client)
+
+    assert client.post('/api/people/delete', json={'person_ids': [1, 2]}).get_json() == {'deleted': 2}
+
+    with app.app_context():
+        job = db.session.query(CalendarJob).one()
+    assert (job.kind, sorted(json.loads(job.payload)['event_ids'])) == ('cleanup', ['event1', 'event2'])
+
+
+def test_no_cleanup_is_queued_without_a_stored_grant(app, user):
+    from models import db, CalendarJob
+    add_people(app, user)
+    client = app.test_client()
+    log_in(client)
+
+    assert client.post('/api/people/delete', json={'person_ids': [1]}).get_json() == {'deleted': 1}
+
+    with app.app_context():
+        assert db.session.query(CalendarJob).count() == 0
@@ -0,0 +1,46 @@
+# The hot lookups read through their index on SQLite; EXPLAIN QUERY PLAN names it.
+# benchmarks/explain_indexes.py runs the same check by hand, against MySQL too.
+import datetime
+
+import pytest
+
+import upcoming
+
+
+def hot_queries():
+    from models import group_members, Group, Person
+    # name: (statement, the indexes its plan must use)
+    return {
+        'add_member: person by name': (Person.query.filter_by(name='Ada', user_id=1).statement, {'ix_People_user_id_name'}),
+        'base: groups of a user': (
+            Group.for_user(1).filter(Group.group_id > 0).order_by(Group.group_id).limit(101).statement,
+            {'ix_Groups_user_id_group_id'},
+        ),
+        'view_group: members of a group': (
+            Person.members_of(1).filter(group_members.c.person_id > 0).order_by(group_members.c.person_id).limit(101).statement,
+            {'ix_GroupMembers_group_id_person_id'},
+        ),
+        # a window that runs past New Year, two ranges per kind of date
+        'calendar: upcoming dates': (
+            upcoming.upcoming_query(Person, 1, datetime.date(2024, 12, 20), 30),
+            {'ix_People_user_id_birthday_day', 'ix_People_user_id_anniversary_day'},
+        ),
+    }
+
+
+def plan(statement):
+    from models import db
+    sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+@pytest.mark.parametrize('name', [
+    'add_member: person by name', 'base: groups of a user', 'view_group: members of a group', 'calendar: upcoming dates',
+])
+def test_hot_queries_use_their_indexes(app, name):
+    with app.app_context():
+        statement, indexes = hot_queries()[name]
+        lines = plan(statement)
+    used = {word for line in lines for word in line.split() if word.startswith('ix_')}
+    assert indexes <= used, f"{name} does not use {sorted(indexes - used)}:\n" + '\n'.join(lines)
+    assert not [line for line in lines if line.startswith('SCAN') and 'USING' not in line], f"{name} scans:\n" + '\n'.join(lines)
@@ -0,0 +1,18 @@
+import logging
+
+
+def run_query(app):
+    from models import db
+    with app.app_context():
+        db.session.execute(db.text('SELECT 1'))
+
+
+def test_slow_query_threshold_is_per_app(make_app, caplog):
+    logging_app = make_app(METRICS_SLOW_QUERY_MS='0')
+    quiet_app = make_app()
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='metrics'):
+        run_query(quiet_app)
+        assert 'Slow query' not in caplog.text
+        run_query(logging_app)
+        assert 'Slow query' in caplog.text
@@ -0,0 +1,124 @@
+# PasswordHasher and the login route around it: old hashes and plain text passwords are
+# replaced at the next login, and accounts without a password never match.
+import pytest
+
+import passwords
+from passwords import PasswordHasher, UNUSABLE
+
+# cheap settings, the default scrypt cost makes every hash take ~70 ms
+OLD_METHOD = 'pbkdf2:sha256:1000'
+METHOD = 'scrypt:1024:8:1'
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(method=METHOD, workers=0)
+
+
+def stored_password(app, user):
+    from models import db, User
+    with app.app_context():
+        return db.session.get(User, user).password
+
+
+def set_password(app, user, password):
+    from models import db, User
+    with app.app_context():
+        db.session.get(User, user).password = password
+        db.session.commit()
+
+
+def log_in(client, password):
+    response = client.post('/login', data={'email': 'ada@example.com', 'password': password})
+    assert response.status_code == 302
+    return response.headers['Location'].endswith('/base')
+
+
+def test_a_current_hash_is_kept(hasher):
+    stored = hasher.hash('password')
+
+    assert stored.startswith(METHOD + '$')
+    assert hasher.verify(stored, 'password') == (True, None)
+    assert hasher.verify(stored, 'wrong') == (False, None)
+
+
+def test_a_hash_with_other_settings_is_replaced(hasher):
+    stored = PasswordHasher(method=OLD_METHOD, workers=0).hash('password')
+
+    matches, new_hash = hasher.verify(stored, 'password')
+
+    assert matches and new_hash.startswith(METHOD + '$')
+    assert hasher.verify(new_hash, 'password') == (True, None)
+    # a wrong password replaces nothing
+    assert hasher.verify(stored, 'wrong') == (False, None)
+
+
+def test_a_plain_text_password_is_replaced_with_a_hash(hasher):
+    matches, new_hash = hasher.verify('password', 'password')
+
+    assert matches and new_hash.startswith(METHOD + '$')
+    assert hasher.verify('password', 'Password') == (False, None)
+    assert hasher.verify('password', 'password1') == (False, None)
+
+
+@pytest.mark.parametrize('password', ['!', '', 'password'])
+def test_accounts_without_a_password_match_nothing(hasher, password):
+    assert hasher.verify(UNUSABLE, password) == (False, None)
+    assert hasher.verify(None, password) == (False, None)
+
+
+def test_unknown_users_check_a_dummy_hash(hasher, monkeypatch):
+    # so an unknown email or a Google account takes as long to turn away as a wrong password
+    checked = []
+
+    def check_password_hash(stored, password):
+        checked.append(stored)
+        return real_check(stored, password)
+
+    real_check = passwords.check_password_hash
+    monkeypatch.setattr(passwords, 'check_password_hash', check_password_hash)
+
+    hasher.verify(None, 'password')
+    hasher.verify(UNUSABLE, 'password')
+
+    assert len(checked) == 2
+    # made once, with the current settings
+    assert checked[0] == checked[1] and checked[0].startswith(METHOD + '$')
+
+
+def test_login_replaces_an_old_hash(make_app, user):
+    app = make_app(PASSWORD_HASH_METHOD=METHOD)
+    set_password(app, user, PasswordHasher(method=OLD_METHOD, workers=0).hash('password'))
+    client = app.test_client()
+
+    assert log_in(client, 'password')
+
+    stored = stored_password(app, user)
+    assert stored.startswith(METHOD + '$')
+    assert log_in(app.test_client(), 'password')
+    assert stored_password(app, user) == stored
+
+
+def test_login_hashes_a_plain_text_password(app, user):
+    set_password(app, user, 'password')
+
+    assert not log_in(app.test_client(), 'wrong')
+    assert stored_password(app, user) == 'password'
+
+    assert log_in(app.test_client(), 'password')
+    assert stored_password(app, user).startswith(passwords.DEFAULT_METHOD + '$')
+    assert log_in(app.test_client(), 'password')
+
+
+def test_google_accounts_cannot_log_in_with_a_password(app, user):
+    set_password(app, user, UNUSABLE)
+
+    assert not log_in(app.test_client(), UNUSABLE)
+    assert not log_in(app.test_client(), '')
+    assert stored_password(app, user) == UNUSABLE
+
+
+def test_unknown_emails_are_turned_away(app, user):
+    response = app.test_client().post('/login', data={'email': 'bob@example.com', 'password': 'password'})
+
+    assert response.status_code == 302 and response.headers['Location'].endswith('/login')
@@ -0,0 +1,142 @@
+import datetime
+import io
+import json
+
+import pytest
+
+import person_import
+from conftest import log_in
+
+
+def import_csv(client, group_id, text):
+    response = client.post(f'/group/{group_id}/import?format=csv', data=text, content_type='text/csv')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def make_group(app, user):
+    from models import db, Group
+    with app.app_context():
+        group = Group(user_id=user, group_name='Friends')
+        db.session.add(group)
+        db.session.commit()
+        return group.group_id
+
+
+def test_blank_cells_keep_the_stored_values(app, user):
+    from models import db, Person
+    group_id = make_group(app, user)
+    client = app.test_client()
+    log_in(client)
+    import_csv(client, group_id, 'name,birthday,likes\nAlice,1990-04-01,tea\n')
+
+    summary = import_csv(client, group_id, 'name,birthday,likes\nAlice,,coffee\nBob,,\n')
+
+    assert (summary['created'], summary['updated']) == (1, 1)
+    with app.app_context():
+        alice = db.session.query(Person).filter_by(name='Alice').one()
+        assert (alice.birthday, alice.birthday_day, alice.likes) == (datetime.date(1990, 4, 1), 401, 'coffee')
+
+
+def test_reimporting_the_same_file_updates_nothing(app, user):
+    group_id = make_group(app, user)
+    client = app.test_client()
+    log_in(client)
+    text = 'name,birthday,likes\nAlice,1990-04-01,tea\nBob,,coffee\n'
+    import_csv(client, group_id, text)
+
+    summary = import_csv(client, group_id, text)
+    assert (summary['created'], summary['updated'], summary['in_group']) == (0, 0, 2)
+
+    summary = import_csv(client, group_id, 'name,birthday,likes\nAlice,1990-04-01,cake\nBob,,coffee\n')
+    assert (summary['created'], summary['updated']) == (0, 1)
+
+
+def test_calendar_changes_are_queued(app, user):
+    from models import db, CalendarJob, Person
+    group_id = make_group(app, user)
+    client = app.test_client()
+    log_in(client)
+    import_csv(client, group_id, 'name,birthday,likes\nAlice,1990-04-01,tea\n')
+    # a password session; the calendar is synced because the store has the user's grant
+    app.extensions['google_credentials'].save(user, {'token': 'test'})
+
+    import_csv(client, group_id, 'name,birthday,likes\nAlice,1990-04-02,\nBob,,tea\nCarol,1991-05-05,\n')
+
+    with app.app_context():
+        names = dict(db.session.query(Person.person_id, Person.name))
+        jobs = {names[job.person_id]: (job.action, json.loads(job.payload)) for job in db.session.query(CalendarJob)}
+    assert sorted(jobs) == ['Alice', 'Carol']
+    action, payload = jobs['Alice']
+    assert action == 'update'
+    assert payload['prev']['birthday'] == {'title': "Alice's Birthday", 'date': '1990-04-01'}
+    assert payload['new']['birthday'] == {'title': "Alice's Birthday", 'date': '1990-04-02'}
+    assert jobs['Carol'][0] == 'create'
+
+
+def test_edits_to_people_with_waiting_jobs_collapse_into_them(app, user):
+    from models import db, CalendarJob, Person
+    group_id = make_group(app, user)
+    client = app.test_client()
+    log_in(client)
+    app.extensions['google_credentials'].save(user, {'token': 'test'})
+    import_csv(client, group_id, 'name,birthday\nAlice,1990-04-01\nBob,1991-05-05\n')
+
+    # before their jobs ran, Alice's birthday moves and Bob gets an anniversary
+    import_csv(client, group_id, 'name,birthday,anniversary_title,anniversary_date\nAlice,1990-04-02,,\nBob,,Met,2010-01-01\nCarol,1992-06-06,,\n')
+
+    with app.app_context():
+        names = dict(db.session.query(Person.person_id, Person.name))
+        jobs = [(names[job.person_id], job.action, json.loads(job.payload)) for job in db.session.query(CalendarJob)]
+    assert sorted((name, action) for name, action, _ in jobs) == [('Alice', 'create'), ('Bob', 'create'), ('Carol', 'create')]
+    payloads = {name: payload for name, _, payload in jobs}
+    assert payloads['Alice']['new']['birthday'] == {'title': "Alice's Birthday", 'date': '1990-04-02'}
+    assert payloads['Bob']['new'] == {'birthday': {'title': "Bob's Birthday", 'date': '1991-05-05'}, 'anniversary': {'title': 'Met', 'date': '2010-01-01'}}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64 * 1024])
+def test_json_array_is_read_element_by_element(chunk_size):
+    text = ' [ {"name": "Alice"} ,\n{"name": "Bob", "likes": "[,]"} ] \n'
+    assert list(person_import.iter_json_array(io.StringIO(text), chunk_size)) == [
+        {'name': 'Alice'}, {'name': 'Bob', 'likes': '[,]'},
+    ]
+    assert list(person_import.iter_json_array(io.StringIO('[]'), chunk_size)) == []
+
+
+@pytest.mark.parametrize('text', [
+    '[{"name": "Alice"}{"name": "Bob"}]',
+    '[{"name": "Alice"},,{"name": "Bob"}]',
+    '[,{"name": "Alice"}]',
+    '[{"name": "Alice"},]',
+    '[{"name": "Alice"}] x',
+    '[{"name": "Alice"}][]',
+    '[{"name": "Alice"}',
+    '{"name": "Alice"}',
+    '["Alice"]',
+    '',
+])
+@pytest.mark.parametrize('chunk_size', [1, 64 * 1024])
+def test_malformed_json_arrays_are_rejected_like_json_loads(text, chunk_size):
+    with pytest.raises(ValueError):
+        json_loads_people(text)
+    with pytest.raises(person_import.InvalidImport):
+        list(person_import.iter_json_array(io.StringIO(text), chunk_size))
+
+
+def json_loads_people(text):
+    people = json.loads(text)
+    if not isinstance(people, list) or not all(isinstance(person, dict) for person in people):
+        raise ValueError("not an array of objects")
+    return people
+
+
+@pytest.mark.parametrize('body', [b'\xff\xfen\x00a\x00m\x00e\x00\n\x00', 'name,likes\nJos\xe9,caf\xe9\n'.encode('latin-1')])
+def test_files_that_are_not_utf8_are_rejected(app, user, body):
+    group_id = make_group(app, user)
+    client = app.test_client()
+    log_in(client)
+
+    response = client.post(f'/group/{group_id}/import?format=csv', data=body, content_type='text/csv')
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == ['file is not UTF-8 text']
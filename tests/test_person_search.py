@@ -0,0 +1,121 @@
+from sqlalchemy.dialects import postgresql
+
+import person_search
+from conftest import log_in
+
+
+def add_people(app, user):
+    from models import db, Person
+    with app.app_context():
+        db.session.add_all([
+            Person(user_id=user, name='Grace', likes='green_tea and crosswords'),
+            Person(user_id=user, name='Alan', likes='greentea'),
+        ])
+        db.session.commit()
+
+
+def test_like_search_needs_every_term_and_takes_underscores_literally(app, user):
+    from models import db
+    add_people(app, user)
+    with app.app_context():
+        assert [row['name'] for row in person_search._search_like(db.session, user, ['cross', 'green_'], 10)] == ['Grace']
+        assert [row['name'] for row in person_search._search_like(db.session, user, ['green'], 10)] == ['Alan', 'Grace']
+        assert person_search._search_like(db.session, user + 1, ['green'], 10) == []
+
+
+def test_postgresql_search_matches_with_a_tsquery():
+    statements = []
+
+    class Session:
+        def execute(self, statement):
+            statements.append(statement)
+            return []
+    person_search._search_postgresql(Session(), 1, ['green', 'te'], 10)
+    compiled = statements[0].compile(dialect=postgresql.dialect())
+    assert "to_tsvector(%(to_tsvector_1)s, concat_ws(%(concat_ws_1)s, \"People\".name," in str(compiled)
+    assert "@@ to_tsquery(%(to_tsquery_1)s, %(to_tsquery_2)s)" in str(compiled)
+    assert compiled.params['to_tsquery_2'] == 'green & te:*'
+
+
+# /api/search on SQLite: the FTS5 index that the People triggers keep current
+
+
+def search(client, query):
+    response = client.get('/api/search', query_string={'q': query})
+    assert response.status_code == 200
+    return [(item['name'], item['snippet']) for item in response.get_json()['items']]
+
+
+def make_person(app, client, user, name):
+    from models import db, Group, Person
+    with app.app_context():
+        group = Group(user_id=user, group_name='Friends')
+        db.session.add(group)
+        db.session.commit()
+        group_id = group.group_id
+    assert client.post(f'/group/{group_id}/add_member', data={'name': name}).status_code == 302
+    with app.app_context():
+        return db.session.query(Person.person_id).filter_by(name=name).scalar()
+
+
+def test_new_people_are_found(app, user):
+    client = app.test_client()
+    log_in(client)
+    make_person(app, client, user, 'Grace Hopper')
+
+    assert search(client, 'grace') == [('Grace Hopper', '<mark>Grace</mark> Hopper')]
+    # the last term is a prefix, while typing
+    assert search(client, 'hop') == [('Grace Hopper', 'Grace <mark>Hopper</mark>')]
+    assert search(client, 'ada') == []
+
+
+def test_edits_change_the_hits(app, user):
+    client = app.test_client()
+    log_in(client)
+    person_id = make_person(app, client, user, 'Grace')
+
+    assert client.patch(f'/api/person/{person_id}', json={'likes': 'green tea and crosswords'}).status_code == 200
+    assert search(client, 'crossword') == [('Grace', 'green tea and <mark>crosswords</mark>')]
+
+    response = client.post(f'/edit_person/{person_id}', data={'name': 'Grace', 'likes': 'chess'})
+    assert response.status_code == 302
+    assert search(client, 'crossword') == []
+    assert search(client, 'chess') == [('Grace', '<mark>chess</mark>')]
+
+
+def test_deleted_people_are_not_found(app, user):
+    client = app.test_client()
+    log_in(client)
+    person_id = make_person(app, client, user, 'Grace')
+
+    assert client.post('/api/people/delete', json={'person_ids': [person_id]}).get_json() == {'deleted': 1}
+    assert search(client, 'grace') == []
+
+
+def test_names_rank_above_notes_and_other_users_are_not_searched(app, user):
+    from models import db, Person, User
+    client = app.test_client()
+    log_in(client)
+    with app.app_context():
+        other = User(username='bob', email='bob@example.com', password='!')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add_all([
+            Person(user_id=user, name='Alan', likes='tea with Grace'),
+            Person(user_id=user, name='Grace'),
+            Person(user_id=other.user_id, name='Grace'),
+        ])
+        db.session.commit()
+
+    assert [name for name, _ in search(client, 'grace')] == ['Grace', 'Alan']
+
+
+def test_snippets_are_escaped(app, user):
+    client = app.test_client()
+    log_in(client)
+    person_id = make_person(app, client, user, 'Mallory')
+    assert client.patch(f'/api/person/{person_id}', json={'likes': '<script>alert(1)</script>'}).status_code == 200
+
+    assert search(client, 'script') == [
+        ('Mallory', '&lt;<mark>script</mark>&gt;alert(1)&lt;/<mark>script</mark>&gt;'),
+    ]
@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+
+from conftest import log_in
+from query_budget import QueryBudgetExceeded, assert_max_queries, max_queries
+
+
+def add_route(app, budget, queries):
+    from models import db
+
+    @max_queries(budget)
+    def view():
+        for _ in range(queries):
+            db.session.execute(db.text('SELECT 1'))
+        return 'ok'
+
+    app.add_url_rule('/budget', 'budget', view)
+
+
+def test_route_over_budget_raises_under_testing(app):
+    add_route(app, budget=1, queries=2)
+    with pytest.raises(QueryBudgetExceeded, match='budget ran 2 queries, its budget is 1'):
+        app.test_client().get('/budget')
+
+
+def test_route_over_budget_is_a_500_when_exceptions_are_handled(make_app, caplog):
+    app = make_app(PROPAGATE_EXCEPTIONS=False)
+    add_route(app, budget=1, queries=2)
+    assert app.test_client().get('/budget').status_code == 500
+    assert [record.exc_info[0] for record in caplog.records if record.exc_info] == [QueryBudgetExceeded]
+
+
+def test_route_within_budget_passes(app):
+    add_route(app, budget=2, queries=2)
+    assert app.test_client().get('/budget').status_code == 200
+
+
+def test_route_over_budget_only_logs_when_not_strict(make_app, caplog):
+    app = make_app(QUERY_BUDGET_STRICT=False)
+    add_route(app, budget=1, queries=3)
+    with caplog.at_level(logging.WARNING, logger='query_budget'):
+        assert app.test_client().get('/budget').status_code == 200
+    assert 'budget ran 3 queries, its budget is 1' in caplog.text
+
+
+def test_assert_max_queries(app):
+    from models import db
+    with app.app_context():
+        with assert_max_queries(1):
+            db.session.execute(db.text('SELECT 1'))
+        with pytest.raises(QueryBudgetExceeded, match='2 queries, expected at most 1'):
+            with assert_max_queries(1):
+                db.session.execute(db.text('SELECT 1'))
+                db.session.execute(db.text('SELECT 2'))
+
+
+def test_pages_stay_within_their_budgets_as_the_data_grows(app, user):
+    from models import db, group_members, Group, Person
+    with app.app_context():
+        db.session.add(Group(user_id=user, group_name='friends'))
+        db.session.add_all(Person(user_id=user, name=f'person {i}') for i in range(600))
+        db.session.flush()
+        db.session.execute(group_members.insert(), [{'person_id': i, 'group_id': 1} for i in range(1, 601)])
+        db.session.commit()
+    client = app.test_client()
+    log_in(client)
+    # strict under testing, so a route over its budget raises here
+    for path in ('/', '/group/1', '/api/groups', '/api/group/1/members', '/person/1', '/calendar', '/users'):
+        assert client.get(path).status_code == 200, path
@@ -0,0 +1,28 @@
+from conftest import log_in
+
+
+def session_cookie(client):
+    return client.get_cookie('session').value
+
+
+def test_logout_in_one_process_ends_the_session_in_another(make_app, app, user):
+    other = make_app()
+    client = app.test_client()
+    log_in(client)
+    other_client = other.test_client()
+    other_client.set_cookie('session', session_cookie(client))
+    # read once, so the other app has the session in its cache
+    assert other_client.get('/check_session').get_data(as_text=True).startswith('Session is active. User ID: 1')
+
+    client.get('/logout')
+
+    assert other_client.get('/check_session').get_data(as_text=True) == 'User is not logged in'
+
+
+def test_cache_serves_sessions_nobody_changed(app, user):
+    client = app.test_client()
+    log_in(client)
+    store = app.session_interface.store
+    sid = session_cookie(client)
+    client.get('/check_session')
+    assert store.cache.get(sid) is not None
@@ -0,0 +1,23 @@
+# benchmarks/startup_time.py as a test: the app's own share of a cold start stays
+# within budget and the modules main.py imports on first use stay unimported.
+# Also what create_app() refuses to start with.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks import startup_time
+
+
+def test_cold_start_stays_within_budget():
+    rows, framework, imported = startup_time.measure(runs=3)
+    assert imported == []
+    assert startup_time.main_ms(rows) - framework <= startup_time.BUDGET_MS
+
+
+def test_unsupported_databases_fail_at_startup():
+    from main import create_app
+    with pytest.raises(RuntimeError, match='Unsupported database mssql, use one of: mysql, sqlite, postgresql'):
+        create_app({'SQLALCHEMY_DATABASE_URI': 'mssql+pyodbc://user:pw@host/db'})
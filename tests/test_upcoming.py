@@ -0,0 +1,86 @@
+import datetime
+import multiprocessing
+
+import pytest
+
+import upcoming
+from conftest import log_in
+
+D = datetime.date
+
+
+def test_edit_in_another_process_shows_on_the_calendar(make_app, app, user):
+    from models import db, Person
+    soon = datetime.date.today() + datetime.timedelta(days=3)
+    later = datetime.date.today() + datetime.timedelta(days=100)
+    with app.app_context():
+        db.session.add(Person(user_id=user, name='Grace', birthday=later.replace(year=1992)))
+        db.session.commit()
+    client = app.test_client()
+    log_in(client)
+    cookie = client.get_cookie('session').value
+    # cached here
+    assert b'Grace' not in client.get('/calendar?days=7').data
+
+    def edit():
+        # a worker of its own, with the same database, sessions and page versions
+        other_client = make_app().test_client()
+        other_client.set_cookie('session', cookie)
+        response = other_client.patch('/api/person/1', json={'birthday': soon.replace(year=1992).isoformat()})
+        assert response.status_code == 200
+
+    worker = multiprocessing.get_context('fork').Process(target=edit)
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+
+    assert b'Grace' in client.get('/calendar?days=7').data
+
+
+@pytest.mark.parametrize('start, days, ranges', [
+    (D(2025, 4, 1), 7, [(401, 408)]),
+    # past New Year: to the end of December, then from January 1st
+    (D(2025, 12, 28), 7, [(1228, 1231), (101, 104)]),
+    (D(2025, 12, 31), 1, [(1231, 1231), (101, 101)]),
+    # only today
+    (D(2025, 4, 1), 0, [(401, 401)]),
+    (D(2025, 12, 31), 0, [(1231, 1231)]),
+    # February 29th birthdays are on the 28th in other years...
+    (D(2025, 2, 20), 8, [(220, 229)]),
+    (D(2025, 2, 28), 0, [(228, 229)]),
+    # ...but not in leap years, where the 29th is a day of its own
+    (D(2028, 2, 20), 8, [(220, 228)]),
+    (D(2028, 2, 20), 9, [(220, 229)]),
+    (D(2025, 1, 1), 366, [(101, 1231)]),
+])
+def test_month_day_ranges(start, days, ranges):
+    assert upcoming.month_day_ranges(start, days) == ranges
+
+
+@pytest.mark.parametrize('date, start, occurrence', [
+    (D(1990, 4, 1), D(2025, 4, 1), D(2025, 4, 1)),
+    (D(1990, 1, 2), D(2025, 12, 28), D(2026, 1, 2)),
+    (D(1992, 2, 29), D(2025, 2, 20), D(2025, 2, 28)),
+    (D(1992, 2, 29), D(2025, 3, 1), D(2026, 2, 28)),
+    (D(1992, 2, 29), D(2028, 2, 20), D(2028, 2, 29)),
+])
+def test_next_occurrence(date, start, occurrence):
+    assert upcoming.next_occurrence(date, start) == occurrence
+
+
+def test_upcoming_events_across_new_year(app, user):
+    from models import db, Person
+    with app.app_context():
+        db.session.add_all([
+            Person(user_id=user, name='Grace', birthday=D(1990, 1, 2)),
+            Person(user_id=user, name='Alan', anniversary_title='Wedding', anniversary_date=D(2015, 12, 30)),
+            Person(user_id=user, name='Ada', birthday=D(1990, 1, 5)),
+        ])
+        db.session.commit()
+
+        events = upcoming.upcoming_events(db.session, Person, user, D(2025, 12, 28), 7)
+
+    assert [(event['name'], event['title'], event['date'], event['days_away'], event['years']) for event in events] == [
+        ('Alan', 'Wedding', D(2025, 12, 30), 2, 10),
+        ('Grace', 'Birthday', D(2026, 1, 2), 5, 36),
+    ]